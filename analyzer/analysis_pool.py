@@ -0,0 +1,169 @@
+"""
+Analyze cached log files on a pool of processes
+
+Parsing a log is CPU bound and holds the GIL, so with more than one process the analyses are
+run in worker processes. Only the cached log path goes to a worker, and only the small json
+summary of the analyzer comes back.
+"""
+import concurrent.futures
+import contextlib
+import json
+import multiprocessing
+import sys
+
+from . import evg_log_file_analyzer
+from . import faultinfo
+from . import instrumentation
+from . import log_file_analyzer
+from . import log_reader
+from . import timeout_file_analyzer
+
+# Kinds of analysis, and the analyzer they run
+EVG_LOG = "evg"  # EvgLogFileAnalyzer.analyze
+OOM_LOG = "oom"  # EvgLogFileAnalyzer.analyze_oom
+TIMEOUT_LOG = "timeout"  # TimeOutAnalyzer.analyze
+TEST_LOG = "test"  # LogFileSplitter and LogFileAnalyzer.analyze
+
+# The download threads are running when the pool starts, and a forked worker could inherit a lock
+# one of them held and wait on it forever, so workers are started from a fresh process instead
+START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+
+def analyze_log(kind, log_file, rule_budget=None):
+    """Analyze a cached log file, returns the analyzer's to_json() and its incomplete tests
+
+    rule_budget limits the seconds each fault rule of a test log may take, see
+    log_file_analyzer.LogFileAnalyzer.
+    """
+    incomplete_tests = []
+
+    if kind == TEST_LOG:
+        with instrumentation.span("split"):
+            with log_reader.open_log(log_file) as lfh:
+                splitter = log_file_analyzer.LogFileSplitter(lfh)
+
+        with instrumentation.span("analyze." + kind):
+            analyzer = log_file_analyzer.LogFileAnalyzer(
+                splitter.getsplits(), rule_budget=rule_budget)
+            analyzer.analyze()
+    else:
+        with contextlib.ExitStack() as stack:
+            with instrumentation.span("decode"):
+                log = stack.enter_context(log_reader.map_log(log_file))
+
+            with instrumentation.span("analyze." + kind):
+                if kind == TIMEOUT_LOG:
+                    analyzer = timeout_file_analyzer.TimeOutAnalyzer(log)
+                    analyzer.analyze()
+                    incomplete_tests = analyzer.get_incomplete_tests()
+                elif kind == OOM_LOG:
+                    analyzer = evg_log_file_analyzer.EvgLogFileAnalyzer(log)
+                    analyzer.analyze_oom()
+                elif kind == EVG_LOG:
+                    analyzer = evg_log_file_analyzer.EvgLogFileAnalyzer(log)
+                    analyzer.analyze()
+                else:
+                    raise ValueError("Unknown analysis: %s" % kind)
+
+    return analyzer.to_json(), incomplete_tests
+
+
+def analyze_log_recorded(kind, log_file, rule_budget=None):
+    """Run analyze_log in a worker process with instrumentation on, returns its result and the
+    export of the spans and counters it recorded
+    """
+    recorder = instrumentation.Recorder()
+    instrumentation.set_recorder(recorder)
+    try:
+        return analyze_log(kind, log_file, rule_budget), recorder.export()
+    finally:
+        instrumentation.set_recorder(None)
+
+
+class LogAnalysis(faultinfo.LogFileSummary):
+    """The faults and contexts of an analyzer rebuilt from its json, and the incomplete tests of
+    a TimeOutAnalyzer
+    """
+
+    def __init__(self, summary_json, incomplete_tests):
+        summary = json.loads(summary_json, cls=faultinfo.CustomDecoder)
+        super().__init__(summary.faults, summary.contexts)
+        self.incomplete_tests = incomplete_tests
+
+    def get_incomplete_tests(self):
+        return self.incomplete_tests
+
+
+class AnalysisPool(object):
+    """Run analyze_log on a pool of processes, or on the calling thread with one process
+
+    prefetch() starts the analysis of a log that will be needed later, and analyze() returns
+    the result of a prefetched analysis or runs it.
+    """
+
+    def __init__(self, processes=1, rule_budget=None):
+        self.processes = processes
+        self.rule_budget = rule_budget
+        self._executor = None
+        self._futures = {}
+
+        if processes > 1:
+            if sys.version_info >= (3, 7):
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=processes, mp_context=multiprocessing.get_context(START_METHOD))
+            else:
+                # Before 3.7 the pool always uses the default start method
+                self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=processes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Stop the worker processes, the prefetched analyses that were not used are dropped"""
+        if self._executor is not None:
+            for future, recorded in self._futures.values():
+                future.cancel()
+            self._executor.shutdown()
+            self._executor = None
+        self._futures = {}
+
+    def _submit(self, kind, log_file):
+        """Returns (future, whether the worker records spans), the workers only record spans
+        when this process does and they are merged in analyze()
+        """
+        if instrumentation.get_recorder() is None:
+            return self._executor.submit(analyze_log, kind, log_file, self.rule_budget), False
+        return self._executor.submit(analyze_log_recorded, kind, log_file, self.rule_budget), True
+
+    def prefetch(self, kind, log_file):
+        """Start the analysis of a log file, returns False if it was not started because it
+        already was or there are no worker processes
+        """
+        if self._executor is None or (kind, log_file) in self._futures:
+            return False
+
+        self._futures[(kind, log_file)] = self._submit(kind, log_file)
+        return True
+
+    def analyze(self, kind, log_file):
+        """Get the LogAnalysis of a log file"""
+        submitted = self._futures.pop((kind, log_file), None)
+        if submitted is None and self._executor is not None:
+            submitted = self._submit(kind, log_file)
+
+        if submitted is None:
+            return LogAnalysis(*analyze_log(kind, log_file, self.rule_budget))
+
+        future, recorded = submitted
+        if not recorded:
+            return LogAnalysis(*future.result())
+
+        result, exported = future.result()
+        recorder = instrumentation.get_recorder()
+        if recorder is not None:
+            recorder.merge(exported)
+
+        return LogAnalysis(*result)
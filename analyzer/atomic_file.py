@@ -0,0 +1,23 @@
+"""
+Replace files atomically, so readers and interrupted runs never see a partial file
+"""
+import contextlib
+import os
+import tempfile
+
+
+@contextlib.contextmanager
+def atomic_write(file, prefix=".tmp-"):
+    """Open a temporary binary file next to file, renamed over file when the block completes
+
+    If the block raises, the temporary file is removed and file is left as it was.
+    """
+    fd, temp_file = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(file)), prefix=prefix, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            yield fh
+        os.replace(temp_file, file)
+    except:
+        os.remove(temp_file)
+        raise
@@ -0,0 +1,33 @@
+"""
+Thread-safe counters for the statistics of a run
+"""
+import threading
+
+
+class Counters(object):
+    """Thread-safe counters, a subclass lists them in FIELDS as (name, initial value) pairs, and
+    describes them in FORMAT, a % format string over to_dict()
+    """
+
+    FIELDS = ()
+    FORMAT = ""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        for name, initial in self.FIELDS:
+            setattr(self, name, initial)
+
+    def add(self, name, value):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def to_dict(self):
+        with self._lock:
+            return self._to_dict()
+
+    def _to_dict(self):
+        """The counters, subclasses add values derived from them, the caller holds _lock"""
+        return {name: getattr(self, name) for name, _ in self.FIELDS}
+
+    def __str__(self):
+        return self.FORMAT % self.to_dict()
@@ -0,0 +1,71 @@
+"""
+Utilities for streaming HTTP downloads into the log cache
+"""
+import time
+
+from . import atomic_file
+
+# Size of the chunks read from the network and written to disk
+CHUNK_SIZE = 1024 * 1024
+
+
+class FileTooLargeError(Exception):
+    """Raised when a download is larger then the caller is willing to store"""
+
+    def __init__(self, url, size):
+        super().__init__("File is too large (%d bytes): %s" % (size, url))
+        self.url = url
+        self.size = size
+
+
+class DownloadRecord(object):
+    """Describes the size and timing of a completed download
+       Latency - seconds until the response headers arrived
+       Elapsed - seconds until the whole body was on disk
+    """
+
+    def __init__(self, url, size, latency, elapsed):
+        self.url = url
+        self.size = size
+        self.latency = latency
+        self.elapsed = elapsed
+
+    def throughput(self):
+        """Bytes per second"""
+        if self.elapsed <= 0:
+            return 0.0
+        return self.size / self.elapsed
+
+    def __str__(self):
+        return "Retrieved %.2f MB in %.2fs (latency %.2fs, %.2f MB/s): %s" % (
+            self.size / (1024.0 * 1024.0), self.elapsed, self.latency,
+            self.throughput() / (1024.0 * 1024.0), self.url)
+
+
+def save_response(response, url, file, start, max_bytes=None):
+    """Stream the body of a requests response made with stream=True to a file
+
+    The body is written to a temporary file next to the destination and renamed into place once
+    it is complete, so a failed or aborted download never leaves a partial file in the cache.
+    If max_bytes is set, the download is aborted with FileTooLargeError as soon as either the
+    Content-Length header or the number of bytes read so far exceeds it.
+    """
+    latency = time.time() - start
+
+    content_length = response.headers.get('Content-Length')
+    if max_bytes is not None and content_length is not None and content_length.isdigit():
+        if int(content_length) > max_bytes:
+            raise FileTooLargeError(url, int(content_length))
+
+    size = 0
+    with atomic_file.atomic_write(file, prefix=".download-") as lfh:
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            size += len(chunk)
+            if max_bytes is not None and size > max_bytes:
+                raise FileTooLargeError(url, size)
+
+            lfh.write(chunk)
+
+    record = DownloadRecord(url, size, latency, time.time() - start)
+    print(record)
+    return record
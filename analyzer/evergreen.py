@@ -3,10 +3,10 @@ Classes and utility functions for accessing evergreen
 """
 import os.path
 
-import requests
 import yaml
 
 from . import analyzer_config
+from . import http_transport
 
 
 class client(object):
@@ -29,15 +29,13 @@ class client(object):
         api_key = config['api_key']
         return user, api_key
 
-    def retrieve_file(self, url, file):
+    def retrieve_file(self, url, file, max_bytes=None):
+        """Stream a file to disk, raises download.FileTooLargeError if it exceeds max_bytes"""
         print("Retrieving: " + url)
 
         headers = {'Auth-Username': self.user, 'Api-Key': self.api_key}
 
-        r = requests.get(url, headers=headers)
-
-        with open(file, "wb") as lfh:
-            lfh.write(r.content)
+        return http_transport.get_transport().download(url, file, headers, max_bytes)
 
 
 def append_iteration_suffix(task_url):
@@ -5,70 +5,136 @@ Analyze a evergreen task log page
 import argparse
 import json
 import os
+import re
 import sys
 
 if __name__ == "__main__" and __package__ is None:
     sys.path.append(os.path.dirname(os.path.abspath(os.path.realpath(__file__))))
     print(sys.path)
     import faultinfo
+    import log_reader
 else:
     from . import faultinfo
+    from . import log_reader
 
 DEFAULT_CONTEXT_LINES = 20
 
+OOM_MESSAGE = b"OOM (Out of memory) killed processes detected"
+NO_OOM_MESSAGE = "No OOM (Out of memory) killed processes detected"
 
-class EvgLogFileAnalyzer(object):
-    """Analyze a non-timeout evergreen task log file"""
+# Lines of the kernel oom-killer report that follows the OOM message, such as
+#   mongod invoked oom-killer: gfp_mask=0x24201ca, order=0, oom_score_adj=0
+#   Out of memory: Kill process 1234 (mongod) score 912 or sacrifice child
+#   Killed process 1234 (mongod) total-vm:8123456kB, anon-rss:7012345kB, file-rss:0kB
+OOM_BLOCK_MARKERS = ["oom-killer", "Out of memory", "Kill process", "Killed process"]
 
-    def __init__(self, logstr):
-        self.logstr = logstr
-        self.faults = []
-        self.contexts = []
+# Most lines of the report to include in the context of an OOM fault
+MAX_OOM_BLOCK_LINES = 200
 
-        self.lines = self.logstr.split("\n")
+KILL_PROCESS_RE = re.compile(r"Kill(?:ed)? process (\d+) \((.*?)\)")
+RSS_RE = re.compile(r"\b(?:anon|file|shmem)-rss:(\d+)kB")
 
-    def analyze(self):
+# Messages to look for, the context lines to report before and after them, checked in order
+# for each line
+FAULT_MESSAGES = [
+    # All test failures contain this:
+    # ("Task completed - FAILURE.")
+
+    # All tests that fail usually have this messsage so
+    # there is nothing gained by check for it a normal case when a test simply fails
+    ('task failure', b"Task completed - FAILURE", DEFAULT_CONTEXT_LINES, 0),
 
-        for idx in range(len(self.lines)):
-            line = self.lines[idx]
+    # -1073741819 = 0xC0000005 = Access Violation on Windows
+    ('test crashed', b"(-1073741819)", DEFAULT_CONTEXT_LINES, 5),
+    ('git hub down', b"fatal: Could not read from remote repository.", DEFAULT_CONTEXT_LINES, 5),
+]
 
-            # All test failures contain this:
-            # ("Task completed - FAILURE.")
 
-            # All tests that fail usually have this messsage so
-            # there is nothing gained by check for it a normal case when a test simply fails
-            if "Task completed - FAILURE" in line:
-                self.add_fault('task failure', idx, DEFAULT_CONTEXT_LINES, 0)
+class EvgLogFileAnalyzer(object):
+    """Analyze a non-timeout evergreen task log file
 
-            # -1073741819 = 0xC0000005 = Access Violation on Windows
-            if "(-1073741819)" in line:
-                self.add_fault('test crashed', idx, DEFAULT_CONTEXT_LINES, 5)
+    The log can be a string or a bytes-like object such as a memory map from log_reader.map_log,
+    it is scanned as bytes and only the lines around faults are decoded.
+    """
 
-            if "fatal: Could not read from remote repository." in line:
-                self.add_fault('git hub down', idx, DEFAULT_CONTEXT_LINES, 5)
+    def __init__(self, log):
+        if isinstance(log, str):
+            log = log.encode('utf-8')
 
-            self.check_oom(line, idx)
+        self.log = log_reader.LogBuffer(log)
+        self.faults = []
+        self.contexts = []
 
-    def check_oom(self, line, idx):
-        if "OOM (Out of memory) killed processes detected" in line and not "No OOM (Out of memory) killed processes detected" in line:
-            count = 1
-            for fidx in range(idx + 1, len(self.lines)):
-                if not ("oom-killer" in line or "Out of memory" in line or "Kill process" in line):
-                    break
-                count += 1
+    def analyze(self):
+        # Find the lines with each message, and report them in the order of the log
+        hits = []
+        for order, (category, message, before_line_count, after_line_count) in enumerate(
+                FAULT_MESSAGES):
+            for offset in self.log.find_lines(message):
+                hits.append((offset, order))
+
+        for offset in self.log.find_lines(OOM_MESSAGE):
+            hits.append((offset, len(FAULT_MESSAGES)))
+
+        for offset, order in sorted(hits):
+            if order == len(FAULT_MESSAGES):
+                self.check_oom(offset)
+            else:
+                category, message, before_line_count, after_line_count = FAULT_MESSAGES[order]
+                self.add_fault(category, offset, before_line_count, after_line_count)
+
+    def check_oom(self, offset):
+        """Report the OOM message at offset, and the contiguous oom-killer report after it
+
+        The processes named in the report are recorded in the fault details, as a list of
+        {"pid", "name", "rss_kb"} where rss_kb is None unless the report has a "Killed process"
+        line for the process.
+        """
+        line = self.log.line_at(offset)
+        if NO_OOM_MESSAGE in line:
+            return
 
-            context = '\n'.join(self.lines[idx:idx + count])
-            self.faults.append(faultinfo.FaultInfo("evergreen", "oom-killer", context, line))
+        processes = []
+        processes_by_pid = {}
+
+        count = 1
+        for next_line in self.log.iter_lines_after(offset):
+            if count >= MAX_OOM_BLOCK_LINES:
+                break
+            if not any(marker in next_line for marker in OOM_BLOCK_MARKERS):
+                break
+            count += 1
+
+            m = KILL_PROCESS_RE.search(next_line)
+            if m:
+                pid = int(m.group(1))
+                process = processes_by_pid.get(pid)
+                if process is None:
+                    process = {"pid": pid, "name": m.group(2), "rss_kb": None}
+                    processes_by_pid[pid] = process
+                    processes.append(process)
+
+                rss = RSS_RE.findall(next_line)
+                if rss:
+                    process["rss_kb"] = sum(int(kb) for kb in rss)
+
+        context = '\n'.join(self.log.lines(offset, 0, count))
+        self.faults.append(
+            faultinfo.FaultInfo(
+                "evergreen",
+                "oom-killer",
+                context,
+                self.log.line_number(offset),
+                details={"killed_processes": processes}))
 
     def analyze_oom(self):
-        for idx in range(len(self.lines)):
-            line = self.lines[idx]
-
-            self.check_oom(line, idx)
+        for offset in self.log.find_lines(OOM_MESSAGE):
+            self.check_oom(offset)
 
-    def add_fault(self, category, line, before_line_count, after_line_count):
-        context = '\n'.join(self.lines[line - before_line_count:line + after_line_count])
-        self.faults.append(faultinfo.FaultInfo("evergreen", category, context, line))
+    def add_fault(self, category, offset, before_line_count, after_line_count):
+        context = '\n'.join(self.log.lines(offset, before_line_count, after_line_count))
+        self.faults.append(
+            faultinfo.FaultInfo("evergreen", category, context, self.log.line_number(offset)))
 
     def get_faults(self):
         return self.faults
@@ -89,12 +155,10 @@ def main():
 
     for file in args.files:
 
-        with open(file, "rb") as lfh:
-            log_file_str = lfh.read().decode('utf-8')
-
-        analyzer = EvgLogFileAnalyzer(log_file_str)
+        with log_reader.map_log(file) as log:
+            analyzer = EvgLogFileAnalyzer(log)
 
-        analyzer.analyze()
+            analyzer.analyze()
 
         faults = analyzer.get_faults()
 
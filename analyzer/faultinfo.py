@@ -12,13 +12,16 @@ class FaultInfo:
        Category - js assert, seg fault, etc
        Context - lines from file
        Line number - line number in log file
+       Details - optional dictionary of structured information about the fault, such as the
+                 processes killed by the OOM killer
     """
 
-    def __init__(self, source, category, context, line_number):
+    def __init__(self, source, category, context, line_number, details=None):
         self.source = source
         self.category = category
         self.context = context
         self.line_number = line_number
+        self.details = details
 
     def __str__(self):
         return "FaultInfo -- " + self.source + " - " + self.category
@@ -27,12 +30,15 @@ class FaultInfo:
 class CustomEncoder(json.JSONEncoder):
     def default(self, obj):
         if isinstance(obj, FaultInfo):
-            return {
+            d = {
                 "category": obj.category,
                 "context": obj.context,
                 "source": obj.source,
                 "line_number": obj.line_number
             }
+            if obj.details is not None:
+                d["details"] = obj.details
+            return d
 
         # Let the base class default method raise the TypeError
         return json.JSONEncoder.default(self, obj)
@@ -49,12 +55,14 @@ class CustomDecoder(json.JSONDecoder):
         faults = []
         for item in obj["faults"]:
             faults.append(
-                FaultInfo(item["category"], item["context"], item["source"], item["line_number"]))
+                FaultInfo(item["source"], item["category"], item["context"], item["line_number"],
+                          item.get("details")))
 
         contexts = []
         for item in obj["contexts"]:
             contexts.append(
-                FaultInfo(item["category"], item["context"], item["source"], item["line_number"]))
+                FaultInfo(item["source"], item["category"], item["context"], item["line_number"],
+                          item.get("details")))
 
         return LogFileSummary(faults, contexts)
 
@@ -73,3 +81,7 @@ class LogFileSummary:
 
     def get_contexts(self):
         return self.contexts
+
+    def to_json(self):
+        d1 = {"faults": self.faults, "contexts": self.contexts}
+        return json.dumps(d1, cls=CustomEncoder)
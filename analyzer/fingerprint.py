@@ -0,0 +1,74 @@
+"""
+Fingerprints that tell whether a cached summary.json is still current
+
+A summary is stamped with a hash of the analyzer modules that produced it and the content hash of
+the log it was computed from. Changing a fault rule changes the first, so every summary becomes
+stale and is recomputed from the cached logs on the next run.
+
+A summary with rules that were given up on after the rule budget is also stamped with the budget,
+and is only current for the same budget, so a run with a larger budget checks those rules again.
+"""
+import hashlib
+import os
+
+from . import evg_log_file_analyzer
+from . import faultinfo
+from . import log_file_analyzer
+from . import log_reader
+from . import timeout_file_analyzer
+
+# Modules whose source determines the contents of a summary
+RULE_MODULES = [
+    evg_log_file_analyzer, faultinfo, log_file_analyzer, log_reader, timeout_file_analyzer
+]
+
+_rules_fingerprint = None
+
+
+def rules_fingerprint():
+    """Get the sha256 of the source of the RULE_MODULES"""
+    global _rules_fingerprint
+
+    if _rules_fingerprint is None:
+        m = hashlib.sha256()
+        for module in RULE_MODULES:
+            file = os.path.splitext(module.__file__)[0] + ".py"
+            with open(file, "rb") as sfh:
+                m.update(sfh.read())
+        _rules_fingerprint = m.hexdigest()
+
+    return _rules_fingerprint
+
+
+def over_budget(summary):
+    """Check if a summary has rules that were given up on after the rule budget"""
+    return any(context["category"] == log_file_analyzer.BUDGET_EXCEEDED
+               for context in summary.get("contexts", []))
+
+
+def summary_fingerprint(log_url, log_hash, summary=None, rule_budget=None):
+    """Get the fingerprint to stamp a summary computed from the log at log_url with, and with
+    rule_budget if the summary is over budget
+    """
+    fingerprint = {"rules": rules_fingerprint(), "log_url": log_url, "log": log_hash}
+    if summary is not None and over_budget(summary):
+        fingerprint["rule_budget"] = rule_budget
+    return fingerprint
+
+
+def is_current(summary, log_hash_for_url, rule_budget=None):
+    """Check if a summary was computed by the current rules from the current log, and with
+    rule_budget if it is over budget
+
+    log_hash_for_url is a function that returns the content hash of the log at a url, or None
+    when it is unknown, in which case the log is assumed not to have changed.
+    """
+    fingerprint = summary.get("fingerprint") if isinstance(summary, dict) else None
+    if fingerprint is None or fingerprint.get("rules") != rules_fingerprint():
+        return False
+
+    if "rule_budget" in fingerprint and fingerprint["rule_budget"] != rule_budget:
+        return False
+
+    log_hash = log_hash_for_url(fingerprint["log_url"])
+    return log_hash is None or log_hash == fingerprint["log"]
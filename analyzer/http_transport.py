@@ -0,0 +1,187 @@
+"""
+Shared HTTP transport for downloading logs from evergreen and logkeeper
+"""
+import threading
+import time
+import urllib.parse
+
+import requests
+import requests.adapters
+import urllib3.connectionpool
+import urllib3.util.retry
+
+from . import counters
+from . import download
+from . import instrumentation
+
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 60
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.5
+DEFAULT_MAX_PER_HOST = 4
+
+# Server errors worth trying again
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+
+# Errors while the body is read, after the retries of urllib3 are over, worth trying again
+BODY_RETRY_ERRORS = (requests.exceptions.ChunkedEncodingError, requests.exceptions.ConnectionError)
+
+
+class TransportStats(counters.Counters):
+    """Counters for tuning the transport
+       Requests - number of requests sent, not including retries
+       Bytes - bytes written to disk
+       Retries - number of failed attempts that were retried or gave up
+       Connections - number of new connections opened
+       Connect time - seconds spent opening connections, including the TLS handshake
+    """
+
+    FIELDS = (("requests", 0), ("bytes", 0), ("retries", 0), ("connections", 0),
+              ("connect_time", 0.0))
+    FORMAT = ("HTTP -- requests: %(requests)d, bytes: %(bytes)d, retries: %(retries)d, " +
+              "connections: %(connections)d, connect time: %(connect_time).2fs")
+
+
+class _CountingRetry(urllib3.util.retry.Retry):
+    """Retry policy that counts every failed attempt in a TransportStats"""
+
+    stats = None
+
+    def new(self, **kwargs):
+        retry = super().new(**kwargs)
+        retry.stats = self.stats
+        return retry
+
+    def increment(self, *args, **kwargs):
+        if self.stats is not None:
+            self.stats.add("retries", 1)
+        return super().increment(*args, **kwargs)
+
+
+def _timed_pool_class(pool_class, stats):
+    """Subclass a urllib3 connection pool to record the time spent opening connections"""
+
+    class TimedConnection(pool_class.ConnectionCls):
+        def connect(self):
+            start = time.time()
+            try:
+                return super().connect()
+            finally:
+                stats.add("connections", 1)
+                stats.add("connect_time", time.time() - start)
+
+    class TimedPool(pool_class):
+        ConnectionCls = TimedConnection
+
+    return TimedPool
+
+
+class _TimedAdapter(requests.adapters.HTTPAdapter):
+    def __init__(self, stats, **kwargs):
+        self.stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _timed_pool_class(urllib3.connectionpool.HTTPConnectionPool, self.stats),
+            "https": _timed_pool_class(urllib3.connectionpool.HTTPSConnectionPool, self.stats),
+        }
+
+
+class Transport(object):
+    """A keep-alive session shared by all downloads
+
+    Connections are pooled per host, requests have connect and read timeouts, connection errors
+    and server errors are retried with exponential backoff, and at most max_per_host downloads
+    run against a single host at a time. urllib3 only retries until the response headers
+    arrive, download() retries a connection reset while the body is read itself.
+    """
+
+    def __init__(self,
+                 connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT,
+                 retries=DEFAULT_RETRIES,
+                 backoff_factor=DEFAULT_BACKOFF_FACTOR,
+                 max_per_host=DEFAULT_MAX_PER_HOST):
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.max_per_host = max_per_host
+        self.stats = TransportStats()
+
+        retry = _CountingRetry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUS_CODES)
+        retry.stats = self.stats
+
+        adapter = _TimedAdapter(self.stats, max_retries=retry, pool_maxsize=max_per_host)
+
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._lock = threading.Lock()
+        self._host_limits = {}
+
+    def _host_limit(self, url):
+        host = urllib.parse.urlparse(url).netloc
+        with self._lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._host_limits[host]
+
+    def download(self, url, file, headers=None, max_bytes=None):
+        """Stream url to file, see download.save_response, returns a download.DownloadRecord
+
+        An error status raises requests.HTTPError before anything is written to file.
+        """
+        self.stats.add("requests", 1)
+
+        attempt = 0
+        while True:
+            with self._host_limit(url), instrumentation.span("download"):
+                start = time.time()
+                r = self.session.get(url, headers=headers, stream=True, timeout=self.timeout)
+                try:
+                    r.raise_for_status()
+                    record = download.save_response(r, url, file, start, max_bytes)
+                    break
+                except BODY_RETRY_ERRORS as e:
+                    self.stats.add("retries", 1)
+                    if attempt >= self.retries:
+                        raise
+                    print("Retrying %s: %s" % (url, e))
+                finally:
+                    r.close()
+
+            time.sleep(self.backoff_factor * 2**attempt)
+            attempt += 1
+
+        self.stats.add("bytes", record.size)
+        instrumentation.count("bytes_downloaded", record.size)
+        return record
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_transport():
+    """Get the process wide transport, creating one with the default settings if needed"""
+    global _transport
+
+    with _transport_lock:
+        if _transport is None:
+            _transport = Transport()
+        return _transport
+
+
+def set_transport(transport):
+    """Replace the process wide transport, for instance to change the timeouts"""
+    global _transport
+
+    with _transport_lock:
+        _transport = transport
@@ -0,0 +1,275 @@
+"""
+Named spans and counters for finding where the time of a bfg_analyzer run goes
+
+Instrumentation is off until a Recorder is installed with set_recorder, until then span() and
+count() return at once. Spans and counts are attributed to the BF of the enclosing bf_context,
+on the same thread, or on the thread that called wrap().
+
+    with instrumentation.bf_context(bf["issue"]):
+        with instrumentation.span("download"):
+            ...
+        instrumentation.count("bytes_downloaded", size)
+
+Spans nest, so the time of a stage includes the time of the stages inside it.
+"""
+import json
+import os
+import threading
+import time
+
+
+class _NullSpan(object):
+    """Context manager that does nothing, used while instrumentation is off"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span(object):
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *args):
+        self.recorder.add_span(self.name, self.start, time.time() - self.start)
+        return False
+
+
+class _BFContext(object):
+    def __init__(self, recorder, bf):
+        self.recorder = recorder
+        self.bf = bf
+        self.previous = None
+
+    def __enter__(self):
+        self.previous = self.recorder.current_bf()
+        self.recorder._local.bf = self.bf
+        return self
+
+    def __exit__(self, *args):
+        self.recorder._local.bf = self.previous
+        return False
+
+
+def percentile(values, fraction):
+    """Get the nearest-rank percentile of a sorted list"""
+    if not values:
+        return 0.0
+    index = max(0, int(len(values) * fraction + 0.5) - 1)
+    return values[min(index, len(values) - 1)]
+
+
+def _stage_stats(durations):
+    durations = sorted(durations)
+    return {
+        "count": len(durations),
+        "total": sum(durations),
+        "p50": percentile(durations, 0.50),
+        "p95": percentile(durations, 0.95),
+        "max": durations[-1] if durations else 0.0
+    }
+
+
+class Recorder(object):
+    """Thread-safe record of the spans and counters of a run
+
+    A span is a (name, bf, start, duration, pid, tid) tuple, start is in seconds since the
+    epoch so spans recorded in other processes line up.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.start = time.time()
+        self.spans = []
+        self.counters = {}
+        self.bf_counters = {}
+
+    def current_bf(self):
+        return getattr(self._local, "bf", None)
+
+    def add_span(self, name, start, duration, bf=None, pid=None, tid=None):
+        if bf is None:
+            bf = self.current_bf()
+        if pid is None:
+            pid = os.getpid()
+        if tid is None:
+            tid = threading.get_ident()
+
+        with self._lock:
+            self.spans.append((name, bf, start, duration, pid, tid))
+
+    def count(self, name, value=1, bf=None):
+        if bf is None:
+            bf = self.current_bf()
+
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+            if bf is not None:
+                counters = self.bf_counters.setdefault(bf, {})
+                counters[name] = counters.get(name, 0) + value
+
+    def export(self):
+        """Get the spans and counters as plain data, for merging into the recorder of another
+        process
+        """
+        with self._lock:
+            return {"spans": list(self.spans), "counters": dict(self.counters)}
+
+    def merge(self, exported, bf=None):
+        """Add the spans and counters of an export to the current BF, or to bf"""
+        if bf is None:
+            bf = self.current_bf()
+
+        for name, span_bf, start, duration, pid, tid in exported["spans"]:
+            self.add_span(name, start, duration, span_bf or bf, pid, tid)
+
+        for name, value in exported["counters"].items():
+            self.count(name, value, bf)
+
+    def report(self):
+        """Get the run report, a json serializable dict:
+            wall_seconds - time since the recorder was created
+            stages - count, total, p50, p95 and max seconds of the spans of each name
+            counters - total of each counter
+            bfs - per BF, the same stats of each stage and the BF's counters
+        """
+        with self._lock:
+            spans = list(self.spans)
+            counters = dict(self.counters)
+            bf_counters = dict((bf, dict(c)) for bf, c in self.bf_counters.items())
+
+        durations = {}
+        bf_durations = {}
+        for name, bf, start, duration, pid, tid in spans:
+            durations.setdefault(name, []).append(duration)
+
+            if bf is not None:
+                bf_durations.setdefault(bf, {}).setdefault(name, []).append(duration)
+
+        bfs = {}
+        for bf, stages in bf_durations.items():
+            bfs[bf] = {
+                "stages": dict((name, _stage_stats(d)) for name, d in stages.items()),
+                "counters": {}
+            }
+
+        for bf, c in bf_counters.items():
+            bfs.setdefault(bf, {"stages": {}, "counters": {}})["counters"] = c
+
+        return {
+            "wall_seconds": time.time() - self.start,
+            "stages": dict((name, _stage_stats(d)) for name, d in durations.items()),
+            "counters": counters,
+            "bfs": bfs
+        }
+
+    def trace_events(self):
+        """Get the spans as Chrome trace events, see chrome://tracing or ui.perfetto.dev"""
+        with self._lock:
+            spans = list(self.spans)
+
+        events = []
+        for name, bf, start, duration, pid, tid in spans:
+            event = {
+                "name": name,
+                "ph": "X",
+                "ts": int((start - self.start) * 1e6),
+                "dur": int(duration * 1e6),
+                "pid": pid,
+                "tid": tid
+            }
+            if bf is not None:
+                event["args"] = {"bf": bf}
+            events.append(event)
+
+        return events
+
+    def save_report(self, file, extra=None):
+        """Write the run report as json, with the keys of extra added to it"""
+        report = self.report()
+        if extra:
+            report.update(extra)
+
+        with open(file, "w", encoding="utf8") as rfh:
+            json.dump(report, rfh, indent="\t", sort_keys=True)
+
+    def save_trace(self, file):
+        with open(file, "w", encoding="utf8") as tfh:
+            json.dump({"traceEvents": self.trace_events()}, tfh)
+
+    def __str__(self):
+        report = self.report()
+
+        lines = ["%-24s %8s %10s %10s %10s %10s" % ("Stage", "Count", "Total", "p50", "p95",
+                                                   "Max")]
+        for name, s in sorted(report["stages"].items(), key=lambda i: -i[1]["total"]):
+            lines.append("%-24s %8d %9.2fs %9.3fs %9.3fs %9.3fs" %
+                         (name, s["count"], s["total"], s["p50"], s["p95"], s["max"]))
+
+        for name, value in sorted(report["counters"].items()):
+            lines.append("%-24s %8d" % (name, value))
+
+        return "\n".join(lines)
+
+
+_recorder = None
+
+
+def get_recorder():
+    """Get the process wide recorder, or None while instrumentation is off"""
+    return _recorder
+
+
+def set_recorder(recorder):
+    """Install the process wide recorder, None turns instrumentation off"""
+    global _recorder
+    _recorder = recorder
+
+
+def span(name):
+    """Context manager timing a stage"""
+    recorder = _recorder
+    if recorder is None:
+        return _NULL_SPAN
+    return _Span(recorder, name)
+
+
+def count(name, value=1):
+    recorder = _recorder
+    if recorder is not None:
+        recorder.count(name, value)
+
+
+def bf_context(bf):
+    """Context manager attributing the spans and counts of this thread to a BF"""
+    recorder = _recorder
+    if recorder is None:
+        return _NULL_SPAN
+    return _BFContext(recorder, bf)
+
+
+def wrap(fn):
+    """Wrap a function to run on another thread in the BF context of the calling thread"""
+    recorder = _recorder
+    if recorder is None:
+        return fn
+
+    bf = recorder.current_bf()
+
+    def run_in_context(*args, **kwargs):
+        with _BFContext(recorder, bf):
+            return fn(*args, **kwargs)
+
+    return run_in_context
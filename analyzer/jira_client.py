@@ -2,10 +2,12 @@
 Jira Client and utility operations
 """
 import argparse
+import concurrent.futures
 import getpass
 import json
 import os
 import pprint
+import queue
 import re
 import threading
 
@@ -16,21 +18,39 @@ try:
 except ImportError:
     keyring = None
 
+from . import instrumentation
+
+# Number of issues to ask Jira for at a time
+DEFAULT_PAGE_SIZE = 100
+
+# Fields returned by search_issues unless asked otherwise
+DEFAULT_FIELDS = [
+    "id", "key", "status", "resolution", "summary", "created", "updated", "assignee", "description"
+]
+
+# Fields needed to list issues, without the large description
+LIST_FIELDS = ["key", "status", "resolution", "summary", "created", "updated", "assignee"]
+
 
 class jira_client(object):
     """Simple wrapper around jira api for build baron analyzer needs"""
 
-    def __init__(self, jira_server, jira_user):
+    def __init__(self, jira_server, jira_user, page_workers=1):
+
+        self._options = {'server': jira_server, 'verify': False}
+        self._basic_auth = (jira_user, jira_client._get_password(jira_server, jira_user))
 
-        self.jira = JIRA(
-            options={'server': jira_server,
-                     'verify': False},
-            basic_auth=(jira_user, jira_client._get_password(jira_server, jira_user)),
-            validate=True)
+        self.jira = JIRA(options=self._options, basic_auth=self._basic_auth, validate=True)
 
         # Since the web server may share this client among threads, use a lock since it unclear if the JIRA client is thread-safe
         self._lock = threading.Lock()
 
+        # Number of pages of search results to fetch at a time
+        self.page_workers = page_workers
+
+        # Idle JIRA clients for fetching pages concurrently, each is used by one thread at a time
+        self._page_sessions = queue.Queue()
+
     @staticmethod
     def _get_password(server, user):
         global keyring
@@ -62,20 +82,103 @@ class jira_client(object):
             ['text~"%s"' % f for f in fields]) + ") ORDER BY updated DESC"
         return search
 
-    def search_issues(self, query, maxResults=50):
-        with self._lock:
-            results = self.jira.search_issues(
-                query,
-                fields=[
-                    "id", "key", "status", "resolution", "summary", "created", "updated",
-                    "assignee", "description"
-                ],
-                maxResults=maxResults)
+    def search_issues(self, query, maxResults=50, fields=DEFAULT_FIELDS, workers=None):
+        """Get a list of the issues matching a query, see iter_issues
+
+        Set maxResults to None for every issue.
+        """
+        results = list(self.iter_issues(query, fields, maxResults, workers=workers))
 
         print("Found %d results" % len(results))
 
         return results
 
+    def iter_issues(self,
+                    query,
+                    fields=DEFAULT_FIELDS,
+                    max_results=None,
+                    page_size=DEFAULT_PAGE_SIZE,
+                    workers=None):
+        """Iterate the issues matching a query with only the given fields, a page at a time
+
+        The first page tells how many issues there are. With more than one worker, the remaining
+        pages are fetched concurrently on separate JIRA clients, and still yielded in order. The
+        rest of the range of a page that comes back short is fetched in order after it.
+        """
+        if workers is None:
+            workers = self.page_workers
+
+        if max_results is not None:
+            page_size = min(page_size, max_results)
+
+        with self._lock:
+            first = self._search_page(query, 0, page_size, fields)
+
+        yield from first
+
+        total = first.total
+        if max_results is not None:
+            total = min(total, max_results)
+
+        # Jira may return smaller pages than asked for
+        page_size = max(len(first), 1)
+
+        if workers <= 1:
+            start = len(first)
+            while start < total:
+                with self._lock:
+                    page = self._search_page(query, start, min(page_size, total - start), fields)
+                if len(page) == 0:
+                    break
+
+                yield from page
+                start += len(page)
+        else:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                pages = [(start, min(page_size, total - start),
+                          executor.submit(
+                              instrumentation.wrap(self._search_page_session), query, start,
+                              min(page_size, total - start), fields))
+                         for start in range(len(first), total, page_size)]
+
+                for start, count, future in pages:
+                    page = future.result()
+                    yield from page
+
+                    start += len(page)
+                    count -= len(page)
+                    while count > 0:
+                        with self._lock:
+                            page = self._search_page(query, start, count, fields)
+                        if len(page) == 0:
+                            break
+
+                        yield from page
+                        start += len(page)
+                        count -= len(page)
+
+    def _search_page(self, query, start, max_results, fields, jira=None):
+        if jira is None:
+            jira = self.jira
+
+        with instrumentation.span("jira_search"):
+            return jira.search_issues(query, startAt=start, maxResults=max_results, fields=fields)
+
+    def _new_page_session(self):
+        return JIRA(options=self._options, basic_auth=self._basic_auth)
+
+    def _search_page_session(self, query, start, max_results, fields):
+        """Fetch a page on an idle JIRA client of this thread's own, not under the lock"""
+        try:
+            jira = self._page_sessions.get_nowait()
+        except queue.Empty:
+            jira = self._new_page_session()
+
+        try:
+            return self._search_page(query, start, max_results, fields, jira)
+        finally:
+            self._page_sessions.put(jira)
+
 # jira.resolutions()
 #[<JIRA Resolution: name='Fixed', id='1'>,
 # <JIRA Resolution: name="Won't Fix", id='2'>,
@@ -100,25 +203,39 @@ class jira_client(object):
 # <JIRA IssueLinkType: name='Related', id='10012'>,
 # <JIRA IssueLinkType: name='Tested', id='10220'>]
 
+    @staticmethod
+    def _is_resolved(issue):
+        return issue.fields.status.name in ("Closed", "Resolved")
+
     def close_as_duplicate(self, issue, duplicate_issue):
+        """Link issue as a duplicate of duplicate_issue and close it
 
+        The steps already done are skipped, so a failed call can be retried.
+        """
         with self._lock:
-            src_issue = self.jira.issue(issue)
-            dest_issue = self.jira.issue(duplicate_issue)
+            src_issue = self.jira.issue(issue, fields="status,issuelinks")
 
             # Add duplicate link
-            self.jira.create_issue_link(
-                type='Duplicate', inwardIssue=issue, outwardIssue=duplicate_issue)
+            linked = any(
+                link.type.name == 'Duplicate' and hasattr(link, 'outwardIssue') and
+                link.outwardIssue.key == duplicate_issue
+                for link in getattr(src_issue.fields, 'issuelinks', None) or [])
+            if not linked:
+                self.jira.create_issue_link(
+                    type='Duplicate', inwardIssue=issue, outwardIssue=duplicate_issue)
 
             # Close - id 2
             # Duplicate issue is 3
-            self.jira.transition_issue(src_issue, '2', resolution={'id': '3'})
+            if not self._is_resolved(src_issue):
+                self.jira.transition_issue(src_issue, '2', resolution={'id': '3'})
 
     def close_as_goneaway(self, issue):
+        """Close issue as gone away, unless it is already closed"""
         with self._lock:
-            src_issue = self.jira.issue(issue)
+            src_issue = self.jira.issue(issue, fields="status")
 
             # Close - id 2
             # Gone away is 7
-            self.jira.transition_issue(
-                src_issue, '2', comment="Transient machine issue.", resolution={'id': '7'})
+            if not self._is_resolved(src_issue):
+                self.jira.transition_issue(
+                    src_issue, '2', comment="Transient machine issue.", resolution={'id': '7'})
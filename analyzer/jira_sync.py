@@ -0,0 +1,161 @@
+"""
+Incremental sync of the issues matching a Jira query into a local store
+
+The first sync of a query fetches every matching issue. Later syncs only fetch the issues updated
+since the previous sync, plus a margin for clock skew, and reuse the parsed form of the rest.
+The issues that no longer match the query, for instance because they were resolved, are found
+with a query that only returns issue keys, and are pruned from the store.
+
+    bf_store.json
+        queries - query -> time of the last sync, keys of the matching issues in query order
+        issues  - issue key -> updated timestamp, parsed issue
+"""
+import json
+import os
+import re
+import time
+
+from . import atomic_file
+from . import instrumentation
+
+DEFAULT_STORE_FILE = "bf_store.json"
+
+# Minutes to add to the time since the last sync, for the clock skew between us and Jira
+DEFAULT_MARGIN_MINUTES = 10
+
+# Number of queries to remember, older ones are forgotten along with the issues only they match
+MAX_QUERIES = 8
+
+# Fields needed to parse an issue
+SYNC_FIELDS = ["summary", "description", "updated"]
+
+# Number of issue keys to ask for in a single "key in (...)" query
+KEY_BATCH_SIZE = 50
+
+
+def add_updated_clause(query, minutes):
+    """Restrict a JQL query to issues updated in the last minutes, keeping its ORDER BY"""
+    m = re.search(r"\s+ORDER\s+BY\s", query, re.IGNORECASE)
+    if m:
+        where, order_by = query[:m.start()], query[m.start():]
+    else:
+        where, order_by = query, ""
+
+    return '(%s) AND updated >= "-%dm"%s' % (where, minutes, order_by)
+
+
+class SyncStats(object):
+    """Counters for a sync
+       Members - issues matching the query
+       Fetched - issues fetched with all their fields
+       Parsed - issues that were new or updated, and were parsed
+       Failed - issues that could not be parsed, and were skipped
+       Pruned - issues removed from the store
+    """
+
+    def __init__(self):
+        self.members = 0
+        self.fetched = 0
+        self.parsed = 0
+        self.failed = 0
+        self.pruned = 0
+
+    def __str__(self):
+        return ("Jira sync -- members: %d, fetched: %d, parsed: %d, failed: %d, pruned: %d" %
+                (self.members, self.fetched, self.parsed, self.failed, self.pruned))
+
+
+class IssueStore(object):
+    """Local store of the issues matching recent queries, see the module description"""
+
+    def __init__(self, file=DEFAULT_STORE_FILE, margin_minutes=DEFAULT_MARGIN_MINUTES):
+        self.file = file
+        self.margin_minutes = margin_minutes
+        self.stats = SyncStats()
+
+        self.queries = {}
+        self.issues = {}
+        if os.path.exists(file):
+            with open(file, "rb") as sfh:
+                store = json.loads(sfh.read().decode('utf-8'))
+            self.queries = store["queries"]
+            self.issues = store["issues"]
+
+    def save(self):
+        with atomic_file.atomic_write(self.file, prefix=".store-") as sfh:
+            sfh.write(
+                json.dumps({
+                    "queries": self.queries,
+                    "issues": self.issues
+                }, indent="\t").encode())
+
+    def sync(self, jira_client, query, parse, full=False):
+        """Bring the issues matching query up to date, and return their parsed form in query order
+
+        parse turns a Jira issue with the SYNC_FIELDS into something json serializable, it is
+        only called for new and updated issues. An issue parse raises for is skipped, and fetched
+        again on the next sync. Set full to fetch every issue again.
+        """
+        self.stats = SyncStats()
+        start = time.time()
+
+        keys = [issue.key for issue in jira_client.search_issues(query, None, fields=["key"])]
+        self.stats.members = len(keys)
+
+        last_sync = self.queries.get(query)
+        if last_sync is None or full:
+            changed = jira_client.search_issues(query, None, fields=SYNC_FIELDS)
+        else:
+            minutes = int((start - last_sync["synced"]) / 60) + 1 + self.margin_minutes
+            changed = jira_client.search_issues(
+                add_updated_clause(query, minutes), None, fields=SYNC_FIELDS)
+
+        # Issues that started matching without being updated, or that were pruned along with an
+        # older query
+        seen = set(issue.key for issue in changed)
+        missing = [key for key in keys if key not in self.issues and key not in seen]
+        for i in range(0, len(missing), KEY_BATCH_SIZE):
+            changed += jira_client.search_issues(
+                "key in (%s)" % ", ".join(missing[i:i + KEY_BATCH_SIZE]), None, fields=SYNC_FIELDS)
+
+        self.stats.fetched = len(changed)
+
+        for issue in changed:
+            entry = self.issues.get(issue.key)
+            if entry is not None and entry["updated"] == issue.fields.updated and not full:
+                continue
+
+            try:
+                with instrumentation.span("parse"):
+                    bf = parse(issue)
+            except Exception as e:
+                print("Skipping %s, it could not be parsed: %s" % (issue.key, e))
+                self.issues.pop(issue.key, None)
+                self.stats.failed += 1
+                continue
+
+            self.issues[issue.key] = {"updated": issue.fields.updated, "bf": bf}
+            self.stats.parsed += 1
+
+        self.queries[query] = {"synced": start, "keys": keys}
+        self._prune()
+        with instrumentation.span("write_store"):
+            self.save()
+
+        print(self.stats)
+
+        return [self.issues[key]["bf"] for key in keys if key in self.issues]
+
+    def _prune(self):
+        """Forget the oldest queries, and the issues no remembered query matches"""
+        recent = sorted(self.queries.items(), key=lambda q: q[1]["synced"], reverse=True)
+        self.queries = dict(recent[:MAX_QUERIES])
+
+        members = set()
+        for last_sync in self.queries.values():
+            members.update(last_sync["keys"])
+
+        for key in list(self.issues.keys()):
+            if key not in members:
+                del self.issues[key]
+                self.stats.pruned += 1
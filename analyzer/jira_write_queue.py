@@ -0,0 +1,219 @@
+"""
+Persistent queue of Jira changes, applied by a background thread
+
+The web server enqueues the issues to close and returns at once, the queue is saved to a file
+so jobs that were not applied yet survive a restart.
+
+    jira_queue.json - {"next_id": n, "jobs": [job, ...]}
+
+A job is a dict:
+    id - number of the job
+    action - CLOSE_DUPLICATE or CLOSE_GONEAWAY
+    issue - issue to close
+    duplicate_issue - issue it duplicates, for CLOSE_DUPLICATE
+    state - QUEUED, RUNNING, DONE or FAILED
+    attempts - number of times the job was tried
+    error - message of the last failure, or None
+    created, updated - times in seconds since the epoch
+"""
+import json
+import os
+import threading
+import time
+
+from . import atomic_file
+
+DEFAULT_FILE = "jira_queue.json"
+DEFAULT_MAX_ATTEMPTS = 5
+
+# Seconds to wait before the first retry, doubled for each attempt after it
+DEFAULT_RETRY_DELAY = 10
+
+# Finished jobs to keep for the status of recent requests
+MAX_FINISHED_JOBS = 1000
+
+CLOSE_DUPLICATE = "close_duplicate"
+CLOSE_GONEAWAY = "close_goneaway"
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JiraWriteQueue(object):
+    """Apply Jira changes one at a time on a background thread, retrying failures
+
+    get_jira_client is called on the worker thread to get the jira_client.jira_client to use.
+    on_done(job) is called after each job is applied, such as to invalidate cached searches.
+    """
+
+    def __init__(self,
+                 get_jira_client,
+                 file=DEFAULT_FILE,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS,
+                 retry_delay=DEFAULT_RETRY_DELAY,
+                 on_done=None):
+        self.get_jira_client = get_jira_client
+        self.file = file
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.on_done = on_done
+
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._next_id = 1
+        self._jobs = []
+        self._thread = None
+
+        if os.path.exists(file):
+            with open(file, "rb") as qfh:
+                root = json.loads(qfh.read().decode('utf-8'))
+            self._next_id = root["next_id"]
+            self._jobs = root["jobs"]
+
+            # The server stopped while applying these, try them again
+            for job in self._jobs:
+                if job["state"] == RUNNING:
+                    job["state"] = QUEUED
+
+    def _save(self):
+        """Write the queue, the caller holds _lock"""
+        with atomic_file.atomic_write(self.file, prefix=".jira_queue-") as qfh:
+            qfh.write(json.dumps({"next_id": self._next_id, "jobs": self._jobs}, indent="\t")
+                      .encode())
+
+    def start(self):
+        """Start the worker thread, if it is not running yet"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def close_as_duplicate(self, issues, duplicate_issue):
+        """Queue closing each of issues as a duplicate of duplicate_issue, returns the jobs"""
+        return self._enqueue([{
+            "action": CLOSE_DUPLICATE,
+            "issue": issue,
+            "duplicate_issue": duplicate_issue
+        } for issue in issues])
+
+    def close_as_goneaway(self, issues):
+        """Queue closing each of issues as gone away, returns the jobs"""
+        return self._enqueue([{"action": CLOSE_GONEAWAY, "issue": issue} for issue in issues])
+
+    def _enqueue(self, requests):
+        now = time.time()
+        jobs = []
+
+        with self._lock:
+            for request in requests:
+                job = {
+                    "id": self._next_id,
+                    "duplicate_issue": None,
+                    "state": QUEUED,
+                    "attempts": 0,
+                    "error": None,
+                    "created": now,
+                    "updated": now,
+                    "not_before": now
+                }
+                job.update(request)
+                self._next_id += 1
+                self._jobs.append(job)
+                jobs.append(dict(job))
+
+            self._save()
+            self._wake.notify()
+
+        self.start()
+        return jobs
+
+    def jobs(self, ids=None):
+        """Get copies of the jobs with the given ids, or of all the jobs that are kept"""
+        with self._lock:
+            if ids is None:
+                return [dict(job) for job in self._jobs]
+
+            ids = set(ids)
+            return [dict(job) for job in self._jobs if job["id"] in ids]
+
+    def to_dict(self):
+        with self._lock:
+            counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+            for job in self._jobs:
+                counts[job["state"]] += 1
+            return counts
+
+    def _next_job(self):
+        """Wait for a queued job that is due, and mark it as running"""
+        with self._lock:
+            while True:
+                now = time.time()
+                queued = [job for job in self._jobs if job["state"] == QUEUED]
+                due = [job for job in queued if job["not_before"] <= now]
+
+                if due:
+                    job = due[0]
+                    job["state"] = RUNNING
+                    job["attempts"] += 1
+                    job["updated"] = now
+                    self._save()
+                    return job
+
+                if queued:
+                    self._wake.wait(min(job["not_before"] for job in queued) - now)
+                else:
+                    self._wake.wait()
+
+    def _apply(self, job):
+        jc = self.get_jira_client()
+
+        if job["action"] == CLOSE_DUPLICATE:
+            jc.close_as_duplicate(job["issue"], job["duplicate_issue"])
+        elif job["action"] == CLOSE_GONEAWAY:
+            jc.close_as_goneaway(job["issue"])
+        else:
+            raise ValueError("Unknown Jira action: %s" % job["action"])
+
+    def _finish(self, job, error):
+        with self._lock:
+            now = time.time()
+            job["updated"] = now
+            job["error"] = error
+
+            if error is None:
+                job["state"] = DONE
+            elif job["attempts"] >= self.max_attempts:
+                job["state"] = FAILED
+            else:
+                job["state"] = QUEUED
+                job["not_before"] = now + self.retry_delay * 2**(job["attempts"] - 1)
+
+            # Forget the oldest finished jobs
+            finished = [j for j in self._jobs if j["state"] in (DONE, FAILED)]
+            if len(finished) > MAX_FINISHED_JOBS:
+                drop = set(j["id"] for j in finished[:len(finished) - MAX_FINISHED_JOBS])
+                self._jobs = [j for j in self._jobs if j["id"] not in drop]
+
+            self._save()
+
+    def _run(self):
+        while True:
+            job = self._next_job()
+
+            try:
+                self._apply(job)
+                error = None
+            except Exception as e:
+                print("Jira %s of %s failed (attempt %d): %s" % (job["action"], job["issue"],
+                                                                 job["attempts"], e))
+                error = str(e)
+
+            self._finish(job, error)
+
+            if error is None and self.on_done is not None:
+                try:
+                    self.on_done(dict(job))
+                except Exception as e:
+                    print("Jira %s of %s callback failed: %s" % (job["action"], job["issue"], e))
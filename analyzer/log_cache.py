@@ -0,0 +1,349 @@
+"""
+Content addressed cache of downloaded log files
+
+Logs are stored once per distinct content as compressed blobs, and an index maps each url to its
+blob. When the blobs grow past the size budget, the least recently used ones are evicted.
+
+    cache/logs/index.json            - url -> blob, raw size, last access, or the size of a log
+                                       that was too large to download
+    cache/logs/blobs/ab/abcdef...gz  - compressed log, named by the sha256 of its contents
+"""
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from . import atomic_file
+from . import counters
+from . import download
+from . import instrumentation
+
+DEFAULT_ROOT = os.path.join("cache", "logs")
+DEFAULT_BUDGET = 20 * 1024 * 1024 * 1024
+
+# Size of the chunks read when hashing and compressing a download
+CHUNK_SIZE = 1024 * 1024
+
+# Seconds between writes of the index for access times alone, see LogCache.flush
+INDEX_FLUSH_INTERVAL = 30
+
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+class NotCachedError(Exception):
+    """Raised when an offline cache is asked for a log it does not have"""
+
+    def __init__(self, url):
+        super().__init__("Log is not cached: %s" % url)
+        self.url = url
+
+
+class CacheStats(counters.Counters):
+    """Counters for a run
+       Hits - urls found in the cache the first time they were asked for
+       Misses - urls that had to be downloaded
+       Evictions - blobs removed to stay within the size budget
+       Raw bytes - uncompressed size of the downloaded logs
+       Stored bytes - compressed size of the new blobs, excluding duplicate content
+       Too large - urls skipped without a download, they were too large on an earlier run
+    """
+
+    FIELDS = (("hits", 0), ("misses", 0), ("evictions", 0), ("raw_bytes", 0), ("stored_bytes", 0),
+              ("too_large", 0))
+
+    def hit_rate(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            if lookups == 0:
+                return 0.0
+            return self.hits / lookups
+
+    def __str__(self):
+        d = self.to_dict()
+        d["hit_rate"] = self.hit_rate() * 100
+        return ("Log cache -- hits: %(hits)d, misses: %(misses)d (%(hit_rate).1f%% hit rate), " +
+                "evictions: %(evictions)d, downloaded: %(raw_bytes)d bytes, " +
+                "stored: %(stored_bytes)d bytes, too large: %(too_large)d") % d
+
+
+def _new_compressor(file):
+    """Open a compressed writer on a binary file, zstd if it is installed and gzip otherwise"""
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(file), ".zst"
+
+    return gzip.GzipFile(fileobj=file, mode="wb", compresslevel=GZIP_LEVEL, mtime=0), ".gz"
+
+
+class LogCache(object):
+    """Cache of downloaded logs, shared by the threads of a run
+
+    Call get() with a url and a retrieve function, and read the returned file with
+    log_reader.open_log or log_reader.map_log since it is compressed. An offline cache never
+    downloads, it raises NotCachedError instead.
+
+    Blobs are not evicted while they are pinned: get(..., pin=True) and lookup(..., pin=True)
+    pin the blob they return until release() is called with its path. Access times are
+    updated in memory, and written with the index when a log is stored, at most every
+    INDEX_FLUSH_INTERVAL seconds otherwise, and by flush().
+    """
+
+    def __init__(self, root=DEFAULT_ROOT, budget=DEFAULT_BUDGET, offline=False):
+        self.root = root
+        self.budget = budget
+        self.offline = offline
+        self.stats = CacheStats()
+
+        self._index_file = os.path.join(root, "index.json")
+        self._lock = threading.Lock()
+        self._url_locks = {}
+        self._seen = set()
+
+        # Blob name -> number of pins, see release
+        self._pins = {}
+
+        # Whether the index in memory has changes that are not written yet, and when it was
+        self._dirty = False
+        self._saved = time.time()
+
+        os.makedirs(os.path.join(root, "blobs"), exist_ok=True)
+        os.makedirs(os.path.join(root, "tmp"), exist_ok=True)
+
+        self._index = {}
+        if os.path.exists(self._index_file):
+            with open(self._index_file, "rb") as ifh:
+                self._index = json.loads(ifh.read().decode('utf-8'))
+
+    def _url_lock(self, url):
+        with self._lock:
+            if url not in self._url_locks:
+                self._url_locks[url] = threading.Lock()
+            return self._url_locks[url]
+
+    def _blob_path(self, blob):
+        return os.path.join(self.root, "blobs", blob[:2], blob)
+
+    def _save_index(self):
+        """Write the index, the caller holds _lock"""
+        with atomic_file.atomic_write(self._index_file, prefix=".index-") as ifh:
+            ifh.write(json.dumps(self._index).encode())
+
+        self._dirty = False
+        self._saved = time.time()
+
+    def _changed_index(self):
+        """Note a change to the index, written if the last write is old enough, the caller
+        holds _lock
+        """
+        self._dirty = True
+        if time.time() - self._saved >= INDEX_FLUSH_INTERVAL:
+            self._save_index()
+
+    def flush(self):
+        """Write the index if it has changes that are not written yet"""
+        with self._lock:
+            if self._dirty:
+                self._save_index()
+
+    def _pin(self, blob):
+        """The caller holds _lock"""
+        self._pins[blob] = self._pins.get(blob, 0) + 1
+
+    def release(self, path):
+        """Unpin a blob pinned by get or lookup, it can be evicted once it has no pins left"""
+        blob = os.path.basename(path)
+        with self._lock:
+            count = self._pins.get(blob, 0) - 1
+            if count > 0:
+                self._pins[blob] = count
+            else:
+                self._pins.pop(blob, None)
+
+    def _count_lookup(self, url, hit):
+        """Count a hit or a miss the first time a url is asked for in this run"""
+        with self._lock:
+            if url in self._seen:
+                return
+            self._seen.add(url)
+
+        self.stats.add("hits" if hit else "misses", 1)
+        instrumentation.count("cache_hits" if hit else "cache_misses")
+
+    def lookup(self, url, touch=True, pin=False):
+        """Get the path of the cached blob for url, or None. Unless touch is False, the blob is
+        marked as used. With pin, the blob is pinned until release(path).
+        """
+        with self._lock:
+            entry = self._index.get(url)
+            if entry is None or "blob" not in entry:
+                return None
+
+            path = self._blob_path(entry["blob"])
+            if not os.path.exists(path):
+                # Removed behind our back, forget about it
+                del self._index[url]
+                self._changed_index()
+                return None
+
+            if pin:
+                self._pin(entry["blob"])
+            if touch:
+                entry["last_access"] = time.time()
+                self._changed_index()
+            return path
+
+    def contains(self, url):
+        with self._lock:
+            entry = self._index.get(url)
+            return (entry is not None and "blob" in entry and
+                    os.path.exists(self._blob_path(entry["blob"])))
+
+    def content_hash(self, url):
+        """Get the sha256 of the cached log for url, or None if it is not cached"""
+        with self._lock:
+            entry = self._index.get(url)
+            if entry is None or "blob" not in entry:
+                return None
+            return os.path.splitext(entry["blob"])[0]
+
+    def _check_too_large(self, url, max_bytes):
+        """Raise download.FileTooLargeError if url was larger than max_bytes on an earlier run"""
+        with self._lock:
+            entry = self._index.get(url)
+            if max_bytes is None or entry is None or "too_large" not in entry:
+                return
+            size = entry["too_large"]
+
+        if size > max_bytes:
+            self.stats.add("too_large", 1)
+            raise download.FileTooLargeError(url, size)
+
+    def _put_too_large(self, url, size):
+        """Remember that url is at least size bytes, so later runs skip it without a download"""
+        with self._lock:
+            self._index[url] = {"too_large": size, "last_access": time.time()}
+            self._changed_index()
+
+    def get(self, url, retrieve, *args, pin=False, max_bytes=None):
+        """Get the path of the cached log for url, downloading it with
+        retrieve(url, file, *args) if it is not in the cache yet. With pin, the blob is pinned
+        until release(path).
+
+        With max_bytes, retrieve is called with max_bytes=max_bytes too, and a log it finds too
+        large is remembered: asking for it again with the same or a smaller max_bytes raises
+        download.FileTooLargeError without a download. Other exceptions from retrieve are passed
+        through and nothing is cached.
+        """
+        with self._url_lock(url):
+            self._check_too_large(url, max_bytes)
+
+            path = self.lookup(url, pin=pin)
+            self._count_lookup(url, path is not None)
+            if path is not None:
+                return path
+
+            if self.offline:
+                raise NotCachedError(url)
+
+            fd, temp_file = tempfile.mkstemp(
+                dir=os.path.join(self.root, "tmp"), prefix=".download-", suffix=".log")
+            os.close(fd)
+            try:
+                if max_bytes is None:
+                    retrieve(url, temp_file, *args)
+                else:
+                    retrieve(url, temp_file, *args, max_bytes=max_bytes)
+                return self.put(url, temp_file, pin=pin)
+            except download.FileTooLargeError as e:
+                if max_bytes is not None:
+                    self._put_too_large(url, e.size)
+                raise
+            finally:
+                if os.path.exists(temp_file):
+                    os.remove(temp_file)
+
+    def put(self, url, file, pin=False):
+        """Store an uncompressed log file for url, returns the path of its blob. With pin, the
+        blob is pinned until release(path).
+        """
+        sha = hashlib.sha256()
+        size = 0
+
+        fd, temp_blob = tempfile.mkstemp(
+            dir=os.path.join(self.root, "tmp"), prefix=".blob-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as bfh, instrumentation.span("compress"):
+                compressor, extension = _new_compressor(bfh)
+                with open(file, "rb") as lfh:
+                    for chunk in iter(lambda: lfh.read(CHUNK_SIZE), b""):
+                        sha.update(chunk)
+                        size += len(chunk)
+                        compressor.write(chunk)
+                compressor.close()
+
+            blob = sha.hexdigest() + extension
+            path = self._blob_path(blob)
+            stored = os.path.getsize(temp_blob)
+
+            with self._lock:
+                if not os.path.exists(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    os.replace(temp_blob, path)
+                    self.stats.add("stored_bytes", stored)
+
+                self._index[url] = {
+                    "blob": blob,
+                    "size": size,
+                    "stored": stored,
+                    "last_access": time.time()
+                }
+                if pin:
+                    self._pin(blob)
+                self._evict(keep=blob)
+                self._save_index()
+        finally:
+            if os.path.exists(temp_blob):
+                os.remove(temp_blob)
+
+        self.stats.add("raw_bytes", size)
+        return path
+
+    def _evict(self, keep):
+        """Remove least recently used blobs until the cache fits in the budget, the caller holds
+        _lock. The pinned blobs and keep are not removed.
+        """
+        blobs = {}
+        for url, entry in self._index.items():
+            if "blob" not in entry:
+                continue
+            blob = blobs.setdefault(entry["blob"], {"urls": [], "stored": entry["stored"],
+                                                    "last_access": 0})
+            blob["urls"].append(url)
+            blob["last_access"] = max(blob["last_access"], entry["last_access"])
+
+        total = sum(b["stored"] for b in blobs.values())
+
+        for name, blob in sorted(blobs.items(), key=lambda b: b[1]["last_access"]):
+            if total <= self.budget:
+                break
+            if name == keep or name in self._pins:
+                continue
+
+            try:
+                os.remove(self._blob_path(name))
+            except FileNotFoundError:
+                pass
+
+            for url in blob["urls"]:
+                del self._index[url]
+
+            total -= blob["stored"]
+            self.stats.add("evictions", 1)
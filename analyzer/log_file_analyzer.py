@@ -3,19 +3,33 @@
 A JS Test/Unit test log file analyzer
 """
 import argparse
+import array
+import bisect
 import io
 import json
 import os
 import pprint
 import re
+import signal
 import sys
+import threading
+import time
+
+try:
+    import regex
+except ImportError:
+    regex = None
 
 if __name__ == "__main__" and __package__ is None:
     sys.path.append(os.path.dirname(os.path.abspath(os.path.realpath(__file__))))
     print(sys.path)
     import faultinfo
+    import instrumentation
+    import log_reader
 else:
     from . import faultinfo
+    from . import instrumentation
+    from . import log_reader
 
 # LogFile -> Log File Splitter -> FaultFinders -> Faultinfo
 # LogFile - text stream
@@ -28,35 +42,114 @@ SHELL = "Shell"
 RE_SERVER = re.compile('^(([cds]|sh)[0-9]{5})')
 RE_SERVER_PREFIX = re.compile('^(([cds]|sh)[0-9]{5})\|')
 
+# Seconds a single rule may search a stream for before it is given up on, see LogFileAnalyzer
+DEFAULT_RULE_BUDGET = 60.0
+
+# Category of the context added for each rule that was given up on
+BUDGET_EXCEEDED = "analysis budget exceeded"
+
+
+# Set once a search without a limit has been reported, see _alarm_search
+_unlimited_reported = False
+
+
+class RuleBudgetExceeded(Exception):
+    """Raised when a signature searches a stream for longer than its budget"""
+    pass
+
+
+def _report_unlimited():
+    """Count a search the budget cannot be enforced on, with a warning the first time"""
+    global _unlimited_reported
+
+    instrumentation.count("rule_budget_unenforced")
+    if not _unlimited_reported:
+        _unlimited_reported = True
+        print("Warning: the rule budget is only enforced on the main thread of Unix processes " +
+              "without the regex module, searching without a limit")
+
+
+def _alarm_search(compiled, text, pos, budget):
+    """Search with a SIGALRM timer interrupting the search after budget seconds
+
+    The re module checks for signals while it backtracks, but signal handlers only run on the
+    main thread, and setitimer is Unix only. Elsewhere the search is not limited, and is counted
+    as rule_budget_unenforced.
+    """
+    on_main_thread = threading.current_thread() is threading.main_thread()
+    if not hasattr(signal, "setitimer") or not on_main_thread:
+        _report_unlimited()
+        return compiled.search(text, pos)
+
+    def on_alarm(signum, frame):
+        raise RuleBudgetExceeded()
+
+    previous = signal.signal(signal.SIGALRM, on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, budget)
+    try:
+        return compiled.search(text, pos)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+class LineIndex:
+    """Maps offsets in a joined stream back to line numbers in the log file"""
 
-class LineInfo:
-    def __init__(self, line_number, line):
-        self.line_number = line_number
-        self.line = line
+    __slots__ = ("starts", "line_numbers")
 
-        self.start = 0
+    def __init__(self):
+        # Offset of each line in the joined stream, and its line number in the log file
+        self.starts = array.array('q')
+        self.line_numbers = array.array('q')
 
-    def get_line(self):
-        return self.line
+    def append(self, start, line_number):
+        self.starts.append(start)
+        self.line_numbers.append(line_number)
 
-    def get_line_number(self):
-        return self.line_number
+    def line_number(self, offset):
+        """Get the line number of the last line that starts before offset"""
+        idx = bisect.bisect_left(self.starts, offset) - 1
+        return self.line_numbers[max(idx, 0)]
 
-    def get_start(self):
-        return self.start
 
-    def set_start(self, val):
-        self.start = val
+class LogStream:
+    """The lines from one source (test, mongod, mongos, etc) of a log file
+       Text - the lines joined with newlines, built once all lines are appended
+       Index - LineIndex of where each line starts in text
+    """
+
+    __slots__ = ("text", "index", "_lines", "_length")
+
+    def __init__(self):
+        self.text = None
+        self.index = LineIndex()
+
+        self._lines = []
+        self._length = 0
+
+    def append(self, line_number, line):
+        self.index.append(self._length, line_number)
+        self._lines.append(line)
+        self._length += len(line) + 1
 
-    def __str__(self):
-        return self.line
+    def finish(self):
+        """Join the lines, no more lines can be appended after this"""
+        self.text = '\n'.join(self._lines)
+        self._lines = None
+
+    def __len__(self):
+        return len(self.index.starts)
 
 
 class LogFileSplitter:
     """Splits various streams in a log file in separate files
+
+    The log can be a string, or a binary file or iterator of lines so that only the split
+    streams, and not the whole file, are kept in memory. See log_reader.iter_lines.
     """
 
-    def __init__(self, lstr):
+    def __init__(self, source):
         # Sinks
         # - no prefix
         # prefixed lines
@@ -69,10 +162,9 @@ class LogFileSplitter:
         )
         re_server = re.compile('^(([cds]|sh)[0-9]{5})\|')
 
-        lines = lstr.splitlines()
-        self.splits = {ROOT: [], MONGO_ROOT: [], SHELL: []}
+        self.splits = {ROOT: LogStream(), MONGO_ROOT: LogStream(), SHELL: LogStream()}
         line_number = 1
-        for line in lines:
+        for line in log_reader.iter_lines(source):
             files_match = re_files.match(line)
 
             if files_match:
@@ -88,16 +180,19 @@ class LogFileSplitter:
                     if server_match:
                         process_name = server_match.groups()[0]
                         if process_name not in self.splits:
-                            self.splits[process_name] = []
-                        self.splits[process_name].append(LineInfo(line_number, remaining))
+                            self.splits[process_name] = LogStream()
+                        self.splits[process_name].append(line_number, remaining)
                     else:
-                        self.splits[SHELL].append(LineInfo(line_number, remaining))
+                        self.splits[SHELL].append(line_number, remaining)
                 else:
-                    self.splits[MONGO_ROOT].append(LineInfo(line_number, remaining))
+                    self.splits[MONGO_ROOT].append(line_number, remaining)
             else:
-                self.splits[ROOT].append(LineInfo(line_number, line))
+                self.splits[ROOT].append(line_number, line)
             line_number += 1
 
+        for stream in self.splits.values():
+            stream.finish()
+
     def dump(self):
         for key in iter(self.splits):
             print(str(key) + ":" + str(len(self.splits[key])))
@@ -106,55 +201,319 @@ class LogFileSplitter:
         return self.splits
 
 
+class Signature:
+    """A regex that finds a fault or context in a stream, plus the literals a match must contain
+       Category - js assert, seg fault, etc
+       Pattern - regex that extracts the context, DOTALL unless single_line is set
+       Anchors - literals a match starts with, for single line signatures, literals somewhere in
+                 the matched line
+       Requires - literals that must follow the anchor in order for a match to be possible
+
+    Signatures are compiled once. A stream is only searched by the regex from the first
+    occurrence of an anchor, and only if the required literals are present, which avoids
+    having every DOTALL pattern scan and backtrack over streams that cannot match.
+    """
+
+    def __init__(self, category, pattern, anchors, requires=(), single_line=False):
+        self.category = category
+        self.pattern = pattern
+        self.anchors = anchors
+        self.requires = requires
+        self.single_line = single_line
+
+        self.regex = re.compile(pattern, flags=0 if single_line else re.DOTALL)
+
+        # Compiled with the regex module the first time a search has a budget
+        self._timed_regex = None
+
+    def search(self, index, key, budget=None):
+        """Search a stream of an AnchorIndex, returns the same match as regex.search(stream)
+
+        With a budget, raises RuleBudgetExceeded if the regex searches for longer than budget
+        seconds. The regex module's timeout is used if it is installed, and a SIGALRM timer
+        otherwise, see _alarm_search.
+        """
+        pos = -1
+        for anchor in self.anchors:
+            anchor_pos = index.find(key, anchor)
+            if anchor_pos != -1 and (pos == -1 or anchor_pos < pos):
+                pos = anchor_pos
+
+        if pos == -1:
+            return None
+
+        text = index.joins[key]
+
+        required_pos = pos
+        for literal in self.requires:
+            required_pos = text.find(literal, required_pos)
+            if required_pos == -1:
+                return None
+
+        if self.single_line:
+            # The first match is on a line containing an anchor, search from the first one
+            pos = text.rfind("\n", 0, pos) + 1
+
+        if budget is None:
+            return self.regex.search(text, pos)
+
+        if regex is None:
+            return _alarm_search(self.regex, text, pos, budget)
+
+        if self._timed_regex is None:
+            self._timed_regex = regex.compile(
+                self.pattern, flags=regex.VERSION0 | (0 if self.single_line else regex.DOTALL))
+        try:
+            return self._timed_regex.search(text, pos, timeout=budget)
+        except TimeoutError:
+            raise RuleBudgetExceeded()
+
+
+class AnchorIndex:
+    """Remembers where anchor literals first occur in each stream so each stream is scanned
+    for a literal at most once, no matter how many signatures share it
+    """
+
+    def __init__(self, joins):
+        self.joins = joins
+        self.first = {}
+
+    def find(self, key, anchor):
+        pos = self.first.get((key, anchor))
+        if pos is None:
+            pos = self.joins[key].find(anchor)
+            self.first[(key, anchor)] = pos
+        return pos
+
+
+class ContextSignature:
+    """A cheap check for a message in a stream, and the signatures that extract its context"""
+
+    def __init__(self, quick_check, detail_checks):
+        self.quick_check = quick_check
+        self.detail_checks = detail_checks
+
+
+JS_ASSERT_ANCHORS = ["assert:", "assert.soon"]
+
+STOPERROR = Signature("StopError", "StopError:.*failed.*?js", ["StopError:"], ["failed", "js"])
+
+TCMALLOC_CORRUPTION = Signature(
+    "tcmalloc memory corruption", "Found a corrupted memory buffer in MallocBlock.*?END BACKTRACE",
+    ["Found a corrupted memory buffer in MallocBlock"], ["END BACKTRACE"])
+
+PARALLEL_FAILED = Signature(
+    "parallel test failed", "Parallel Test FAILED: .*", ["Parallel Test FAILED: "],
+    single_line=True)
+
+JS_ASSERT = Signature("js assert", "assert(:|\.soon).*?failed.*?js", JS_ASSERT_ANCHORS,
+                      ["failed", "js"])
+
+MONGO_QUERY_FAILURE = Signature(
+    "mongo query failure",
+    "Error: (explain|error doing query|map reduce failed|error:).*failed.*?js",
+    ["Error: explain", "Error: error doing query", "Error: map reduce failed", "Error: error:"],
+    ["failed", "js"])
+
+FAILED_START = Signature("failed to start mongos", "Error: Failed to start mongos.*failed.*?js",
+                         ["Error: Failed to start mongos"], ["failed", "js"])
+
+FAILED_REPL_WAIT = Signature(
+    "failed to wait for replication", "Error: waiting for replication timed out.*failed.*?js",
+    ["Error: waiting for replication timed out"], ["failed", "js"])
+
+TEARDOWN = Signature(
+    "teardown failed", "mongo.*?teardown.*?wasn't.", ["teardown"], ["wasn't"], single_line=True)
+
+UNIT_TESTS = Signature("C++ Unit Test Failure", "DONE running tests.*?FAILURE.*?failed",
+                       ["DONE running tests"], ["FAILURE", "failed"])
+
+#*** C runtime error: C:\Program Files (x86)\Microsoft Visual Studio 14.0\VC\INCLUDE\xtree(326) : Assertion failed: map/set iterators incompatible, terminating
+JUST_FATAL_EXIT = [
+    Signature(
+        "c_runtime_error", "\*\*\* C runtime error.*", ["*** C runtime error"], single_line=True),
+    Signature(
+        "fassert", "aborting after fassert", ["aborting after fassert"], single_line=True)
+]
+
+LEAKS = Signature("memory leaks", "LeakSanitizer: detected memory leaks.*?SUMMARY.*?\.",
+                  ["LeakSanitizer: detected memory leaks"], ["SUMMARY", "."])
+
+BAD_EXIT = Signature("bad exit code", "exited with error code -(\d+)",
+                     ["exited with error code -"])
+
+# Tests can fail for reasons other then fasserts like access violation
+FASSERT_CONTEXT = ContextSignature(
+    Signature(None, "aborting after fassert", ["aborting after fassert"]), [
+        Signature("fassert", "Fatal [A|a]ssertion.*aborting.*?failure",
+                  ["Fatal Assertion", "Fatal assertion", "Fatal |ssertion"],
+                  ["aborting", "failure"]),
+        Signature("fassert", "aborting.*?END BACKTRACE", ["aborting"], ["END BACKTRACE"])
+    ])
+
+INVARIANT_CONTEXT = ContextSignature(
+    Signature(None, "Invariant failure", ["Invariant failure"]), [
+        Signature("invariant", "Invariant failure.*aborting.*?END BACKTRACE",
+                  ["Invariant failure"], ["aborting", "END BACKTRACE"]),
+        Signature("invariant", "Invariant failure.*aborting.*?writing minidump",
+                  ["Invariant failure"], ["aborting", "writing minidump"])
+    ])
+
+TERMINATE_CONTEXT = ContextSignature(
+    Signature(None, "terminate\(\) called", ["terminate() called"]), [
+        Signature("terminate", "terminate\(\) called.*?END BACKTRACE", ["terminate() called"],
+                  ["END BACKTRACE"]),
+        Signature("terminate", "terminate\(\) called.*?writing minidump", ["terminate() called"],
+                  ["writing minidump"])
+    ])
+
+GO_CRASH_CONTEXT = ContextSignature(
+    Signature(None, "unexpected fault address", ["unexpected fault address"]), [
+        Signature("go binary crash", "unexpected fault address.*goroutine",
+                  ["unexpected fault address"], ["goroutine"])
+    ])
+
+JS_ASSERT_CONTEXT = ContextSignature(
+    Signature(None, "assert(:|\.soon).*?failed.*?js", JS_ASSERT_ANCHORS, ["failed", "js"]),
+    [JS_ASSERT])
+
+# JS tests do not directly fail due to the leak sanitizier
+LEAKS_CONTEXT = ContextSignature(Signature(None, "LeakSanitizer", ["LeakSanitizer"]), [LEAKS])
+
+CRASH_CONTEXT = ContextSignature(
+    Signature(None, "Segmentation Fault", ["Segmentation Fault"]), [
+        Signature("segmentation fault", "Segmentation Fault.*?END BACKTRACE",
+                  ["Segmentation Fault"], ["END BACKTRACE"])
+    ])
+
+TCMALLOC_CORRUPTION_CONTEXT = ContextSignature(
+    Signature(None, "Found a corrupted memory buffer", ["Found a corrupted memory buffer"]),
+    [TCMALLOC_CORRUPTION])
+
+
+class RuleProfile:
+    """Time spent searching the streams of a log with each Signature
+       Calls - number of streams searched
+       Matches - number of searches that found a match
+       Seconds - wall time of all the searches, including the first scan for each anchor
+       Max seconds - wall time of the slowest search, and Slowest key - the stream it searched
+       Bytes - total size of the streams searched
+       Overruns - number of searches given up on after the rule budget
+    """
+
+    def __init__(self):
+        self.rules = {}
+
+    def add(self, signature, key, size, seconds, matched, exceeded=False):
+        rule = self.rules.get(signature)
+        if rule is None:
+            rule = {
+                "category": signature.category or "(quick check)",
+                "pattern": signature.pattern,
+                "calls": 0,
+                "matches": 0,
+                "seconds": 0.0,
+                "max_seconds": 0.0,
+                "slowest_key": None,
+                "bytes": 0,
+                "overruns": 0
+            }
+            self.rules[signature] = rule
+
+        rule["calls"] += 1
+        rule["matches"] += 1 if matched else 0
+        rule["seconds"] += seconds
+        rule["bytes"] += size
+        rule["overruns"] += 1 if exceeded else 0
+        if seconds >= rule["max_seconds"]:
+            rule["max_seconds"] = seconds
+            rule["slowest_key"] = key
+
+    def ranked(self):
+        """Get a copy of the stats of each rule, slowest first"""
+        return sorted((dict(r) for r in self.rules.values()), key=lambda r: -r["seconds"])
+
+    def format_table(self, limit=None):
+        lines = ["%10s %10s %6s %7s %8s %10s %-12s %s" %
+                 ("Seconds", "Max", "Calls", "Matches", "Overruns", "MB", "Slowest", "Rule")]
+        for r in self.ranked()[:limit]:
+            lines.append("%10.4f %10.4f %6d %7d %8d %10.2f %-12s %s: %s" %
+                         (r["seconds"], r["max_seconds"], r["calls"], r["matches"], r["overruns"],
+                          r["bytes"] / (1024.0 * 1024.0), r["slowest_key"], r["category"],
+                          r["pattern"]))
+        return "\n".join(lines)
+
+
 class LogFileAnalyzer:
-    def __init__(self, splits):
+    """Finds the faults and contexts in the streams of a LogFileSplitter
+
+    With profile set, the time spent in each Signature is recorded in self.profile, a
+    RuleProfile. With a rule_budget, a search that takes longer than rule_budget seconds is
+    given up on as if it did not match, and a BUDGET_EXCEEDED context names the rule. Once a
+    fault rule is given up on, the rules after it do not get to claim the fault, so the summary
+    has no fault rather than a wrong one.
+    """
+
+    def __init__(self, splits, profile=False, rule_budget=None):
         self.splits = splits
         self.joins = {}
+        self.line_indexes = {}
         self.faults = []
         self.contexts = []
+        self.profile = RuleProfile() if profile else None
+        self.rule_budget = rule_budget
+        self.budget_exceeded = False
 
         for key in self.splits:
-            start = 0
-            new_str = ""
-
-            for line in self.splits[key]:
-                line.set_start(start)
-                start = start + len(str(line)) + 1
-
-            self.joins[key] = '\n'.join([str(a) for a in self.splits[key]])
-
-    def check_all(self, re_str):
+            self.joins[key] = self.splits[key].text
+            self.line_indexes[key] = self.splits[key].index
+
+        self.index = AnchorIndex(self.joins)
+
+    def search(self, signature, key):
+        """Search a stream with a signature, every rule is evaluated through here"""
+        start = time.perf_counter()
+        exceeded = False
+
+        try:
+            match = signature.search(self.index, key, self.rule_budget)
+        except RuleBudgetExceeded:
+            match = None
+            exceeded = True
+            self.budget_exceeded = True
+            self.add_budget_exceeded(signature, key)
+
+        if self.profile is not None:
+            self.profile.add(signature, key, len(self.joins[key]), time.perf_counter() - start,
+                             match is not None, exceeded)
+        return match
+
+    def add_budget_exceeded(self, signature, key):
+        rule = "%s: %s" % (signature.category or "(quick check)", signature.pattern)
+        print("Rule exceeded its %.1fs budget on %s, skipping it - %s" % (self.rule_budget, key,
+                                                                        rule))
+
+        self.add_context(key, 0, BUDGET_EXCEEDED, rule)
+        instrumentation.count("rule_budget_exceeded")
+
+    def check_all(self, signature):
         """Check all streams"""
-        re_c = re.compile(re_str, flags=re.DOTALL)
         matches = []
         for key in iter(self.splits):
-            match = re_c.search(self.joins[key])
+            match = self.search(signature, key)
             if match:
                 matches.append({"key": key, "match": match})
 
         return matches if len(matches) > 0 else None
 
     def add_fault(self, key, start, category, context):
-        line_info = self.splits[key][0]
-        for line in self.splits[key]:
-            if start > line.get_start():
-                line_info = line
-            else:
-                break
         # TODO: add optional # of lines of context to report
-
-        self.faults.append(faultinfo.FaultInfo(key, category, context, line_info.get_line_number()))
+        self.faults.append(
+            faultinfo.FaultInfo(key, category, context, self.line_indexes[key].line_number(start)))
 
     def add_context(self, key, start, category, context):
-        line_info = self.splits[key][0]
-        for line in self.splits[key]:
-            if start > line.get_start():
-                line_info = line
-            else:
-                break
-
         self.contexts.append(
-            faultinfo.FaultInfo(key, category, context, line_info.get_line_number()))
+            faultinfo.FaultInfo(key, category, context, self.line_indexes[key].line_number(start)))
 
     def analyze(self):
         # Check for SIGKILL, SIGABORT
@@ -237,152 +596,100 @@ class LogFileAnalyzer:
         self.gather_crashes()
         self.gather_tcmalloc_corruption()
 
-    def gather_context_re(self, quick_check, detail_checks):
+    def gather_context_re(self, context_signature):
         """Iterate through each slice of the log, see if it contains a particular message, and if so, use a regex to get more information"""
-        matches = self.check_all(quick_check)
-
-        compiled = [re.compile(check[1], flags=re.DOTALL) for check in detail_checks]
+        matches = self.check_all(context_signature.quick_check)
 
         if matches:
             for match in matches:
-                log_str = self.joins[match["key"]]
-
-                for idx in range(len(detail_checks)):
-                    check = detail_checks[idx]
-                    check_re = compiled[idx]
-                    check_match = check_re.search(log_str)
+                for check in context_signature.detail_checks:
+                    check_match = self.search(check, match["key"])
                     if check_match:
                         self.add_context(match["key"],
-                                         check_match.start(), check[0], check_match.group(0))
+                                         check_match.start(), check.category, check_match.group(0))
 
     def gather_fasserts(self):
-        # Tests can fail for reasons other then fasserts
-        # like access violation
         # TODO: check shell
-        self.gather_context_re("aborting after fassert",
-                               [["fassert", "Fatal [A|a]ssertion.*aborting.*?failure"],
-                                ["fassert", "aborting.*?END BACKTRACE"]])
+        self.gather_context_re(FASSERT_CONTEXT)
 
     def gather_invariants(self):
-        # Tests can fail for reasons other then fasserts
-        # like access violation
-        self.gather_context_re("Invariant failure",
-                               [["invariant", "Invariant failure.*aborting.*?END BACKTRACE"],
-                                ["invariant", "Invariant failure.*aborting.*?writing minidump"]])
+        self.gather_context_re(INVARIANT_CONTEXT)
 
     def gather_terminates(self):
-        # Tests can fail for reasons other then fasserts
-        # like access violation
-        self.gather_context_re("terminate\(\) called",
-                               [["terminate", "terminate\(\) called.*?END BACKTRACE"],
-                                ["terminate", "terminate\(\) called.*?writing minidump"]])
+        self.gather_context_re(TERMINATE_CONTEXT)
 
     def gather_go_crashes(self):
-        # Tests can fail for reasons other then fasserts
-        # like access violation
-        self.gather_context_re("unexpected fault address",
-                               [["go binary crash", "unexpected fault address.*goroutine"]])
+        self.gather_context_re(GO_CRASH_CONTEXT)
 
     def gather_js_asserts(self):
-        self.gather_context_re("assert(:|\.soon).*?failed.*?js",
-                               [["js assert", "assert(:|\.soon).*?failed.*?js"]])
+        self.gather_context_re(JS_ASSERT_CONTEXT)
 
     def gather_leaks(self):
-        # JS tests do not directly fail due to the leak sanitizier
-        self.gather_context_re(
-            "LeakSanitizer",
-            [["memory leaks", "LeakSanitizer: detected memory leaks.*?SUMMARY.*?\."]])
+        self.gather_context_re(LEAKS_CONTEXT)
 
     def gather_crashes(self):
-        self.gather_context_re("Segmentation Fault",
-                               [["segmentation fault", "Segmentation Fault.*?END BACKTRACE"]])
+        self.gather_context_re(CRASH_CONTEXT)
 
     def gather_tcmalloc_corruption(self):
-        self.gather_context_re("Found a corrupted memory buffer", [[
-            "tcmalloc memory corruption",
-            "Found a corrupted memory buffer in MallocBlock.*?END BACKTRACE"
-        ]])
+        self.gather_context_re(TCMALLOC_CORRUPTION_CONTEXT)
 
     def base_joins(self):
         """ Loop through all the streams for reasons why tests fail"""
         for stream in [ROOT, MONGO_ROOT, SHELL]:
             yield stream, self.joins[stream]
 
-    def check_fault_re(self, checks, single_line=False):
-        if single_line:
-            re_flags = 0
-        else:
-            re_flags = re.DOTALL
-
-        compiled = [re.compile(check[1], flags=re_flags) for check in checks]
-
+    def check_fault_re(self, signatures):
         for stream_name, stream in self.base_joins():
-            for idx in range(len(checks)):
-                check = checks[idx]
-                check_re = compiled[idx]
-                check_match = check_re.search(stream)
+            for signature in signatures:
+                check_match = self.search(signature, stream_name)
                 if check_match:
-                    self.add_fault(stream_name, check_match.start(), check[0], check_match.group(0))
+                    self.add_fault(stream_name,
+                                   check_match.start(), signature.category, check_match.group(0))
+                    return True
+                if self.budget_exceeded:
+                    # The rules after one that was given up on must not claim the fault
                     return True
 
         return False
 
     def check_just_fatal_exit(self):
-        # Tests can fail for reasons other then fasserts
-        # like access violation
-        #*** C runtime error: C:\Program Files (x86)\Microsoft Visual Studio 14.0\VC\INCLUDE\xtree(326) : Assertion failed: map/set iterators incompatible, terminating
-        return self.check_fault_re([["c_runtime_error", "\*\*\* C runtime error.*"],
-                                    ["fassert", "aborting after fassert"]], True)
+        return self.check_fault_re(JUST_FATAL_EXIT)
 
     def check_mongo_query_failure(self):
-        return self.check_fault_re([[
-            "mongo query failure",
-            "Error: (explain|error doing query|map reduce failed|error:).*failed.*?js"
-        ]])
+        return self.check_fault_re([MONGO_QUERY_FAILURE])
 
     def check_failed_start(self):
-        return self.check_fault_re(
-            [["failed to start mongos", "Error: Failed to start mongos.*failed.*?js"]])
+        return self.check_fault_re([FAILED_START])
 
     def check_failed_repl_wait(self):
-        return self.check_fault_re([[
-            "failed to wait for replication",
-            "Error: waiting for replication timed out.*failed.*?js"
-        ]])
+        return self.check_fault_re([FAILED_REPL_WAIT])
 
     def check_parallel_failed(self):
-        return self.check_fault_re([["parallel test failed", "Parallel Test FAILED: .*"]], True)
+        return self.check_fault_re([PARALLEL_FAILED])
 
     def check_js_asserts(self):
-        return self.check_fault_re([["js assert", "assert(:|\.soon).*?failed.*?js"]])
+        return self.check_fault_re([JS_ASSERT])
 
     def check_teardown(self):
-        return self.check_fault_re([["teardown failed", "mongo.*?teardown.*?wasn't."]], True)
+        return self.check_fault_re([TEARDOWN])
 
     def check_just_leaks(self):
         # Unit tests directly fail due to the leak sanitizier
-        return self.check_fault_re(
-            [["memory leaks", "LeakSanitizer: detected memory leaks.*?SUMMARY.*?\."]])
+        return self.check_fault_re([LEAKS])
 
     def check_tcmalloc_corruption(self):
-        return self.check_fault_re([[
-            "tcmalloc memory corruption",
-            "Found a corrupted memory buffer in MallocBlock.*?END BACKTRACE"
-        ]])
+        return self.check_fault_re([TCMALLOC_CORRUPTION])
 
     def check_unit_tests(self):
-        shell = self.joins[SHELL]
-
-        assert_match = re.search("DONE running tests.*?FAILURE.*?failed", shell, flags=re.DOTALL)
+        assert_match = self.search(UNIT_TESTS, SHELL)
         if assert_match:
-            self.add_fault(SHELL,
-                           assert_match.start(), "C++ Unit Test Failure", assert_match.group(0))
+            self.add_fault(SHELL, assert_match.start(), UNIT_TESTS.category, assert_match.group(0))
             return True
-        return False
+        return self.budget_exceeded
 
     def check_stoperror(self):
         for stream_name, stream in self.base_joins():
-            assert_match = re.search("StopError:.*failed.*?js", stream, flags=re.DOTALL)
+            assert_match = self.search(STOPERROR, stream_name)
             if assert_match:
                 text = assert_match.group(0)
 
@@ -392,13 +699,15 @@ class LogFileAnalyzer:
                 elif "error code -6" in text:
                     self.add_fault(stream_name, assert_match.start(), "Process_Abort", text)
                 else:
-                    self.add_fault(stream_name, assert_match.start(), "StopError", text)
+                    self.add_fault(stream_name, assert_match.start(), STOPERROR.category, text)
+                return True
+            if self.budget_exceeded:
                 return True
         return False
 
     def check_bad_exit(self):
         # Check Shell Errors
-        return self.check_fault_re([["bad exit code", "exited with error code -(\d+)"]])
+        return self.check_fault_re([BAD_EXIT])
 
     def get_faults(self):
         return self.faults
@@ -415,21 +724,35 @@ def main():
     parser = argparse.ArgumentParser(description='Process log file.')
 
     parser.add_argument("files", type=str, nargs='+', help="the file to read")
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="print the rules that took the longest to evaluate on each file")
+    parser.add_argument(
+        "--top", type=int, default=10, help="number of rules to print with --profile")
+    parser.add_argument(
+        "--rule_budget",
+        type=float,
+        default=DEFAULT_RULE_BUDGET,
+        help="seconds a rule may search a stream for before it is skipped, 0 for no limit, " +
+        "without the regex module it is only enforced on the main thread of Unix processes")
     args = parser.parse_args()
 
     for file in args.files:
 
-        with open(file, "rb") as lfh:
-            log_file_str = lfh.read().decode('utf-8')
-
-        LFS = LogFileSplitter(log_file_str)
+        with log_reader.open_log(file) as lfh:
+            LFS = LogFileSplitter(lfh)
 
         s = LFS.getsplits()
 
-        analyzer = LogFileAnalyzer(s)
+        analyzer = LogFileAnalyzer(s, profile=args.profile, rule_budget=args.rule_budget or None)
 
         analyzer.analyze()
 
+        if args.profile:
+            print("Slowest rules for " + file)
+            print(analyzer.profile.format_table(args.top))
+
         faults = analyzer.get_faults()
 
         if len(faults) == 0:
@@ -0,0 +1,181 @@
+"""
+Utilities for reading cached log files without loading them into memory at once
+"""
+import contextlib
+import gzip
+import io
+import mmap
+import os
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# Bytes copied at a time when counting newlines in a memory map
+COUNT_CHUNK_SIZE = 1024 * 1024
+
+
+def open_log(file):
+    """Open a log file for reading in binary mode, gzip and zstd compressed files are
+    decompressed
+    """
+    with open(file, "rb") as lfh:
+        magic = lfh.read(len(ZSTD_MAGIC))
+
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.open(file, "rb")
+
+    if magic == ZSTD_MAGIC:
+        if zstandard is None:
+            raise ValueError("The zstandard module is needed to read " + file)
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(file, "rb"),
+                                                                            closefd=True))
+
+    return open(file, "rb")
+
+
+def iter_lines(source):
+    """Iterate the lines of a log as strings, like str.splitlines
+
+    The source can be a string, bytes, a binary file or an iterator of lines. Binary lines are
+    decoded one at a time, and invalid UTF-8 is replaced instead of failing the whole file.
+    """
+    if isinstance(source, str):
+        yield from source.splitlines()
+        return
+
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+
+    for line in source:
+        if not isinstance(line, str):
+            line = line.decode('utf-8', errors='replace')
+
+        # A binary line only ends with \n, but splitlines also splits on \r and friends
+        yield from line.splitlines()
+
+
+@contextlib.contextmanager
+def map_log(file):
+    """Map a log file into memory as a read-only bytes-like object
+
+    Plain files are memory mapped so only the pages that are scanned are read, compressed files
+    are decompressed into memory.
+    """
+    with open_log(file) as lfh:
+        if not isinstance(getattr(lfh, "raw", None), io.FileIO):
+            # Compressed
+            yield lfh.read()
+        elif os.fstat(lfh.fileno()).st_size == 0:
+            # Empty files cannot be mapped
+            yield b""
+        else:
+            with mmap.mmap(lfh.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                yield buf
+
+
+class LogBuffer:
+    """Line oriented access to a log held in a bytes-like object, such as a memory map
+
+    Searches run over the raw bytes, and only the lines that are asked for are decoded. Lines
+    are split on \\n, like str.split("\\n").
+    """
+
+    def __init__(self, buf):
+        self.buf = buf
+
+        # Newlines before _count_offset, so line numbers of increasing offsets are cheap
+        self._count_offset = 0
+        self._count = 0
+        self._line_count = None
+
+    def find_lines(self, needle):
+        """Iterate the offset of the start of each line containing needle, in order"""
+        pos = self.buf.find(needle)
+        while pos != -1:
+            start, end = self.line_bounds(pos)
+            yield start
+            pos = self.buf.find(needle, end)
+
+    def line_bounds(self, offset):
+        """Get the start and end offsets of the line containing offset, without the newline"""
+        start = self.buf.rfind(b"\n", 0, offset) + 1
+        end = self.buf.find(b"\n", offset)
+        if end == -1:
+            end = len(self.buf)
+        return start, end
+
+    def line_at(self, offset):
+        """Get the line containing offset"""
+        start, end = self.line_bounds(offset)
+        return self._decode(start, end)
+
+    def line_number(self, offset):
+        """Get the zero based index of the line containing offset"""
+        if offset < self._count_offset:
+            self._count_offset = 0
+            self._count = 0
+
+        while self._count_offset < offset:
+            end = min(offset, self._count_offset + COUNT_CHUNK_SIZE)
+            self._count += self.buf[self._count_offset:end].count(b"\n")
+            self._count_offset = end
+
+        return self._count
+
+    def line_count(self):
+        """Get the number of lines, like len(str.split("\n"))"""
+        if self._line_count is None:
+            count = 0
+            for pos in range(0, len(self.buf), COUNT_CHUNK_SIZE):
+                count += self.buf[pos:pos + COUNT_CHUNK_SIZE].count(b"\n")
+            self._line_count = count + 1
+        return self._line_count
+
+    def lines(self, offset, before_line_count, after_line_count):
+        """Get the lines around the line containing offset, like lines[idx - before:idx + after]"""
+        idx = self.line_number(offset)
+        if idx < before_line_count:
+            # A negative start counts from the end of the log, unless it is before the first line
+            first = self.line_count() + idx - before_line_count
+            if first > 0:
+                last = min(idx + after_line_count, self.line_count())
+                if first >= last:
+                    return []
+
+                # first < last, so the whole log has fewer than before + after lines
+                return self._decode(0, len(self.buf)).split("\n")[first:last]
+
+        start, end = self.line_bounds(offset)
+        line_start = start
+
+        for _ in range(before_line_count):
+            if start == 0:
+                break
+            start = self.buf.rfind(b"\n", 0, start - 1) + 1
+
+        end = line_start
+        for _ in range(after_line_count):
+            if end > len(self.buf):
+                break
+            newline = self.buf.find(b"\n", end)
+            end = len(self.buf) + 1 if newline == -1 else newline + 1
+
+        if end <= start:
+            return []
+
+        return self._decode(start, end - 1).split("\n")
+
+    def iter_lines_after(self, offset):
+        """Iterate the lines after the line containing offset"""
+        start, end = self.line_bounds(offset)
+        while end < len(self.buf):
+            start, end = self.line_bounds(end + 1)
+            yield self._decode(start, end)
+
+    def _decode(self, start, end):
+        return self.buf[start:end].decode('utf-8', errors='replace')
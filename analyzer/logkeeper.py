@@ -2,15 +2,14 @@
 
 See https://github.com/evergreen-ci/logkeeper
 """
-import requests
+from . import http_transport
 
 
-def retrieve_file(url, file):
+def retrieve_file(url, file, max_bytes=None):
+    """Stream a file to disk, raises download.FileTooLargeError if it exceeds max_bytes"""
     print("Retrieving: " + url)
 
-    r = requests.get(url)
-    with open(file, "wb") as lfh:
-        lfh.write(r.content)
+    return http_transport.get_transport().download(url, file, max_bytes=max_bytes)
 
 
 def get_raw_log_url(url):
@@ -20,7 +19,7 @@ def get_raw_log_url(url):
     return url + "?raw=1"
 
 
-def retieve_raw_log(url, file):
+def retieve_raw_log(url, file, max_bytes=None):
     url = get_raw_log_url(url)
 
-    retrieve_file(url, file)
+    return retrieve_file(url, file, max_bytes)
@@ -0,0 +1,213 @@
+"""
+SQLite store of the parsed BFs of the last query, and of their analysis results
+
+    bfg.db
+        tickets - parsed BFs of the last query, in query order, indexed by task url
+        tests   - failed tests listed in each BF
+        results - analysis result of each test or task of a BF, as {"test", "summary"} json
+        faults  - category, source and line of each fault and context of a result, indexed by
+                  category
+
+The results of a BF are replaced in a single transaction as soon as it is analyzed, so an
+interrupted run keeps the results of the BFs it finished, and the web server sees them without
+waiting for the end of the run.
+"""
+import json
+import sqlite3
+import threading
+
+DEFAULT_FILE = "bfg.db"
+
+# Columns of a parsed BF, see bfg_analyzer.bfg_fault_description
+TICKET_COLUMNS = ["issue", "summary", "type", "project", "task_url", "suite", "build_variant"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    query TEXT,
+    date TEXT
+);
+CREATE TABLE IF NOT EXISTS tickets (
+    issue TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    summary TEXT,
+    type TEXT,
+    project TEXT,
+    task_url TEXT,
+    suite TEXT,
+    build_variant TEXT
+);
+CREATE INDEX IF NOT EXISTS tickets_task_url ON tickets (task_url);
+CREATE TABLE IF NOT EXISTS tests (
+    issue TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    name TEXT,
+    log_file TEXT,
+    PRIMARY KEY (issue, position)
+);
+CREATE TABLE IF NOT EXISTS results (
+    issue TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    name TEXT,
+    test TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    PRIMARY KEY (issue, position)
+);
+CREATE TABLE IF NOT EXISTS faults (
+    issue TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    category TEXT,
+    source TEXT,
+    line_number INTEGER
+);
+CREATE INDEX IF NOT EXISTS faults_issue ON faults (issue, position);
+CREATE INDEX IF NOT EXISTS faults_category ON faults (category);
+"""
+
+
+class ResultsStore(object):
+    """Tickets and results of bfg_analyzer runs, see the module description
+
+    The ticket and result dicts returned are new objects, callers are free to modify them.
+    """
+
+    def __init__(self, file=DEFAULT_FILE):
+        self.file = file
+
+        # check_same_thread is off so the web server can share a store, the lock serializes use
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(file, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def set_tickets(self, query, date, bfs):
+        """Replace the tickets with the parsed BFs of a query
+
+        The results of the BFs that are still in the query are kept until they are analyzed
+        again, the others are forgotten.
+        """
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM runs")
+            self._db.execute("DELETE FROM tickets")
+            self._db.execute("DELETE FROM tests")
+
+            self._db.execute("INSERT INTO runs (id, query, date) VALUES (1, ?, ?)", (query, date))
+            self._db.executemany(
+                "INSERT INTO tickets (position, %s) VALUES (?, %s)" %
+                (", ".join(TICKET_COLUMNS), ", ".join(["?"] * len(TICKET_COLUMNS))),
+                [[position] + [bf[c] for c in TICKET_COLUMNS] for position, bf in enumerate(bfs)])
+            self._db.executemany(
+                "INSERT INTO tests (issue, position, name, log_file) VALUES (?, ?, ?, ?)",
+                [(bf["issue"], position, test["name"], test["log_file"])
+                 for bf in bfs for position, test in enumerate(bf["tests"])])
+
+            self._db.execute("DELETE FROM results WHERE issue NOT IN (SELECT issue FROM tickets)")
+            self._db.execute("DELETE FROM faults WHERE issue NOT IN (SELECT issue FROM tickets)")
+
+    def run(self):
+        """Get the query and date of the tickets, or None if there are none"""
+        with self._lock:
+            row = self._db.execute("SELECT query, date FROM runs").fetchone()
+
+        if row is None:
+            return None
+        return {"query": row[0], "date": row[1]}
+
+    def tickets(self):
+        """Get the parsed BFs in query order"""
+        with self._lock:
+            rows = self._db.execute("SELECT %s FROM tickets ORDER BY position" %
+                                    ", ".join(TICKET_COLUMNS)).fetchall()
+            tests = self._db.execute(
+                "SELECT issue, name, log_file FROM tests ORDER BY issue, position").fetchall()
+
+        tests_by_issue = {}
+        for issue, name, log_file in tests:
+            tests_by_issue.setdefault(issue, []).append({"name": name, "log_file": log_file})
+
+        bfs = []
+        for row in rows:
+            bf = dict(zip(TICKET_COLUMNS, row))
+            bf["tests"] = tests_by_issue.get(bf["issue"], [])
+            bfs.append(bf)
+
+        return bfs
+
+    def save_results(self, issue, results):
+        """Replace the results of a BF, a list of {"test", "summary"} dicts"""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM results WHERE issue = ?", (issue, ))
+            self._db.execute("DELETE FROM faults WHERE issue = ?", (issue, ))
+
+            for position, result in enumerate(results):
+                self._db.execute(
+                    "INSERT INTO results (issue, position, name, test, summary) " +
+                    "VALUES (?, ?, ?, ?, ?)", (issue, position, result["test"].get("name"),
+                                               json.dumps(result["test"]),
+                                               json.dumps(result["summary"])))
+
+                summary = result["summary"]
+                if not isinstance(summary, dict):
+                    continue
+
+                for kind in ("faults", "contexts"):
+                    self._db.executemany(
+                        "INSERT INTO faults (issue, position, kind, category, source, " +
+                        "line_number) VALUES (?, ?, ?, ?, ?, ?)",
+                        [(issue, position, kind, f.get("category"), f.get("source"),
+                          f.get("line_number")) for f in summary.get(kind, [])])
+
+    def results(self, issue=None, task_url=None, category=None):
+        """Get the {"test", "summary"} results of the tickets matching all the given filters, in
+        query order
+
+        category matches the results with a fault of that category.
+        """
+        sql = "SELECT r.test, r.summary FROM results r JOIN tickets t ON t.issue = r.issue"
+        clauses = []
+        args = []
+
+        if issue is not None:
+            clauses.append("r.issue = ?")
+            args.append(issue)
+        if task_url is not None:
+            clauses.append("t.task_url = ?")
+            args.append(task_url)
+        if category is not None:
+            clauses.append("EXISTS (SELECT 1 FROM faults f WHERE f.issue = r.issue AND " +
+                           "f.position = r.position AND f.kind = 'faults' AND f.category = ?)")
+            args.append(category)
+
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY t.position, r.position"
+
+        with self._lock:
+            rows = self._db.execute(sql, args).fetchall()
+
+        return [{
+            "test": json.loads(test),
+            "summary": json.loads(summary)
+        } for test, summary in rows]
+
+    def categories(self):
+        """Get the number of results with a fault of each category"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT category, COUNT(DISTINCT issue || ':' || position) FROM faults " +
+                "WHERE kind = 'faults' GROUP BY category ORDER BY category").fetchall()
+
+        return dict(rows)
+
+    def data_version(self):
+        """Get a number that changes when another connection commits to the database
+
+        The commits of this store's own connection do not change it.
+        """
+        with self._lock:
+            return self._db.execute("PRAGMA data_version").fetchone()[0]
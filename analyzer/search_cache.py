@@ -0,0 +1,162 @@
+"""
+Time based cache of Jira search results for the web server
+"""
+import collections
+import threading
+import time
+
+from . import counters
+
+DEFAULT_TTL = 5 * 60
+DEFAULT_STALE_TTL = 60 * 60
+DEFAULT_MAX_ENTRIES = 256
+
+
+class SearchCacheStats(counters.Counters):
+    """Counters for a search cache
+       Hits - searches answered from a fresh entry
+       Stale hits - searches answered from an expired entry while it is refreshed
+       Misses - searches that waited for Jira
+       Refreshes - background searches for expired entries
+       Invalidations - entries dropped because an issue in them changed
+       Jira time - seconds spent waiting for Jira, in total and for the slowest search
+    """
+
+    FIELDS = (("hits", 0), ("stale_hits", 0), ("misses", 0), ("refreshes", 0),
+              ("invalidations", 0), ("jira_searches", 0), ("jira_time", 0.0),
+              ("jira_max_time", 0.0))
+    FORMAT = ("Search cache -- hits: %(hits)d, stale hits: %(stale_hits)d, " +
+              "misses: %(misses)d, refreshes: %(refreshes)d, " +
+              "invalidations: %(invalidations)d, jira searches: %(jira_searches)d")
+
+    def add_search(self, elapsed):
+        with self._lock:
+            self.jira_searches += 1
+            self.jira_time += elapsed
+            self.jira_max_time = max(self.jira_max_time, elapsed)
+
+    def _to_dict(self):
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+            "refreshes": self.refreshes,
+            "invalidations": self.invalidations,
+            "jira_searches": self.jira_searches,
+            "jira_mean_time": self.jira_time / self.jira_searches if self.jira_searches else 0.0,
+            "jira_max_time": self.jira_max_time,
+        }
+
+
+class _Entry(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.results = None
+        self.time = 0.0
+        self.refreshing = False
+
+
+class SearchCache(object):
+    """Cache the results of jira_client.search_issues by query and fields
+
+    Results younger than ttl are returned as is. Results younger than ttl + stale_ttl are
+    returned too, but refreshed from Jira on a background thread. Older results are fetched
+    again while the caller waits, and concurrent callers for the same query share that fetch.
+    At most max_entries queries are kept, the least recently used are dropped first.
+
+    Callers must not modify the returned lists.
+    """
+
+    def __init__(self,
+                 jira_client,
+                 ttl=DEFAULT_TTL,
+                 stale_ttl=DEFAULT_STALE_TTL,
+                 max_entries=DEFAULT_MAX_ENTRIES):
+        self.jira_client = jira_client
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.stats = SearchCacheStats()
+
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+
+    def _entry(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = _Entry()
+                self._entries[key] = entry
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            else:
+                self._entries.move_to_end(key)
+            return entry
+
+    def _search(self, query, fields):
+        start = time.time()
+        results = self.jira_client.search_issues(query, fields=fields)
+        self.stats.add_search(time.time() - start)
+        return results
+
+    def _refresh(self, entry, query, fields):
+        try:
+            # Search without the entry lock, so callers keep getting the stale results meanwhile
+            results = self._search(query, fields)
+            with entry.lock:
+                entry.results = results
+                entry.time = time.time()
+        except Exception as e:
+            # Keep serving the stale results, the next caller will try again
+            print("Failed to refresh Jira search '%s': %s" % (query, e))
+        finally:
+            entry.refreshing = False
+
+    def search_issues(self, query, fields):
+        """Get the issues matching query, see the class description"""
+        key = (query, tuple(fields))
+        entry = self._entry(key)
+
+        with entry.lock:
+            age = time.time() - entry.time
+
+            if entry.results is not None and age < self.ttl:
+                self.stats.add("hits", 1)
+                return entry.results
+
+            if entry.results is not None and age < self.ttl + self.stale_ttl:
+                self.stats.add("stale_hits", 1)
+                if not entry.refreshing:
+                    entry.refreshing = True
+                    self.stats.add("refreshes", 1)
+                    threading.Thread(
+                        target=self._refresh, args=(entry, query, fields), daemon=True).start()
+                return entry.results
+
+            self.stats.add("misses", 1)
+            entry.results = self._search(query, fields)
+            entry.time = time.time()
+            return entry.results
+
+    def invalidate_issue(self, issue_key):
+        """Drop the cached searches whose results include an issue, after it was changed"""
+        with self._lock:
+            keys = [
+                key for key, entry in self._entries.items()
+                if entry.results is not None and any(r.key == issue_key for r in entry.results)
+            ]
+            for key in keys:
+                del self._entries[key]
+
+        self.stats.add("invalidations", len(keys))
+
+    def to_dict(self):
+        d = self.stats.to_dict()
+        with self._lock:
+            d["entries"] = len(self._entries)
+        d["ttl"] = self.ttl
+        d["stale_ttl"] = self.stale_ttl
+        d["max_entries"] = self.max_entries
+        return d
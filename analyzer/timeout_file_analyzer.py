@@ -12,72 +12,104 @@ if __name__ == "__main__" and __package__ is None:
     sys.path.append(os.path.dirname(os.path.abspath(os.path.realpath(__file__))))
     print(sys.path)
     import faultinfo
+    import log_reader
 else:
     from . import faultinfo
+    from . import log_reader
 
 DEFAULT_CONTEXT_LINES = 20
 
+# What to do with the first group of a rule's match
+STARTED_TEST = "started"
+COMPLETED_TEST = "completed"
+
+# What to do with the name and url groups of a rule's match
+TEST_LOG = "test log"
+HOOK_LOG = "hook log"
+
+# Per line rules, a literal every match contains and the rules to try if a line contains it.
+# Only the first rule that matches in each list is applied.
+LINE_RULES = [
+    ("Running", [
+        # JS Test Name
+        (re.compile("Running (.*\.js)"), STARTED_TEST),
+        # Unit Test
+        (re.compile("Running (.*)\.\.\."), STARTED_TEST),
+    ]),
+    ("ran in", [(re.compile("0000 (.*) ran in"), COMPLETED_TEST)]),
+    # JS Test Filter
+    ("Writing output of JSTest",
+     [(re.compile("Writing output of JSTest (.*) to (http.*/)\."), TEST_LOG)]),
+    # Unit Test Filter
+    ("Writing output of Program",
+     [(re.compile("Writing output of Program (.*) to (http.*/)\."), TEST_LOG)]),
+    ("Starting Hook",
+     [(re.compile("Starting Hook (\w+:\w+) under executor \w+\.\.\."), STARTED_TEST)]),
+    ("Writing output of Hook",
+     [(re.compile("Writing output of Hook (.+:.+) to (http.*/)\."), HOOK_LOG)]),
+    ("finished.", [(re.compile("Hook (.+:+) finished\."), COMPLETED_TEST)]),
+]
+
+INTERRUPTED_MESSAGE = "Command failed: Shell command interrupted"
+
+# Every literal in LINE_RULES, and the interrupted message, contains one of these
+LINE_KEYWORDS = [
+    b"Running", b"ran in", b"Writing output of", b"Hook", INTERRUPTED_MESSAGE.encode()
+]
+
 
 class TimeOutAnalyzer(object):
-    """Analyze a log file for a list of incomplete tests"""
+    """Analyze a log file for a list of incomplete tests
+
+    The log can be a string or a bytes-like object such as a memory map from log_reader.map_log,
+    only the lines containing one of the LINE_KEYWORDS are decoded and checked.
+    """
 
-    def __init__(self, logstr):
-        self.logstr = logstr
+    def __init__(self, log):
+        if isinstance(log, str):
+            log = log.encode('utf-8')
+
+        self.log = log_reader.LogBuffer(log)
         self.faults = []
         self.contexts = []
 
-        self.lines = self.logstr.split("\n")
-
         self.incomplete_tests = []
 
+    def candidate_lines(self):
+        """Get the offsets of the lines that contain one of the LINE_KEYWORDS, in order"""
+        offsets = set()
+        for keyword in LINE_KEYWORDS:
+            offsets.update(self.log.find_lines(keyword))
+
+        return sorted(offsets)
+
     def analyze(self):
         startedTests = []
         completedTests = []
         testLogs = {}
 
-        for idx in range(len(self.lines)):
-            line = self.lines[idx]
-
-            # JS Test Name
-            m = re.search("Running (.*\.js)", line)
-            if m:
-                startedTests.append(m.group(1))
-            else:
-                # Unit Test
-                m = re.search("Running (.*)\.\.\.", line)
-                if m:
-                    startedTests.append(m.group(1))
-
-            m = re.search("0000 (.*) ran in", line)
-            if m:
-                completedTests.append(m.group(1))
-
-            # JS Test Filter
-            m = re.search("Writing output of JSTest (.*) to (http.*/)\.", line)
-            if m:
-                test_name = os.path.basename(m.group(1))
-                testLogs[test_name] = m.group(2)
-
-            # Unit Test Filter
-            m = re.search("Writing output of Program (.*) to (http.*/)\.", line)
-            if m:
-                test_name = os.path.basename(m.group(1))
-                testLogs[test_name] = m.group(2)
-
-            m = re.search("Starting Hook (\w+:\w+) under executor \w+\.\.\.", line)
-            if m:
-                startedTests.append(m.group(1))
-
-            m = re.search("Writing output of Hook (.+:.+) to (http.*/)\.", line)
-            if m:
-                testLogs[m.group(1)] = m.group(2)
-
-            m = re.search("Hook (.+:+) finished\.", line)
-            if m:
-                completedTests.append(m.group(1))
-
-            if "Command failed: Shell command interrupted" in line:
-                self.add_fault('task interrupted', idx, 10, 5)
+        for offset in self.candidate_lines():
+            line = self.log.line_at(offset)
+
+            for literal, rules in LINE_RULES:
+                if literal not in line:
+                    continue
+
+                for rule_re, action in rules:
+                    m = rule_re.search(line)
+                    if m:
+                        if action == STARTED_TEST:
+                            startedTests.append(m.group(1))
+                        elif action == COMPLETED_TEST:
+                            completedTests.append(m.group(1))
+                        elif action == TEST_LOG:
+                            testLogs[os.path.basename(m.group(1))] = m.group(2)
+                        else:
+                            testLogs[m.group(1)] = m.group(2)
+                        break
+
+            if INTERRUPTED_MESSAGE in line:
+                self.add_fault('task interrupted', offset, 10, 5)
 
         incompleteTestsContext = {}
 
@@ -89,9 +121,10 @@ class TimeOutAnalyzer(object):
             for test, incomplete in incompleteTestsContext.items():
                 self.incomplete_tests.append({'name': test, 'log_file': incomplete})
 
-    def add_fault(self, category, line, before_line_count, after_line_count):
-        context = '\n'.join(self.lines[line - before_line_count:line + after_line_count])
-        self.faults.append(faultinfo.FaultInfo("evergreen", category, context, line))
+    def add_fault(self, category, offset, before_line_count, after_line_count):
+        context = '\n'.join(self.log.lines(offset, before_line_count, after_line_count))
+        self.faults.append(
+            faultinfo.FaultInfo("evergreen", category, context, self.log.line_number(offset)))
 
     def get_incomplete_tests(self):
         return self.incomplete_tests
@@ -115,12 +148,10 @@ def main():
 
     for file in args.files:
 
-        with open(file, "rb") as lfh:
-            log_file_str = lfh.read().decode('utf-8')
-
-        analyzer = TimeOutAnalyzer(log_file_str)
+        with log_reader.map_log(file) as log:
+            analyzer = TimeOutAnalyzer(log)
 
-        analyzer.analyze()
+            analyzer.analyze()
 
         if len(analyzer.get_incomplete_tests()) == 0:
             print("===========================")
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+Deterministic generators of synthetic resmoke logs for the benchmarks
+
+The same kind, size and seed always give the same bytes, so the logs can be generated once and
+kept on disk. The test logs interleave the output of several mongod, mongos and config servers
+(d200xx|, s200xx|, c200xx| prefixes) and of parallel shell threads, with LeakSanitizer reports on
+node restarts, and end with a fault such as a fassert and its backtrace.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+
+if __name__ == "__main__" and __package__ is None:
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(os.path.realpath(__file__)))))
+    print(sys.path)
+    __package__ = "buildbaron.benchmarks"
+
+# Kinds of logs
+TEST_LOG = "test"  # logkeeper log of a failed test, for LogFileSplitter and LogFileAnalyzer
+TASK_LOG = "task"  # evergreen log of a failed task, for EvgLogFileAnalyzer
+TIMEOUT_LOG = "timeout"  # evergreen log of a task that timed out, for TimeOutAnalyzer
+JIRA_TICKETS = "jira"  # json list of [summary, description] BF tickets, for ParseJiraTicket
+
+KINDS = [TEST_LOG, TASK_LOG, TIMEOUT_LOG, JIRA_TICKETS]
+
+# Faults a test log can end with
+FASSERT = "fassert"
+JS_ASSERT = "js_assert"
+LEAK = "leak"
+
+FAILURES = [FASSERT, JS_ASSERT, LEAK]
+
+MONGODS = ["d20010", "d20011", "d20012", "d20013", "d20014", "d20015"]
+MONGOSES = ["s20020", "s20021"]
+CONFIG_SERVERS = ["c20030"]
+
+COMPONENTS = ["NETWORK ", "COMMAND ", "REPL    ", "SHARDING", "STORAGE ", "WRITE   ", "QUERY   "]
+
+SERVER_MESSAGES = [
+    "[conn%(n)d] received client metadata from 127.0.0.1:%(port)d conn%(n)d: { driver: { name: "
+    "\"MongoDB Internal Client\", version: \"3.5.8\" }, os: { type: \"Linux\" } }",
+    "[conn%(n)d] command test.coll%(n)d command: insert { insert: \"coll%(n)d\", documents: "
+    "[ { _id: %(n)d, x: \"%(pad)s\" } ], ordered: true } ninserted:1 keysInserted:1 "
+    "numYields:0 reslen:29 locks:{ Global: { acquireCount: { r: 1, w: 1 } } } protocol:op_command "
+    "%(ms)dms",
+    "[rsSync] replSet syncing to: localhost:%(port)d",
+    "[ReplicationExecutor] Member localhost:%(port)d is now in state SECONDARY",
+    "[conn%(n)d] moveChunk data transfer progress: { active: true, ns: \"test.coll\", from: "
+    "\"shard0000\", state: \"clone\", counts: { cloned: %(n)d, clonedBytes: %(bytes)d } }",
+    "[thread%(n)d] connection accepted from 127.0.0.1:%(port)d #%(n)d (%(open)d connections now "
+    "open)",
+    "[conn%(n)d] end connection 127.0.0.1:%(port)d (%(open)d connections now open)",
+    "[WTJournalFlusher] WiredTiger message [1496776631:%(n)d][%(port)d:0x7f], txn-recover: "
+    "Main recovery loop: starting at %(n)d/%(bytes)d",
+]
+
+SHELL_MESSAGES = [
+    "[jsTest] ----",
+    "[jsTest] New session started with sessionID: { \"id\" : UUID(\"%(uuid)s\") }",
+    "ReplSetTest awaitReplication: starting: optime for primary, localhost:%(port)d, is { \"ts\" "
+    ": Timestamp(1496776631, %(n)d), \"t\" : NumberLong(1) }",
+    "ReplSetTest awaitReplication: secondary #%(open)d, localhost:%(port)d, is synced",
+    "assert.soon succeeded after %(open)d tries",
+    "Inserted %(n)d documents into test.coll%(open)d",
+]
+
+BACKTRACE_FRAMES = [
+    "mongod(_ZN5mongo15printStackTraceERSo+0x41) [0x%(addr)x]",
+    "mongod(_ZN5mongo29reportOutOfMemoryErrorAndExitEv+0x%(off)x) [0x%(addr)x]",
+    "mongod(_ZN5mongo13fassertFailedEi+0x%(off)x) [0x%(addr)x]",
+    "mongod(_ZN5mongo4repl14ReplicationCoordinatorImpl15_stepDownFinishEv+0x%(off)x) [0x%(addr)x]",
+    "libpthread.so.0(+0x7DC5) [0x%(addr)x]",
+    "libc.so.6(clone+0x6D) [0x%(addr)x]",
+]
+
+
+def parse_size(value):
+    """Parse a size such as 1048576, 64KB, 16MB or 1GB into bytes"""
+    units = {"KB": 1024, "MB": 1024 * 1024, "GB": 1024 * 1024 * 1024}
+    value = value.strip().upper()
+    for unit, multiplier in units.items():
+        if value.endswith(unit):
+            return int(float(value[:-len(unit)]) * multiplier)
+
+    return int(value)
+
+
+def format_size(size):
+    for unit, multiplier in (("GB", 1024**3), ("MB", 1024**2), ("KB", 1024)):
+        if size >= multiplier and size % multiplier == 0:
+            return "%d%s" % (size // multiplier, unit)
+
+    return str(size)
+
+
+class _Clock(object):
+    """Timestamps that move forward a few milliseconds per line"""
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.millis = 0
+
+    def tick(self):
+        self.millis += self.rng.randint(0, 3)
+        seconds, millis = divmod(self.millis, 1000)
+        minutes, seconds = divmod(seconds, 60)
+        hours, minutes = divmod(minutes, 60)
+        return "2017-06-06T%02d:%02d:%02d.%03d+0000" % (19 + hours % 5, minutes, seconds, millis)
+
+
+def _values(rng):
+    return {
+        "n": rng.randint(1, 100000),
+        "port": rng.randint(20010, 20040),
+        "open": rng.randint(1, 40),
+        "ms": rng.randint(0, 500),
+        "bytes": rng.randint(1000, 10000000),
+        "pad": "x" * rng.randint(0, 60),
+        "uuid": "%08x-0000-4000-8000-%012x" % (rng.getrandbits(32), rng.getrandbits(48)),
+        "addr": rng.getrandbits(40),
+        "off": rng.randint(16, 4096),
+    }
+
+
+def _server_line(rng, prefix, clock, process):
+    component = rng.choice(COMPONENTS)
+    message = rng.choice(SERVER_MESSAGES) % _values(rng)
+    return "%s %s %s| %s I %s %s" % (prefix, clock.tick(), process, clock.tick(), component,
+                                     message)
+
+
+def _leak_report(rng, prefix, clock, process):
+    lines = ["==%d==ERROR: LeakSanitizer: detected memory leaks" % rng.randint(100, 30000), ""]
+    total = 0
+    for _ in range(rng.randint(1, 3)):
+        size = rng.randint(8, 4096)
+        total += size
+        lines.append("Direct leak of %d byte(s) in 1 object(s) allocated from:" % size)
+        for frame in range(rng.randint(3, 8)):
+            lines.append("    #%d 0x%x in mongo::ServiceContext::makeClient() src/mongo/db/"
+                         "service_context.cpp:%d" % (frame, rng.getrandbits(40),
+                                                      rng.randint(10, 900)))
+        lines.append("")
+    lines.append("SUMMARY: AddressSanitizer: %d byte(s) leaked in 1 allocation(s)." % total)
+
+    return ["%s %s %s| %s" % (prefix, clock.tick(), process, line) for line in lines]
+
+
+def _backtrace(rng, prefix, clock, process):
+    lines = ["***aborting after fassert() failure", "", "", "----- BEGIN BACKTRACE -----",
+             "{\"backtrace\":[{\"b\":\"400000\",\"o\":\"%x\"}],\"processInfo\":{ \"mongodbVersion\""
+             " : \"3.5.8\" }}" % rng.getrandbits(24)]
+    lines += [rng.choice(BACKTRACE_FRAMES) % _values(rng) for _ in range(rng.randint(8, 20))]
+    lines.append("-----  END BACKTRACE  -----")
+
+    return ["%s %s %s| %s" % (prefix, clock.tick(), process, line) for line in lines]
+
+
+def _failure_lines(rng, failure, test, clock):
+    prefix = "[js_test:%s]" % test
+    file = "jstests/core/%s.js" % test
+    lines = []
+
+    if failure == FASSERT:
+        lines.append("%s %s d20011| %s I -        [rsBackgroundSync] Fatal assertion 28723 "
+                     "UnrecoverableRollbackError: need to rollback, but unable to determine common "
+                     "point between local and remote oplog @ 18752" % (prefix, clock.tick(),
+                                                                         clock.tick()))
+        lines += _backtrace(rng, prefix, clock, "d20011")
+        lines.append("%s %s StopError: MongoDB process on port 20011 exited with error code -6 :"
+                     % (prefix, clock.tick()))
+    elif failure == LEAK:
+        lines += _leak_report(rng, prefix, clock, "d20012")
+        lines.append("%s %s StopError: MongoDB process on port 20012 exited with error code 23 :"
+                     % (prefix, clock.tick()))
+    else:
+        lines.append("%s %s assert: [1] != [2] are not equal : documents should match" %
+                     (prefix, clock.tick()))
+        lines.append("%s %s doassert@src/mongo/shell/assert.js:18:14" % (prefix, clock.tick()))
+        lines.append("%s %s assert.eq@src/mongo/shell/assert.js:54:5" % (prefix, clock.tick()))
+        lines.append("%s %s @%s:%d:1" % (prefix, clock.tick(), file, rng.randint(10, 300)))
+
+    lines.append("%s %s failed to load: %s" % (prefix, clock.tick(), file))
+    return lines
+
+
+def iter_test_log(size, seed=0, failure=FASSERT, threads=4):
+    """Generate the lines of a failed test's log of about size bytes"""
+    rng = random.Random(seed)
+    clock = _Clock(rng)
+    processes = MONGODS + MONGOSES + CONFIG_SERVERS
+    tests = ["parallel_%d" % t for t in range(threads)]
+    written = 0
+
+    while written < size:
+        test = rng.choice(tests)
+        prefix = "[js_test:%s]" % test
+        r = rng.random()
+
+        if r < 0.80:
+            lines = [_server_line(rng, prefix, clock, rng.choice(processes))]
+        elif r < 0.97:
+            # Output of a parallel shell thread
+            message = rng.choice(SHELL_MESSAGES) % _values(rng)
+            lines = ["%s %s [thread%d] %s" % (prefix, clock.tick(), tests.index(test), message)]
+        elif r < 0.999:
+            # resmoke and fixture lines without a timestamp
+            lines = ["[MongoDFixture:job%d] mongod on port %d is ready" %
+                     (tests.index(test), rng.randint(20010, 20040))]
+        else:
+            # A node restarting, with a LeakSanitizer report
+            lines = _leak_report(rng, prefix, clock, rng.choice(MONGODS))
+
+        for line in lines:
+            written += len(line) + 1
+            yield line
+
+    for line in _failure_lines(rng, failure, rng.choice(tests), clock):
+        yield line
+
+
+def iter_task_log(size, seed=0, timed_out=False):
+    """Generate the lines of an evergreen task log of about size bytes, that ends in a failure,
+    or in the middle of a test if timed_out
+    """
+    rng = random.Random(seed)
+    clock = _Clock(rng)
+    written = 0
+    test_number = 0
+
+    def task_line(line):
+        return "[2017/06/06 19:17:%02d.%03d] %s" % (clock.millis // 1000 % 60, clock.millis % 1000,
+                                                    line)
+
+    while True:
+        test = "test_%d" % test_number
+        file = "jstests/core/%s.js" % test
+        url = "https://logkeeper.mongodb.org/build/%040x/test/%024x/" % (seed, test_number)
+        test_number += 1
+
+        lines = [
+            "[executor:js_test:job0] %s Running %s..." % (clock.tick(), file),
+            "[executor:js_test:job0] %s Writing output of JSTest %s to %s." % (clock.tick(), file,
+                                                                               url),
+        ]
+        for _ in range(rng.randint(50, 400)):
+            lines.append(_server_line(rng, "[js_test:%s]" % test, clock, rng.choice(MONGODS)))
+
+        last = written >= size
+        if not (last and timed_out):
+            hook = "ValidateCollections:job0"
+            lines += [
+                "[executor:js_test:job0] %s %s ran in 1.26 seconds." % (clock.tick(), file),
+                "[executor:js_test:job0] Starting Hook %s under executor job0..." % hook,
+                "[executor:js_test:job0] Writing output of Hook %s to %s." % (hook, url),
+                "[executor:js_test:job0] Hook %s: finished." % hook,
+            ]
+
+        for line in lines:
+            line = task_line(line)
+            written += len(line) + 1
+            yield line
+
+        if last:
+            break
+
+    if timed_out:
+        yield task_line("Command failed: Shell command interrupted")
+    else:
+        yield task_line("[executor:js_test:job0] %s Received a StopExecution exception: "
+                        "%s failed." % (clock.tick(), file))
+
+    yield task_line("Running post-task commands.")
+    yield task_line("Task completed - FAILURE.")
+
+
+def iter_jira_tickets(size, seed=0):
+    """Generate [summary, description] pairs of BF tickets with about size bytes of text"""
+    rng = random.Random(seed)
+    written = 0
+    number = 0
+
+    while written < size:
+        suite = "aggregation_read_concern_majority_passthrough_WT"
+        variant = rng.choice(["Enterprise RHEL 6.2", "Windows 2008R2", "SSL SUSE 12", "OS X 10.10"])
+        task = ("https://evergreen.mongodb.com/task/mongodb_mongo_master_%s_%d_%040x" %
+                (suite, number, rng.getrandbits(160)))
+        kind = rng.random()
+
+        tests = []
+        if kind < 0.7:
+            tests = ["jstests/core/test_%d.js" % rng.randint(1, 5000)
+                     for _ in range(rng.randint(1, 6))]
+            summary = "Failures: %s on %s (%s) [MongoDB (master) @ %08x]" % (
+                suite, variant, ", ".join(os.path.basename(t) for t in tests), number)
+        elif kind < 0.85:
+            summary = "Timed Out: %s on %s [MongoDB (master) @ %08x]" % (suite, variant, number)
+        else:
+            summary = "System Failure: %s on %s [MongoDB (master) @ %08x]" % (suite, variant,
+                                                                               number)
+
+        lines = [
+            "",
+            "h2. [%s failed on %s|%s]" % (suite, variant, task),
+            "Host: [ec2-54-161-188-84.compute-1.amazonaws.com|https://evergreen.mongodb.com/host/"
+            "sir-%08x]" % number,
+            "Project: [MongoDB (master)|https://evergreen.mongodb.com/waterfall/"
+            "mongodb-mongo-master]",
+        ]
+        for test in tests:
+            lines.append("*%s* - [Logs|https://logkeeper.mongodb.org/build/%032x/test/%024x/] | "
+                         "[History|https://evergreen.mongodb.com/task_history/mongodb-mongo-master/"
+                         "%s#%s=fail]" % (test, rng.getrandbits(128), rng.getrandbits(96), suite,
+                                          os.path.basename(test)))
+        description = "\n".join(lines) + "\n"
+
+        number += 1
+        written += len(summary) + len(description)
+        yield [summary, description]
+
+
+def file_name(kind, size, seed):
+    return "%s-%s-%d.%s" % (kind, format_size(size), seed, "json" if kind == JIRA_TICKETS else
+                            "log")
+
+
+def write_log(kind, size, seed, directory):
+    """Generate a log into directory, unless it is already there, returns its path"""
+    path = os.path.join(directory, file_name(kind, size, seed))
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(directory, exist_ok=True)
+    temp_path = path + ".tmp"
+
+    with open(temp_path, "w", encoding="utf-8", newline="\n") as lfh:
+        if kind == JIRA_TICKETS:
+            json.dump(list(iter_jira_tickets(size, seed)), lfh)
+        else:
+            if kind == TEST_LOG:
+                lines = iter_test_log(size, seed, FAILURES[seed % len(FAILURES)])
+            else:
+                lines = iter_task_log(size, seed, timed_out=kind == TIMEOUT_LOG)
+
+            for line in lines:
+                lfh.write(line)
+                lfh.write("\n")
+
+    os.replace(temp_path, path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic resmoke log.')
+
+    parser.add_argument("kind", choices=KINDS, help="kind of log")
+    parser.add_argument("--size", type=str, default="1MB", help="size such as 64KB, 16MB or 1GB")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for the log")
+    parser.add_argument("--dir", type=str, default=".", help="directory to write the log in")
+    args = parser.parse_args()
+
+    print(write_log(args.kind, parse_size(args.size), args.seed, args.dir))
+
+
+if __name__ == '__main__':
+    main()
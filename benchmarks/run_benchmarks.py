@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Benchmark the analyzer hot paths over synthetic resmoke logs, and compare with a baseline
+
+Each benchmark runs in a fresh process so its peak RSS is its own. The logs are generated by
+benchmarks/resmoke_log.py into --dir the first time, and reused after that. Everything runs
+offline.
+
+    python3 benchmarks/run_benchmarks.py --sizes 1MB,64MB --save_baseline baseline.json
+    python3 benchmarks/run_benchmarks.py --sizes 1MB,64MB --baseline baseline.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+if __name__ == "__main__" and __package__ is None:
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(os.path.realpath(__file__)))))
+    print(sys.path)
+    __package__ = "buildbaron.benchmarks"
+
+import buildbaron.analyzer.evg_log_file_analyzer
+import buildbaron.analyzer.log_file_analyzer
+import buildbaron.analyzer.log_reader
+import buildbaron.analyzer.timeout_file_analyzer
+import buildbaron.benchmarks.resmoke_log
+import buildbaron.bfg_analyzer
+
+DEFAULT_SIZES = "1MB,16MB"
+DEFAULT_REPEAT = 3
+DEFAULT_DIR = os.path.join("cache", "benchmarks")
+
+# Allowed slowdown, or growth of the peak RSS, before a result is reported as a regression
+DEFAULT_TOLERANCE = 0.10
+
+# Benchmark name -> kind of log it reads
+BENCHMARKS = [
+    ("LogFileSplitter", buildbaron.benchmarks.resmoke_log.TEST_LOG),
+    ("LogFileAnalyzer.analyze", buildbaron.benchmarks.resmoke_log.TEST_LOG),
+    ("EvgLogFileAnalyzer.analyze", buildbaron.benchmarks.resmoke_log.TASK_LOG),
+    ("TimeOutAnalyzer.analyze", buildbaron.benchmarks.resmoke_log.TIMEOUT_LOG),
+    ("ParseJiraTicket", buildbaron.benchmarks.resmoke_log.JIRA_TICKETS),
+]
+
+
+def peak_rss_mb():
+    """Get the peak RSS of this process in MB, or None where the resource module is missing"""
+    if resource is None:
+        return None
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return rss / (1024.0 * 1024.0)
+    return rss / 1024.0
+
+
+def count_lines(path):
+    count = 0
+    with open(path, "rb") as lfh:
+        for chunk in iter(lambda: lfh.read(1024 * 1024), b""):
+            count += chunk.count(b"\n")
+    return count
+
+
+def _prepare(name, path):
+    """Load what a benchmark needs before it is timed, returns (setup, line count)"""
+    if name == "LogFileAnalyzer.analyze":
+        with buildbaron.analyzer.log_reader.open_log(path) as lfh:
+            splitter = buildbaron.analyzer.log_file_analyzer.LogFileSplitter(lfh)
+        return splitter.getsplits(), count_lines(path)
+
+    if name == "ParseJiraTicket":
+        with open(path, "r", encoding="utf-8") as tfh:
+            tickets = json.load(tfh)
+        return tickets, sum(description.count("\n") + 1 for summary, description in tickets)
+
+    return None, count_lines(path)
+
+
+def _run_once(name, path, setup):
+    if name == "LogFileSplitter":
+        with buildbaron.analyzer.log_reader.open_log(path) as lfh:
+            buildbaron.analyzer.log_file_analyzer.LogFileSplitter(lfh)
+    elif name == "LogFileAnalyzer.analyze":
+        analyzer = buildbaron.analyzer.log_file_analyzer.LogFileAnalyzer(setup)
+        analyzer.analyze()
+    elif name == "EvgLogFileAnalyzer.analyze":
+        with buildbaron.analyzer.log_reader.map_log(path) as log:
+            analyzer = buildbaron.analyzer.evg_log_file_analyzer.EvgLogFileAnalyzer(log)
+            analyzer.analyze()
+    elif name == "TimeOutAnalyzer.analyze":
+        with buildbaron.analyzer.log_reader.map_log(path) as log:
+            analyzer = buildbaron.analyzer.timeout_file_analyzer.TimeOutAnalyzer(log)
+            analyzer.analyze()
+    elif name == "ParseJiraTicket":
+        for number, (summary, description) in enumerate(setup):
+            buildbaron.bfg_analyzer.ParseJiraTicket(number, summary, description)
+    else:
+        raise ValueError("Unknown benchmark: %s" % name)
+
+
+def run_benchmark(name, path, repeat):
+    """Run a benchmark repeat times in this process, returns its result with the best time"""
+    setup, line_count = _prepare(name, path)
+
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        _run_once(name, path, setup)
+        elapsed = time.perf_counter() - start
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    size_mb = os.path.getsize(path) / (1024.0 * 1024.0)
+    return {
+        "seconds": best,
+        "size_mb": size_mb,
+        "lines": line_count,
+        "mb_per_s": size_mb / best,
+        "lines_per_s": line_count / best,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_isolated(name, path, repeat):
+    """Run a benchmark in a new process, so the peak RSS is only its own"""
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1) as pool:
+        return pool.apply(run_benchmark, (name, path, repeat))
+
+
+def compare(result, baseline, tolerance):
+    """Get the list of regressions of a result from its baseline"""
+    regressions = []
+
+    if result["mb_per_s"] < baseline["mb_per_s"] * (1 - tolerance):
+        regressions.append("throughput %.2f MB/s, baseline %.2f MB/s" % (result["mb_per_s"],
+                                                                          baseline["mb_per_s"]))
+
+    if (result["peak_rss_mb"] is not None and baseline.get("peak_rss_mb") is not None and
+            result["peak_rss_mb"] > baseline["peak_rss_mb"] * (1 + tolerance)):
+        regressions.append("peak RSS %.1f MB, baseline %.1f MB" % (result["peak_rss_mb"],
+                                                                   baseline["peak_rss_mb"]))
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the log analyzers.')
+
+    parser.add_argument(
+        "--sizes",
+        type=str,
+        default=DEFAULT_SIZES,
+        help="comma separated log sizes, from 1MB to 1GB")
+    parser.add_argument(
+        "--benchmarks",
+        type=str,
+        help="comma separated benchmarks to run, all by default: " + ", ".join(
+            name for name, kind in BENCHMARKS))
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="runs, best is kept")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for the logs")
+    parser.add_argument(
+        "--dir", type=str, default=DEFAULT_DIR, help="directory to keep the generated logs in")
+    parser.add_argument("--baseline", type=str, help="json results to compare with")
+    parser.add_argument("--save_baseline", type=str, help="save the results as json to this file")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help="fraction of slowdown or peak RSS growth reported as a regression")
+    args = parser.parse_args()
+
+    sizes = [buildbaron.benchmarks.resmoke_log.parse_size(s) for s in args.sizes.split(",")]
+
+    benchmarks = BENCHMARKS
+    if args.benchmarks:
+        names = args.benchmarks.split(",")
+        unknown = set(names) - set(name for name, kind in BENCHMARKS)
+        if unknown:
+            parser.error("unknown benchmarks: %s" % ", ".join(sorted(unknown)))
+        benchmarks = [b for b in BENCHMARKS if b[0] in names]
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, "rb") as bfh:
+            baseline = json.loads(bfh.read().decode('utf-8'))
+
+    results = {}
+    regression_count = 0
+
+    print("%-28s %8s %10s %12s %10s" % ("Benchmark", "Size", "MB/s", "lines/s", "Peak RSS"))
+    for size in sizes:
+        for name, kind in benchmarks:
+            path = buildbaron.benchmarks.resmoke_log.write_log(kind, size, args.seed, args.dir)
+
+            key = "%s:%s" % (name, buildbaron.benchmarks.resmoke_log.format_size(size))
+            result = run_isolated(name, path, args.repeat)
+            results[key] = result
+
+            rss = "-" if result["peak_rss_mb"] is None else "%.1f MB" % result["peak_rss_mb"]
+            print("%-28s %8s %10.2f %12.0f %10s" %
+                  (name, buildbaron.benchmarks.resmoke_log.format_size(size), result["mb_per_s"],
+                   result["lines_per_s"], rss))
+
+            if key in baseline:
+                for regression in compare(result, baseline[key], args.tolerance):
+                    print("    REGRESSION: " + regression)
+                    regression_count += 1
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf8") as bfh:
+            json.dump(results, bfh, indent="\t", sort_keys=True)
+
+    if regression_count:
+        print("%d regressions from %s" % (regression_count, args.baseline))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
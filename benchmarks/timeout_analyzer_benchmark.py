@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark TimeOutAnalyzer over a synthetic resmoke task log
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+if __name__ == "__main__" and __package__ is None:
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(os.path.realpath(__file__)))))
+    print(sys.path)
+    __package__ = "buildbaron.benchmarks"
+
+import buildbaron.analyzer.timeout_file_analyzer
+
+DEFAULT_LINES = 500000
+DEFAULT_REPEAT = 3
+
+LOGKEEPER_URL = "https://logkeeper.mongodb.org/build/%s/test/%s/"
+
+PREFIX = "[2017/06/06 19:17:11.%03d] "
+
+# Noise lines that contain none of the rule literals
+NOISE_LINES = [
+    "[js_test:%s] 2017-06-06T19:17:11.%03d+0000 d20010| 2017-06-06T19:17:11.042+0000 I NETWORK  "
+    "[conn%d] received client metadata from 127.0.0.1:51124 conn1: { driver: { name: \"MongoDB "
+    "Internal Client\", version: \"3.5.8\" } }",
+    "[js_test:%s] 2017-06-06T19:17:11.%03d+0000 d20011| 2017-06-06T19:17:11.042+0000 I COMMAND  "
+    "[conn%d] command test.foo command: insert { insert: \"foo\", documents: 1000 } 12ms",
+    "[js_test:%s] 2017-06-06T19:17:11.%03d+0000 s20014| 2017-06-06T19:17:11.042+0000 I SHARDING "
+    "[conn%d] moveChunk data transfer progress: { active: true, state: \"clone\" }",
+]
+
+# Noise lines that contain a rule literal without matching any rule
+NEAR_MISS_LINES = [
+    "[js_test:%s] 2017-06-06T19:17:11.%03d+0000 d20010| I REPL     [rsSync] Running initial sync "
+    "attempt %d",
+    "[js_test:%s] 2017-06-06T19:17:11.%03d+0000 d20010| I -        [conn%d] Hook registered",
+]
+
+
+def generate_log(line_count, seed=0):
+    """Generate a resmoke task log with about line_count lines that times out in its last test"""
+    rng = random.Random(seed)
+    lines = []
+    test_number = 0
+
+    while len(lines) < line_count:
+        test = "test_%d" % test_number
+        test_number += 1
+        file = "jstests/core/%s.js" % test
+        millis = rng.randint(0, 999)
+
+        lines.append(PREFIX % millis + "[executor:js_test:job0] 2017-06-06T19:17:11.%03d+0000 "
+                     "Running %s..." % (millis, file))
+        lines.append(PREFIX % millis + "[executor:js_test:job0] 2017-06-06T19:17:11.%03d+0000 "
+                     "Writing output of JSTest %s to %s." %
+                     (millis, file, LOGKEEPER_URL % ("abc", test_number)))
+
+        for _ in range(rng.randint(50, 400)):
+            if rng.random() < 0.02:
+                line = rng.choice(NEAR_MISS_LINES)
+            else:
+                line = rng.choice(NOISE_LINES)
+            lines.append(PREFIX % millis + line % (test, millis, rng.randint(1, 1000)))
+
+        if len(lines) < line_count:
+            lines.append(PREFIX % millis + "[executor:js_test:job0] 2017-06-06T19:17:11.%03d+0000 "
+                         "%s ran in 1.26 seconds." % (millis, file))
+            hook = "ValidateCollections:job0"
+            lines.append(PREFIX % millis + "[executor:js_test:job0] Writing output of Hook %s to "
+                         "%s." % (hook, LOGKEEPER_URL % ("abc", test_number)))
+            lines.append(PREFIX % millis + "[executor:js_test:job0] Hook %s: finished." % hook)
+
+    return "\n".join(lines).encode("utf-8")
+
+
+def run(log, repeat):
+    """Analyze log repeat times, returning the best time and the incomplete tests"""
+    best = None
+    incomplete_tests = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        analyzer = buildbaron.analyzer.timeout_file_analyzer.TimeOutAnalyzer(log)
+        analyzer.analyze()
+        elapsed = time.perf_counter() - start
+
+        if best is None or elapsed < best:
+            best = elapsed
+        incomplete_tests = analyzer.get_incomplete_tests()
+
+    return best, incomplete_tests
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark TimeOutAnalyzer.')
+
+    parser.add_argument("--lines", type=int, default=DEFAULT_LINES, help="lines in the log")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="runs, best is kept")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for the log")
+    parser.add_argument("--file", type=str, help="analyze this log instead of a synthetic one")
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, "rb") as lfh:
+            log = lfh.read()
+    else:
+        log = generate_log(args.lines, args.seed)
+
+    line_count = log.count(b"\n") + 1
+    elapsed, incomplete_tests = run(log, args.repeat)
+
+    print("Lines: %d, size: %.2f MB" % (line_count, len(log) / (1024.0 * 1024.0)))
+    print("Incomplete tests: %s" % [t["name"] for t in incomplete_tests])
+    print("Best of %d: %.3fs, %.0f lines/s, %.2f MB/s" %
+          (args.repeat, elapsed, line_count / elapsed, len(log) / (1024.0 * 1024.0) / elapsed))
+
+
+if __name__ == '__main__':
+    main()
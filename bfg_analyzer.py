@@ -4,6 +4,7 @@ Script to analyze the Jira Build Baron Queue
 """
 import argparse
 import binascii
+import concurrent.futures
 import datetime
 import dateutil
 import dateutil.relativedelta
@@ -12,26 +13,37 @@ import json
 import os
 import pprint
 import re
-import stat
 import string
 import sys
+import traceback
 
 import requests
 
 # Global override
 UPDATE_JIRA = False
 
+# Test logs larger than this are not downloaded or analyzed
+MAX_TEST_LOG_SIZE = 500 * 1024 * 1024
+
 if __name__ == "__main__" and __package__ is None:
     sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(os.path.realpath(__file__)))))
     print(sys.path)
 
+import buildbaron.analyzer.analysis_pool
 import buildbaron.analyzer.analyzer_config
+import buildbaron.analyzer.atomic_file
+import buildbaron.analyzer.download
 import buildbaron.analyzer.evergreen
-import buildbaron.analyzer.evg_log_file_analyzer
+import buildbaron.analyzer.faultinfo
+import buildbaron.analyzer.fingerprint
+import buildbaron.analyzer.http_transport
+import buildbaron.analyzer.instrumentation
 import buildbaron.analyzer.jira_client
+import buildbaron.analyzer.jira_sync
+import buildbaron.analyzer.log_cache
 import buildbaron.analyzer.log_file_analyzer
 import buildbaron.analyzer.logkeeper
-import buildbaron.analyzer.timeout_file_analyzer
+import buildbaron.analyzer.results_store
 
 
 # URL of the default Jira server.
@@ -80,6 +92,11 @@ def ParseJiraTicket(issue, summary, description):
                                  tests)
 
 
+def parse_issue(issue):
+    """Parse a Jira issue into the dictionary form of a bfg_fault_description"""
+    return ParseJiraTicket(issue.key, issue.fields.summary, issue.fields.description).to_dict()
+
+
 class bfg_fault_description:
     """Parse a fault description into type"""
 
@@ -93,6 +110,18 @@ class bfg_fault_description:
         self.build_variant = build_variant
         self.tests = tests
 
+    def to_dict(self):
+        return {
+            "issue": self.issue,
+            "summary": self.summary,
+            "type": self.type,
+            "task_url": self.task_url,
+            "project": self.project,
+            "suite": self.suite,
+            "build_variant": self.build_variant,
+            "tests": [dict(test) for test in self.tests]
+        }
+
     def to_json(self):
         return json.dumps(self, cls=BFGCustomEncoder)
 
@@ -100,16 +129,7 @@ class bfg_fault_description:
 class BFGCustomEncoder(json.JSONEncoder):
     def default(self, obj):
         if isinstance(obj, bfg_fault_description):
-            return {
-                "issue": obj.issue,
-                "summary": obj.summary,
-                "type": obj.type,
-                "task_url": obj.task_url,
-                "project": obj.project,
-                "suite": obj.suite,
-                "build_variant": obj.build_variant,
-                "tests": obj.tests
-            }
+            return obj.to_dict()
 
         # Let the base class default method raise the TypeError
         return json.JSONEncoder.default(self, obj)
@@ -131,57 +151,333 @@ class BFGCustomDecoder(json.JSONDecoder):
 class bfg_analyzer(object):
     """description of class"""
 
-    def __init__(self, jira_client):
+    def __init__(self,
+                 jira_client,
+                 workers=1,
+                 log_cache=None,
+                 issue_store=None,
+                 results_store=None,
+                 analyze_procs=1,
+                 rule_budget=buildbaron.analyzer.log_file_analyzer.DEFAULT_RULE_BUDGET):
         self.jira_client = jira_client
         self.evg_client = buildbaron.analyzer.evergreen.client()
         self.pp = pprint.PrettyPrinter()
+        self.workers = workers
+        self.analyze_procs = analyze_procs
+        self.rule_budget = rule_budget
+
+        if log_cache is None:
+            log_cache = buildbaron.analyzer.log_cache.LogCache()
+        self.log_cache = log_cache
 
-    def query(self, query_str):
-        #results = self.jira_client.search_issues("project = bfg AND resolution is EMPTY AND created > 2017-01-25 AND created <= 2017-02-01 and summary ~ Timed ORDER BY created DESC", maxResults=25)
-        results = self.jira_client.search_issues(query_str, maxResults=100)
+        # Created on the first query, so --reanalyze does not need it
+        self.issue_store = issue_store
 
-        print("Result Count %d" % len(results))
+        if results_store is None:
+            results_store = buildbaron.analyzer.results_store.ResultsStore()
+        self.results_store = results_store
 
-        bfs = []
+        # How the cached summaries were used in this run
+        self.summary_stats = {"reused": 0, "stale": 0, "new": 0}
 
-        for result in results:
-            bfs.append(
-                ParseJiraTicket(result.key, result.fields.summary, result.fields.description))
+        # OOM killer verdict of each task in this run, by task hash
+        self._oom_verdicts = {}
 
-        # Save to disk to help investigation of bad results
-        bfs_str = json.dumps(bfs, cls=BFGCustomEncoder, indent="\t")
-        with open("bfs.json", "wb") as sjh:
-            sjh.write(bfs_str.encode())
+        # Only set while check_logs is downloading on a thread pool
+        self._executor = None
+        self._fetches = {}
+
+        # Exception of each BF that failed before process_bf_isolated, by issue, it reports them
+        self._bf_errors = {}
+
+        # Replaced by a pool of analyze_procs processes while check_logs runs
+        self._analysis_pool = buildbaron.analyzer.analysis_pool.AnalysisPool(
+            rule_budget=rule_budget)
+
+        # (kind, log file) of the prefetched analyses, their blobs are pinned in the log cache
+        # until they are used
+        self._prefetched = set()
+
+    def query(self, query_str, full=False):
+        """Sync the BFs matching a query from Jira, only new and updated BFs are fetched and
+        parsed unless full is set
+        """
+        if self.issue_store is None:
+            self.issue_store = buildbaron.analyzer.jira_sync.IssueStore()
 
-        # Return a list of dictionaries instead of a list of bfg_fault_description
-        return json.loads(bfs_str)
+        bfs = self.issue_store.sync(self.jira_client, query_str, parse_issue, full)
+
+        print("Result Count %d" % len(bfs))
+
+        # Save to disk to help investigation of bad results, and for --reanalyze. The BFs are
+        # returned from the store so the analysis can add to them without changing the issue
+        # store's copies.
+        self.results_store.set_tickets(query_str,
+                                       datetime.datetime.now().isoformat(' '), bfs)
+
+        return self.results_store.tickets()
+
+    def load_bfs(self):
+        """Load the BFs saved by the last query"""
+        bfs = self.results_store.tickets()
+        print("Loaded %d BFs from %s" % (len(bfs), self.results_store.file))
+        return bfs
 
     def check_logs(self, bfs):
-        results = []
+        """Analyze the logs of a list of BFs, returns the results in ticket order
+
+        With more than one analyze_procs, the logs are analyzed on a pool of processes as soon
+        as they are in the cache, and the results are collected here in ticket order.
+        """
+        inline_pool = self._analysis_pool
 
-        for bf in bfs:
-            self.process_bf(bf, results)
+        try:
+            with buildbaron.analyzer.analysis_pool.AnalysisPool(self.analyze_procs,
+                                                                self.rule_budget) as pool:
+                self._analysis_pool = pool
 
-        return results
+                if self.workers > 1:
+                    return self.check_logs_concurrent(bfs)
+
+                if self.analyze_procs > 1:
+                    for bf in bfs:
+                        self.preanalyze_bf(bf)
+
+                results = []
+
+                for bf in bfs:
+                    results += self.process_bf_isolated(bf)
+
+                return results
+        finally:
+            self._analysis_pool = inline_pool
+
+            # The workers are stopped, so the analyses that were never used are done with
+            # their blobs
+            for kind, log_file in self._prefetched:
+                self.log_cache.release(log_file)
+            self._prefetched = set()
+
+            self.log_cache.flush()
+
+    def check_logs_concurrent(self, bfs):
+        """Download logs on a pool of threads while analyzing the BFs in ticket order
+
+        The downloads for every BF, and every test in it, are queued up front on a bounded
+        thread pool since we are network bound. The analysis is CPU bound so it stays on this
+        thread, and it picks up each BF in query order as soon as its logs are in the cache.
+        """
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+            self._executor = executor
+            self._fetches = {}
+
+            try:
+                fetches = [self.prefetch_bf(bf) for bf in bfs]
+
+                # BFs whose analysis is not queued on the process pool yet
+                pending = list(zip(bfs, fetches))
+
+                results = []
+                for bf, futures in zip(bfs, fetches):
+                    # Download errors are ignored here, process_bf retries and reports them
+                    if self.analyze_procs > 1:
+                        pending = self.wait_and_preanalyze(futures, pending)
+                    else:
+                        concurrent.futures.wait(futures)
+                    results += self.process_bf_isolated(bf)
+            finally:
+                self._executor = None
+                self._fetches = {}
 
-    # TODO: parallelize the check_logs function with this since we are network bound
-    # builds = thread_map( lambda item : process_bf(base_url, item), commits)
-    def thread_map(func, items):
-        # We can use a with statement to ensure threads are cleaned up promptly
-        with concurrent.futures.ThreadPoolExecutor(max_workers=cpu_count() * 2) as executor:
-            # Start the load operations and mark each future with its URL
-            future_to_item = {executor.submit(func, item): item for item in items}
-            results = []
-            for future in concurrent.futures.as_completed(future_to_item):
-                item = future_to_item[future]
-                try:
-                    nf = future.result()
-                    if nf:
-                        results += nf
-                except Exception as exc:
-                    print('%r generated an exception: %s' % (item, exc))
         return results
 
+    def process_bf_isolated(self, bf):
+        """Process a BF, and turn any exception into a result so one bad BF does not stop a run
+
+        The results are saved in the results store before returning.
+        """
+        bf_results = []
+
+        with buildbaron.analyzer.instrumentation.bf_context(bf['issue']):
+            try:
+                error = self._bf_errors.pop(bf['issue'], None)
+                if error is not None:
+                    raise error
+
+                with buildbaron.analyzer.instrumentation.span("process_bf"):
+                    self.process_bf(bf, bf_results)
+            except Exception as e:
+                print("===========================")
+                print("Exception while processing BF: " + self.pp.pformat(bf))
+                traceback.print_exc()
+                print("===========================")
+
+                buildbaron.analyzer.instrumentation.count("bf_exceptions")
+
+                error_test = dict(bf)
+                error_test.setdefault('name', 'task')
+                bf_results.append({"test": error_test, "summary": "Analysis Exception : " + str(e)})
+
+            with buildbaron.analyzer.instrumentation.span("write_results"):
+                self.results_store.save_results(bf['issue'], bf_results)
+
+        return bf_results
+
+    def submit_fetch(self, retrieve, url, *args, max_bytes=None):
+        """Queue a download into the log cache unless the url is already cached or queued"""
+        if self.log_cache.contains(url):
+            return None
+
+        future = self._fetches.get(url)
+        if future is None:
+            future = self._executor.submit(
+                buildbaron.analyzer.instrumentation.wrap(self.log_cache.get), url, retrieve, *args,
+                max_bytes=max_bytes)
+            self._fetches[url] = future
+
+        return future
+
+    def run_isolated(self, bf, fn, *args):
+        """Run fn(*args) for a BF before it is processed, returns None if it raised
+
+        The exception is kept for process_bf_isolated to report as the BF's result, so one bad
+        BF does not stop the run.
+        """
+        try:
+            return fn(*args)
+        except Exception as e:
+            print("Exception while preparing BF %s: %s" % (bf['issue'], e))
+            self._bf_errors.setdefault(bf['issue'], e)
+            return None
+
+    def prefetch_bf(self, bf):
+        """Queue the downloads process_bf will need for a BF, returns a list of futures"""
+        with buildbaron.analyzer.instrumentation.bf_context(bf['issue']):
+            return self.run_isolated(bf, self._prefetch_bf, bf) or []
+
+    def _prefetch_bf(self, bf):
+        self.create_bf_cache(bf)
+
+        bf['system_log_url'] = buildbaron.analyzer.evergreen.task_get_system_raw_log(bf['task_url'])
+        bf['task_log_file_url'] = buildbaron.analyzer.evergreen.task_get_task_raw_log(
+            bf["task_url"])
+
+        futures = []
+        if bf['type'] == 'test_failure':
+            # Every test failure is checked for the OOM killer in the system log
+            if self.load_oom_verdict(bf) is None:
+                futures.append(
+                    self.submit_fetch(self.evg_client.retrieve_file, bf['system_log_url']))
+            futures += self.prefetch_tests(bf, bf['tests'])
+        elif not self.has_current_summary(os.path.join(bf["bf_cache"], "summary.json")):
+            futures.append(
+                self.submit_fetch(self.evg_client.retrieve_file, bf['task_log_file_url']))
+
+        return [f for f in futures if f is not None]
+
+    def prefetch_tests(self, bf, tests):
+        """Queue the logkeeper downloads for a list of tests, returns a list of futures"""
+        futures = []
+
+        for test in tests:
+            self.create_test_cache(bf, test)
+
+            # Already analyzed, process_test will not need the log
+            if self.has_current_summary(os.path.join(test["cache"], "summary.json")):
+                continue
+
+            if has_test_log(test):
+                futures.append(
+                    self.submit_fetch(buildbaron.analyzer.logkeeper.retieve_raw_log,
+                                      test["log_file"], max_bytes=MAX_TEST_LOG_SIZE))
+
+        return [f for f in futures if f is not None]
+
+    def wait_and_preanalyze(self, futures, pending):
+        """Wait for a list of downloads, meanwhile queueing the analysis of the pending BFs on the
+        process pool as soon as all their downloads are done, in ticket order
+
+        pending is a list of (bf, download futures), returns the BFs that are still pending.
+        """
+        while True:
+            ready = [p for p in pending if all(f.done() for f in p[1])]
+            for bf, bf_futures in ready:
+                self.preanalyze_bf(bf)
+            pending = [p for p in pending if p not in ready]
+
+            if all(f.done() for f in futures):
+                return pending
+
+            concurrent.futures.wait(
+                [f for bf, bf_futures in pending for f in bf_futures if not f.done()],
+                return_when=concurrent.futures.FIRST_COMPLETED)
+
+    def preanalyze_bf(self, bf):
+        """Queue the analyses process_bf will need for a BF on the process pool, for the logs that
+        are cached
+        """
+        self.run_isolated(bf, self._preanalyze_bf, bf)
+
+    def _preanalyze_bf(self, bf):
+        self.create_bf_cache(bf)
+
+        bf['system_log_url'] = buildbaron.analyzer.evergreen.task_get_system_raw_log(bf['task_url'])
+        bf['task_log_file_url'] = buildbaron.analyzer.evergreen.task_get_task_raw_log(
+            bf["task_url"])
+
+        if bf['type'] == 'test_failure':
+            if bf['hash'] not in self._oom_verdicts and self.load_oom_verdict(bf) is None:
+                self.preanalyze_log(buildbaron.analyzer.analysis_pool.OOM_LOG,
+                                    bf['system_log_url'])
+            self.preanalyze_tests(bf, bf['tests'])
+        elif not self.has_current_summary(os.path.join(bf["bf_cache"], "summary.json")):
+            if bf['type'] == 'timed_out':
+                kind = buildbaron.analyzer.analysis_pool.TIMEOUT_LOG
+            else:
+                kind = buildbaron.analyzer.analysis_pool.EVG_LOG
+            self.preanalyze_log(kind, bf['task_log_file_url'])
+
+    def preanalyze_tests(self, bf, tests):
+        """Queue the analyses of the cached logs of a list of tests on the process pool"""
+        for test in tests:
+            self.create_test_cache(bf, test)
+
+            if not has_test_log(test) or self.has_current_summary(
+                    os.path.join(test["cache"], "summary.json")):
+                continue
+
+            self.preanalyze_log(buildbaron.analyzer.analysis_pool.TEST_LOG, test["log_file"])
+
+    def preanalyze_log(self, kind, url):
+        """Start the analysis of a cached log on the process pool, its blob stays pinned until
+        analyze_cached gets the result
+        """
+        # process_bf marks the log as used when it gets it
+        log_file = self.log_cache.lookup(url, touch=False, pin=True)
+        if log_file is None:
+            return
+
+        if self._analysis_pool.prefetch(kind, log_file):
+            self._prefetched.add((kind, log_file))
+        else:
+            self.log_cache.release(log_file)
+
+    def analyze_cached(self, kind, url, retrieve, *args, max_bytes=None):
+        """Get the cached log for url, downloading it if needed, and analyze it
+
+        The blob is pinned in the log cache until the analysis is done, so downloads on other
+        threads cannot evict it meanwhile. Returns the cached log file and its LogAnalysis.
+        """
+        log_file = self.log_cache.get(url, retrieve, *args, pin=True, max_bytes=max_bytes)
+        try:
+            return log_file, self._analysis_pool.analyze(kind, log_file)
+        finally:
+            self.log_cache.release(log_file)
+
+            if (kind, log_file) in self._prefetched:
+                self._prefetched.remove((kind, log_file))
+                self.log_cache.release(log_file)
+
     def create_bf_cache(self, bf):
         """Create a directory to cache the log file in"""
         if not os.path.exists("cache"):
@@ -248,30 +544,21 @@ class bfg_analyzer(object):
 
     def process_system_failure(self, bf, results):
         cache_dir = bf["bf_cache"]
-        log_file = os.path.join(cache_dir, "test.log")
         summary_json = os.path.join(cache_dir, "summary.json")
 
         bf['log_file_url'] = bf['task_log_file_url']
         bf['name'] = 'task'
         bf['cache'] = bf['bf_cache']
 
-        if os.path.exists(summary_json) and not UPDATE_JIRA:
-            with open(summary_json, "rb") as sjh:
-                contents = sjh.read().decode('utf-8')
-                summary_str = json.loads(contents)
-
-            results.append({"test": bf, "summary": summary_str})
+        summary_obj = self.load_summary(summary_json)
+        if summary_obj is not None and not UPDATE_JIRA:
+            results.append({"test": bf, "summary": summary_obj})
             return
 
-        if not os.path.exists(log_file):
-            self.evg_client.retrieve_file(bf['task_log_file_url'], log_file)
-
-        with open(log_file, "rb") as lfh:
-            log_file_str = lfh.read().decode('utf-8')
-
-        analyzer = buildbaron.analyzer.evg_log_file_analyzer.EvgLogFileAnalyzer(log_file_str)
-
-        analyzer.analyze()
+        log_url = bf['task_log_file_url']
+        log_file, analyzer = self.analyze_cached(buildbaron.analyzer.analysis_pool.EVG_LOG,
+                                                 log_url, self.evg_client.retrieve_file)
+        bf['log_cache_file'] = log_file
 
         faults = analyzer.get_faults()
 
@@ -286,40 +573,27 @@ class bfg_analyzer(object):
         for f in analyzer.get_faults():
             print(f)
 
-        summary_str = analyzer.to_json()
-        summary_obj = json.loads(summary_str)
-
-        with open(summary_json, "wb") as sjh:
-            sjh.write(summary_str.encode())
+        summary_obj = self.save_summary(summary_json, analyzer, log_url)
 
         results.append({"test": bf, "summary": summary_obj})
 
     def process_task_failure(self, bf, results):
         cache_dir = bf["bf_cache"]
-        log_file = os.path.join(cache_dir, "test.log")
         summary_json = os.path.join(cache_dir, "summary.json")
 
         bf['log_file_url'] = bf['task_log_file_url']
         bf['name'] = 'task'
         bf['cache'] = bf['bf_cache']
 
-        if os.path.exists(summary_json):
-            with open(summary_json, "rb") as sjh:
-                contents = sjh.read().decode('utf-8')
-                summary_str = json.loads(contents)
-
-            results.append({"test": bf, "summary": summary_str})
+        summary_obj = self.load_summary(summary_json)
+        if summary_obj is not None:
+            results.append({"test": bf, "summary": summary_obj})
             return
 
-        if not os.path.exists(log_file):
-            self.evg_client.retrieve_file(bf['task_log_file_url'], log_file)
-
-        with open(log_file, "rb") as lfh:
-            log_file_str = lfh.read().decode('utf-8')
-
-        analyzer = buildbaron.analyzer.evg_log_file_analyzer.EvgLogFileAnalyzer(log_file_str)
-
-        analyzer.analyze()
+        log_url = bf['task_log_file_url']
+        log_file, analyzer = self.analyze_cached(buildbaron.analyzer.analysis_pool.EVG_LOG,
+                                                 log_url, self.evg_client.retrieve_file)
+        bf['log_cache_file'] = log_file
 
         faults = analyzer.get_faults()
 
@@ -333,6 +607,7 @@ class bfg_analyzer(object):
                 print("===========================")
             else:
                 analyzer = oom_analyzer
+                log_url = bf['system_log_url']
         else:
             pass
             #  self.add_system_failure_comment(bf, log_file_url, faults)
@@ -340,41 +615,29 @@ class bfg_analyzer(object):
         for f in analyzer.get_faults():
             print(f)
 
-        summary_str = analyzer.to_json()
-        summary_obj = json.loads(summary_str)
-
-        with open(summary_json, "wb") as sjh:
-            sjh.write(summary_str.encode())
+        summary_obj = self.save_summary(summary_json, analyzer, log_url)
 
         results.append({"test": bf, "summary": summary_obj})
 
     def process_time_out(self, bf, results):
         cache_dir = bf["bf_cache"]
-        log_file = os.path.join(cache_dir, "test.log")
         summary_json = os.path.join(cache_dir, "summary.json")
 
         bf['log_file_url'] = bf['task_log_file_url']
         bf['name'] = 'task'
         bf['cache'] = bf['bf_cache']
 
-        if os.path.exists(summary_json):
-            with open(summary_json, "rb") as sjh:
-                contents = sjh.read().decode('utf-8')
-                summary_str = json.loads(contents)
-
-            results.append({"test": bf, "summary": summary_str})
+        summary_obj = self.load_summary(summary_json)
+        if summary_obj is not None:
+            results.append({"test": bf, "summary": summary_obj})
             return
 
-        if not os.path.exists(log_file):
-            self.evg_client.retrieve_file(bf['task_log_file_url'], log_file)
-
-        with open(log_file, "rb") as lfh:
-            log_file_str = lfh.read().decode('utf-8')
+        log_file, analyzer = self.analyze_cached(buildbaron.analyzer.analysis_pool.TIMEOUT_LOG,
+                                                 bf['task_log_file_url'],
+                                                 self.evg_client.retrieve_file)
+        bf['log_cache_file'] = log_file
 
-        print("Checking " + log_file)
-        analyzer = buildbaron.analyzer.timeout_file_analyzer.TimeOutAnalyzer(log_file_str)
-
-        analyzer.analyze()
+        print("Checked " + log_file)
 
         incomplete_tests = analyzer.get_incomplete_tests()
 
@@ -388,26 +651,30 @@ class bfg_analyzer(object):
                       log_file)
                 print("===========================")
 
-            summary_str = analyzer.to_json()
-            summary_obj = json.loads(summary_str)
-
-            with open(summary_json, "wb") as sjh:
-                sjh.write(summary_str.encode())
+            summary_obj = self.save_summary(summary_json, analyzer, bf['task_log_file_url'])
 
             results.append({"test": bf, "summary": summary_obj})
 
         else:
+            if self._executor is not None:
+                concurrent.futures.wait(self.prefetch_tests(bf, incomplete_tests))
+            if self.analyze_procs > 1:
+                self.preanalyze_tests(bf, incomplete_tests)
+
             for incomplete in incomplete_tests:
                 self.process_test(bf, incomplete, results)
             bf['tests'] = incomplete_tests
 
     def process_test(self, bf, test, results):
+        with buildbaron.analyzer.instrumentation.span("process_test"):
+            self._process_test(bf, test, results)
+
+    def _process_test(self, bf, test, results):
         bf_name = bf['summary']
         self.create_test_cache(bf, test)
         test_name = bf_name + " " + test['name']
 
         cache_dir = test["cache"]
-        log_file = os.path.join(cache_dir, "test.log")
         summary_json = os.path.join(cache_dir, "summary.json")
 
         nested_test = test
@@ -418,97 +685,153 @@ class bfg_analyzer(object):
         oom_analyzer = self.check_for_oom_killer(bf)
         if oom_analyzer is None:
             # If logkeeper is down, we will not have a log file :-(
-            if test["log_file"] is not None and test["log_file"] != "" and "test/None" not in test[
-                    'log_file'] and "log url not available" not in test['log_file']:
-
-                if not os.path.exists(log_file):
-                    buildbaron.analyzer.logkeeper.retieve_raw_log(test["log_file"], log_file)
-
+            if has_test_log(test):
                 test['log_file_url'] = buildbaron.analyzer.logkeeper.get_raw_log_url(
                     test["log_file"])
-
-                log_file_stat = os.stat(log_file)
-
-                if log_file_stat[stat.ST_SIZE] > 50 * 1024 * 1024:
-                    summary_str = "Skipping Large File : " + str(log_file_stat[stat.ST_SIZE])
-                    results.append({"test": nested_test, "summary": summary_str})
-                    return
             else:
                 test['log_file_url'] = "none"
-                with open(log_file, "wb") as lfh:
-                    lfh.write("Logkeeper was down\n".encode())
 
-                log_file_stat = os.stat(log_file)
-
-            if os.path.exists(summary_json):
-                with open(summary_json, "rb") as sjh:
-                    contents = sjh.read().decode('utf-8')
-                    summary_str = json.loads(contents)
-
-                results.append({"test": nested_test, "summary": summary_str})
+            summary_obj = self.load_summary(summary_json)
+            if summary_obj is not None:
+                results.append({"test": nested_test, "summary": summary_obj})
                 return
 
-            if log_file_stat[stat.ST_SIZE] > 50 * 1024 * 1024:
-                print("Skipping Large File : " + str(log_file_stat[stat.ST_SIZE]) + " at " + str(
-                    log_file))
-                print(summary_str)
-                summary_obj = summary_str
-            else:
-                with open(log_file, "rb") as lfh:
-                    log_file_str = lfh.read().decode('utf-8')
+            log_url = None
+            if has_test_log(test):
+                log_url = test["log_file"]
+                try:
+                    log_file, analyzer = self.analyze_cached(
+                        buildbaron.analyzer.analysis_pool.TEST_LOG, test["log_file"],
+                        buildbaron.analyzer.logkeeper.retieve_raw_log,
+                        max_bytes=MAX_TEST_LOG_SIZE)
+                except buildbaron.analyzer.download.FileTooLargeError as e:
+                    print("Skipping Large File : " + str(e.size) + " at " + test["log_file"])
+                    summary_str = "Skipping Large File : " + str(e.size)
+                    results.append({"test": nested_test, "summary": summary_str})
+                    return
 
-                print("Checking Log File")
-                LFS = buildbaron.analyzer.log_file_analyzer.LogFileSplitter(log_file_str)
+                test['log_cache_file'] = log_file
 
-                s = LFS.getsplits()
+                print("Checked Log File")
+            else:
+                log_file = "(no log file)"
+                LFS = buildbaron.analyzer.log_file_analyzer.LogFileSplitter("Logkeeper was down\n")
 
-                analyzer = buildbaron.analyzer.log_file_analyzer.LogFileAnalyzer(s)
+                analyzer = buildbaron.analyzer.log_file_analyzer.LogFileAnalyzer(
+                    LFS.getsplits(), rule_budget=self.rule_budget)
 
                 analyzer.analyze()
 
-                faults = analyzer.get_faults()
+            faults = analyzer.get_faults()
 
-                if len(faults) == 0:
-                    print("===========================")
-                    print("Analysis failed for test: " + self.pp.pformat(bf))
-                    print("To Debug: python analyzer" + os.path.sep + "log_file_analyzer.py " +
-                          log_file)
-                    print("===========================")
+            if len(faults) == 0:
+                print("===========================")
+                print("Analysis failed for test: " + self.pp.pformat(bf))
+                print("To Debug: python analyzer" + os.path.sep + "log_file_analyzer.py " +
+                      log_file)
+                print("===========================")
         else:
             # Well, we hit an oom, ignore the test
             test['log_file_url'] = "none"
             analyzer = oom_analyzer
+            log_url = bf['system_log_url']
 
         for f in analyzer.get_faults():
             print(f)
 
-        summary_str = analyzer.to_json()
-        summary_obj = json.loads(summary_str)
-
-        with open(summary_json, "wb") as sjh:
-            sjh.write(summary_str.encode())
+        summary_obj = self.save_summary(summary_json, analyzer, log_url)
 
         results.append({"test": nested_test, "summary": summary_obj})
 
-    def check_for_oom_killer(self, bf):
-        cache_dir = bf["bf_cache"]
-        log_file = os.path.join(cache_dir, "test.log")
+    def has_current_summary(self, summary_json):
+        """Check if a cached summary exists and its fingerprint is current"""
+        summary_obj = read_json_file(summary_json)
+        if summary_obj is None:
+            return False
+
+        return buildbaron.analyzer.fingerprint.is_current(summary_obj, self.log_cache.content_hash,
+                                                          self.rule_budget)
+
+    def load_summary(self, summary_json):
+        """Load a cached summary, or None if there is none, it is unreadable or its fingerprint
+        is stale
+        """
+        if not os.path.exists(summary_json):
+            self.summary_stats["new"] += 1
+            return None
 
-        if not os.path.exists(log_file):
-            self.evg_client.retrieve_file(bf['system_log_url'], log_file)
+        summary_obj = read_json_file(summary_json)
 
-        with open(log_file, "rb") as lfh:
-            log_file_str = lfh.read().decode('utf-8')
+        if summary_obj is None or not buildbaron.analyzer.fingerprint.is_current(
+                summary_obj, self.log_cache.content_hash, self.rule_budget):
+            print("Stale summary: " + summary_json)
+            self.summary_stats["stale"] += 1
+            return None
 
-        analyzer = buildbaron.analyzer.evg_log_file_analyzer.EvgLogFileAnalyzer(log_file_str)
+        self.summary_stats["reused"] += 1
+        return summary_obj
 
-        analyzer.analyze_oom()
+    def save_summary(self, summary_json, analyzer, log_url):
+        """Save the summary of an analyzer, stamped with the fingerprint of the log at log_url"""
+        summary_obj = json.loads(analyzer.to_json())
+        summary_obj["fingerprint"] = buildbaron.analyzer.fingerprint.summary_fingerprint(
+            log_url, self.log_cache.content_hash(log_url), summary_obj, self.rule_budget)
 
-        if len(analyzer.get_faults()) > 0:
-            return analyzer
+        with buildbaron.analyzer.instrumentation.span("write_summary"):
+            write_json_file(summary_json, summary_obj)
+
+        return summary_obj
+
+    def check_for_oom_killer(self, bf):
+        """Check the system log of a BF's task for the OOM killer
+
+        The system log is only fetched and scanned once per task, the verdict is shared by all the
+        tests of the BF and saved in oom_summary.json in the BF cache for later runs. Returns a
+        summary of the OOM faults, or None if the OOM killer did not run.
+        """
+        verdict = self._oom_verdicts.get(bf['hash'])
+        if verdict is None:
+            verdict = self.load_oom_verdict(bf)
+            if verdict is None:
+                verdict = self.analyze_oom(bf)
+            self._oom_verdicts[bf['hash']] = verdict
+
+        if len(verdict.get_faults()) > 0:
+            return verdict
 
         return None
 
+    def load_oom_verdict(self, bf):
+        """Load the saved OOM verdict of a BF's task, or None if there is none, it is unreadable or
+        it is stale
+        """
+        oom_obj = read_json_file(
+            os.path.join(bf["bf_cache"], "oom_summary.json"),
+            cls=buildbaron.analyzer.faultinfo.CustomDecoder)
+
+        if oom_obj is None or not buildbaron.analyzer.fingerprint.is_current(
+                oom_obj, self.log_cache.content_hash):
+            return None
+
+        return oom_obj["summary"]
+
+    def analyze_oom(self, bf):
+        """Scan the system log of a BF's task for the OOM killer and save the verdict"""
+        log_url = bf['system_log_url']
+        log_file, analyzer = self.analyze_cached(buildbaron.analyzer.analysis_pool.OOM_LOG, log_url,
+                                                 self.evg_client.retrieve_file)
+
+        oom_obj = {
+            "fingerprint": buildbaron.analyzer.fingerprint.summary_fingerprint(
+                log_url, self.log_cache.content_hash(log_url)),
+            "summary": json.loads(analyzer.to_json())
+        }
+
+        with buildbaron.analyzer.instrumentation.span("write_summary"):
+            write_json_file(os.path.join(bf["bf_cache"], "oom_summary.json"), oom_obj)
+
+        return analyzer
+
     def add_system_failure_comment(self, bf, log_file_url, faults):
         if UPDATE_JIRA == True:
             issue = self.jira_client.issue(bf['issue'])
@@ -539,6 +862,35 @@ class bfg_analyzer(object):
                 self.jira_client.add_comment(issue.key, message)
 
 
+def read_json_file(file, cls=None):
+    """Load a json file, or None if it does not exist or cannot be decoded, such as a file
+    truncated by an older version that wrote in place
+    """
+    if not os.path.exists(file):
+        return None
+
+    try:
+        with open(file, "rb") as jfh:
+            return json.loads(jfh.read().decode('utf-8'), cls=cls)
+    except ValueError as e:
+        print("Ignoring unreadable json file %s: %s" % (file, e))
+        return None
+
+
+def write_json_file(file, obj, indent=None):
+    """Write obj as json through a temporary file renamed into place, so an interrupted run
+    never leaves a truncated file behind
+    """
+    with buildbaron.analyzer.atomic_file.atomic_write(file, prefix=".json-") as jfh:
+        jfh.write(json.dumps(obj, indent=indent).encode())
+
+
+def has_test_log(test):
+    """Check if a test has a logkeeper log, if logkeeper is down, we will not have a log file"""
+    return test["log_file"] is not None and test["log_file"] != "" and "test/None" not in test[
+        'log_file'] and "log url not available" not in test['log_file']
+
+
 def tests1():
     a1 = ParseJiraTicket(
         1, "Timed Out: sharding_csrs_upgrade_WT on Enterprise Windows [MongoDB (3.2) @ 190538da]",
@@ -624,6 +976,33 @@ def main():
         type=str,
         help="Jira user name",
         default=buildbaron.analyzer.analyzer_config.jira_user())
+    group.add_argument(
+        '--jira_workers',
+        type=int,
+        help="Number of pages of Jira search results to fetch at a time",
+        default=1)
+
+    group = parser.add_argument_group("HTTP options")
+    group.add_argument(
+        '--connect_timeout',
+        type=float,
+        help="Seconds to wait for a connection to evergreen or logkeeper",
+        default=buildbaron.analyzer.http_transport.DEFAULT_CONNECT_TIMEOUT)
+    group.add_argument(
+        '--read_timeout',
+        type=float,
+        help="Seconds to wait for data from evergreen or logkeeper",
+        default=buildbaron.analyzer.http_transport.DEFAULT_READ_TIMEOUT)
+    group.add_argument(
+        '--retries',
+        type=int,
+        help="Number of times to retry a failed download",
+        default=buildbaron.analyzer.http_transport.DEFAULT_RETRIES)
+    group.add_argument(
+        '--max_per_host',
+        type=int,
+        help="Maximum number of concurrent downloads from a single host",
+        default=buildbaron.analyzer.http_transport.DEFAULT_MAX_PER_HOST)
 
     group = parser.add_mutually_exclusive_group()
     group.add_argument(
@@ -632,6 +1011,64 @@ def main():
         '--this_week', action='store_true', help="Query of This week's build baron queue")
     group.add_argument('--query_str', type=str, help="Any query against implicitly the BFG project")
 
+    group = parser.add_argument_group("Cache options")
+    group.add_argument(
+        '--cache_dir',
+        type=str,
+        help="Directory to cache downloaded logs in",
+        default=buildbaron.analyzer.log_cache.DEFAULT_ROOT)
+    group.add_argument(
+        '--cache_budget',
+        type=float,
+        help="Size in GB of the cached logs, the least recently used logs are evicted beyond it",
+        default=buildbaron.analyzer.log_cache.DEFAULT_BUDGET / (1024.0 * 1024.0 * 1024.0))
+    group.add_argument(
+        '--results_db',
+        type=str,
+        help="SQLite database to store the parsed BFs and their analysis results in",
+        default=buildbaron.analyzer.results_store.DEFAULT_FILE)
+
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help="Number of threads to download logs with, analysis stays in ticket order")
+    parser.add_argument(
+        '--analyze_procs',
+        type=int,
+        default=1,
+        help="Number of processes to analyze the downloaded logs with, results stay in ticket " +
+        "order")
+    parser.add_argument(
+        '--rule_budget',
+        type=float,
+        default=buildbaron.analyzer.log_file_analyzer.DEFAULT_RULE_BUDGET,
+        help="Seconds a fault rule may search a test log for before it is skipped and the " +
+        "log is marked as over budget, 0 for no limit. Without the regex module, the budget " +
+        "is enforced only on the main thread of Unix processes")
+    parser.add_argument(
+        '--full_sync',
+        action='store_true',
+        help="Fetch and parse every BF matching the query again, instead of only the BFs " +
+        "updated since the last run")
+    parser.add_argument(
+        '--reanalyze',
+        action='store_true',
+        help="Analyze the BFs of the last query again from the cached logs, without Jira or " +
+        "network access, only summaries from older rules or logs are recomputed")
+
+    group = parser.add_argument_group("Report options")
+    group.add_argument(
+        '--report',
+        type=str,
+        help="Write a json report of the time spent in each stage of the run, per BF and " +
+        "overall, and of the downloads and cache hits to this file")
+    group.add_argument(
+        '--trace',
+        type=str,
+        help="Write the stages of the run as Chrome trace events to this file, for " +
+        "chrome://tracing or ui.perfetto.dev")
+
     args = parser.parse_args()
 
     if args.query_str:
@@ -643,16 +1080,58 @@ def main():
 
     print("Query: %s" % query_str)
 
+    transport = buildbaron.analyzer.http_transport.Transport(
+        connect_timeout=args.connect_timeout,
+        read_timeout=args.read_timeout,
+        retries=args.retries,
+        max_per_host=args.max_per_host)
+    buildbaron.analyzer.http_transport.set_transport(transport)
+
+    recorder = None
+    if args.report or args.trace:
+        recorder = buildbaron.analyzer.instrumentation.Recorder()
+        buildbaron.analyzer.instrumentation.set_recorder(recorder)
+
     try:
-        jira_client = buildbaron.analyzer.jira_client.jira_client(args.jira_server, args.jira_user)
+        log_cache = buildbaron.analyzer.log_cache.LogCache(
+            args.cache_dir, int(args.cache_budget * 1024 * 1024 * 1024), offline=args.reanalyze)
+        results_store = buildbaron.analyzer.results_store.ResultsStore(args.results_db)
+
+        if args.reanalyze:
+            bfa = bfg_analyzer(
+                None,
+                args.workers,
+                log_cache,
+                results_store=results_store,
+                analyze_procs=args.analyze_procs,
+                rule_budget=args.rule_budget or None)
+
+            bfs = bfa.load_bfs()
+
+            run = results_store.run()
+            if run is not None:
+                query_str = run["query"]
+        else:
+            jira_client = buildbaron.analyzer.jira_client.jira_client(
+                args.jira_server, args.jira_user, args.jira_workers)
 
-        bfa = bfg_analyzer(jira_client)
+            bfa = bfg_analyzer(
+                jira_client,
+                args.workers,
+                log_cache,
+                results_store=results_store,
+                analyze_procs=args.analyze_procs,
+                rule_budget=args.rule_budget or None)
 
-        bfs = bfa.query(query_str)
+            bfs = bfa.query(query_str, args.full_sync)
 
         failed_bfs = bfa.check_logs(bfs)
 
         print("Total BFs to investigate %d\n" % len(failed_bfs))
+        print(transport.stats)
+        print(log_cache.stats)
+        print("Summaries -- reused: %(reused)d, stale: %(stale)d, new: %(new)d" %
+              bfa.summary_stats)
 
         failed_bfs_root = {
             'query': query_str,
@@ -660,8 +1139,23 @@ def main():
             'bfs': failed_bfs
         }
 
-        with open("failed_bfs.json", "w", encoding="utf8") as sjh:
-            json.dump(failed_bfs_root, sjh, indent="\t")
+        # Export of the whole run in ticket order, for scripts and for comparing runs, the web
+        # server reads bfg.db instead. Replaced atomically so readers never see a partial file.
+        with buildbaron.analyzer.instrumentation.span("write_failed_bfs"):
+            write_json_file("failed_bfs.json", failed_bfs_root, indent="\t")
+
+        if recorder is not None:
+            print(recorder)
+
+            if args.report:
+                recorder.save_report(
+                    args.report, {
+                        "http": transport.stats.to_dict(),
+                        "log_cache": log_cache.stats.to_dict(),
+                        "summaries": bfa.summary_stats
+                    })
+            if args.trace:
+                recorder.save_trace(args.trace)
 
     except Exception as e:
         print("Exception:" + str(e))
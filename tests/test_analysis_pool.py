@@ -0,0 +1,82 @@
+"""
+Tests for analyzer/analysis_pool.py, the pool tests start worker processes
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import analyzer.analysis_pool as analysis_pool
+import analyzer.instrumentation
+
+SAMPLE_LOG = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "samples.txt")
+
+TASK_LOG = b"line\n" * 30 + b"Task completed - FAILURE.\n" + b"x\n" * 10
+
+
+class AnalysisPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+        self.task_log = os.path.join(self.dir, "task.log")
+        with open(self.task_log, "wb") as lfh:
+            lfh.write(TASK_LOG)
+
+    def pool(self, processes):
+        pool = analysis_pool.AnalysisPool(processes)
+        self.addCleanup(pool.close)
+        return pool
+
+    def test_inline_analysis(self):
+        analysis = self.pool(1).analyze(analysis_pool.TEST_LOG, SAMPLE_LOG)
+        self.assertTrue(analysis.get_faults())
+
+    def test_unknown_kind(self):
+        with self.assertRaises(ValueError):
+            self.pool(1).analyze("unknown", self.task_log)
+
+    def test_workers_match_inline(self):
+        inline = self.pool(1)
+        pool = self.pool(2)
+
+        for kind, log_file in ((analysis_pool.TEST_LOG, SAMPLE_LOG),
+                               (analysis_pool.EVG_LOG, self.task_log),
+                               (analysis_pool.TIMEOUT_LOG, self.task_log)):
+            expected = inline.analyze(kind, log_file)
+            actual = pool.analyze(kind, log_file)
+
+            self.assertEqual(actual.to_json(), expected.to_json())
+            self.assertEqual(actual.get_incomplete_tests(), expected.get_incomplete_tests())
+
+    def test_prefetch(self):
+        pool = self.pool(2)
+
+        self.assertTrue(pool.prefetch(analysis_pool.EVG_LOG, self.task_log))
+        self.assertFalse(pool.prefetch(analysis_pool.EVG_LOG, self.task_log))
+
+        # The prefetched analysis is used once
+        expected = self.pool(1).analyze(analysis_pool.EVG_LOG, self.task_log).to_json()
+        self.assertEqual(pool.analyze(analysis_pool.EVG_LOG, self.task_log).to_json(), expected)
+        self.assertTrue(pool.prefetch(analysis_pool.EVG_LOG, self.task_log))
+
+    def test_no_prefetch_without_workers(self):
+        self.assertFalse(self.pool(1).prefetch(analysis_pool.EVG_LOG, self.task_log))
+
+    def test_worker_spans_are_merged(self):
+        recorder = analyzer.instrumentation.Recorder()
+        analyzer.instrumentation.set_recorder(recorder)
+        self.addCleanup(analyzer.instrumentation.set_recorder, None)
+
+        with analyzer.instrumentation.bf_context("BF-1"):
+            self.pool(2).analyze(analysis_pool.TEST_LOG, SAMPLE_LOG)
+
+        report = recorder.report()
+        self.assertIn("split", report["stages"])
+        self.assertIn("analyze.test", report["bfs"]["BF-1"]["stages"])
+        self.assertNotIn(os.getpid(), [span[4] for span in recorder.spans])
+
+
+if __name__ == '__main__':
+    unittest.main()
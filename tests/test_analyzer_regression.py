@@ -0,0 +1,250 @@
+"""
+Regression tests for the log analyzers, against the outputs of the original analyzers
+
+data/analyzer_expected.json holds the to_json() of each case below, and the incomplete tests of
+the timeout cases, as computed by the analyzers of the first commit of this repository. These
+decoded the whole log into a string and split it into a list of lines, which the analyzers no
+longer do, but their results must not change.
+"""
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import analyzer.evg_log_file_analyzer as evg_log_file_analyzer
+import analyzer.log_file_analyzer as log_file_analyzer
+import analyzer.log_reader as log_reader
+import analyzer.timeout_file_analyzer as timeout_file_analyzer
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+EXPECTED_FILE = os.path.join(ROOT_DIR, "tests", "data", "analyzer_expected.json")
+
+TEST_LOG = "test"
+EVG_LOG = "evg"
+TIMEOUT_LOG = "timeout"
+
+PREFIX = "[js_test:example] 2017-01-01T00:00:00.000+0000 "
+
+
+def shell(*lines):
+    return "".join(PREFIX + line + "\n" for line in lines)
+
+
+def server(name, *lines):
+    return "".join(PREFIX + name + "| " + line + "\n" for line in lines)
+
+
+def resmoke(*lines):
+    """Lines of the test runner, with a tag and no time"""
+    return "".join("[executor:js_test:job0] " + line + "\n" for line in lines)
+
+
+def plain(*lines):
+    return "".join(line + "\n" for line in lines)
+
+
+def filler(count, text="progress"):
+    return plain(*["%s %d" % (text, i) for i in range(count)])
+
+
+def read_samples():
+    with open(os.path.join(ROOT_DIR, "samples.txt"), "rb") as lfh:
+        return lfh.read().decode('utf-8')
+
+
+def logkeeper_log_cases():
+    samples = read_samples()
+
+    return {
+        "samples": samples,
+        "samples_crlf": samples.replace("\n", "\r\n"),
+        "samples_no_final_newline": samples.rstrip("\n"),
+        "empty": "",
+        "stoperror_access_violation":
+        shell("assert: count failed in jstests/core/count.js") + server(
+            "d20010", "Fatal Assertion 17441 at src/mongo/db/repl/oplog.cpp 123",
+            "aborting after fassert() failure", "***aborting after fassert() failure",
+            "----- BEGIN BACKTRACE -----", "----- END BACKTRACE -----") +
+        shell("StopError: MongoDB process on port 20010 exited with error code -1073741819",
+              "failed to load: jstests/core/count.js"),
+        "stoperror_abort":
+        shell("StopError: MongoDB process on port 20011 exited with error code -6",
+              "failed to load: jstests/core/abort.js"),
+        "stoperror":
+        filler(3) +
+        shell("StopError: MongoDB process on port 20012 exited with error code 14",
+              "failed to load: jstests/core/exit.js"),
+        "tcmalloc_corruption":
+        server("d20010", "Found a corrupted memory buffer in MallocBlock (may be offset from "
+               "user ptr): buffer index: 0", "----- BEGIN BACKTRACE -----",
+               "----- END BACKTRACE -----"),
+        "parallel_failed":
+        shell("Parallel Test FAILED: jstests/parallel/basic.js", "assert.soon failed: "
+              "function () { return false; } in jstests/parallel/basic.js") +
+        server("s20014", "Invariant failure ok src/mongo/s/balancer.cpp 12",
+               "***aborting after invariant() failure", "----- END BACKTRACE -----"),
+        "js_assert_in_mongo_root":
+        plain("[js_test:example] assert: [1] != [2] are not equal : failed in "
+              "jstests/core/eq.js") +
+        server("d20010", "terminate() called. An exception is active",
+               "----- END BACKTRACE -----"),
+        "mongo_query_failure":
+        shell("Error: error doing query: failed: network error in jstests/core/q.js"),
+        "failed_start":
+        shell("Error: Failed to start mongos on port 20020", "failed to load: jstests/s/a.js"),
+        "failed_repl_wait":
+        shell("Error: waiting for replication timed out", "failed to load: jstests/r/w.js"),
+        "teardown":
+        plain("mongod teardown for fixture wasn't successful."),
+        "unit_test_failure":
+        shell("DONE running tests", "FAILURE - 1 tests in 1 suites failed", "  query_test") +
+        server("d20010", "Segmentation Fault", "----- END BACKTRACE -----"),
+        "c_runtime_error":
+        plain("*** C runtime error: xtree(326) : Assertion failed: map/set iterators "
+              "incompatible, terminating"),
+        "leaks":
+        plain("==1234==ERROR: LeakSanitizer: detected memory leaks",
+              "    #0 0x4f0 in malloc", "SUMMARY: AddressSanitizer: 48 byte(s) leaked."),
+        "go_crash":
+        server("sh21273", "unexpected fault address 0x0", "fatal error: fault",
+               "goroutine 33 [running]:"),
+        "no_faults":
+        filler(5) + shell("jstests/core/ok.js ran fine") + server("d20010", "waiting"),
+        "unicode":
+        plain("\ttabs and ümläuts") +
+        shell("café ☃ assert: é failed", "in a.js\x0cafter a form feed, a line separator "
+              "splits this line\u2028too") + plain("☃"),
+    }
+
+
+def evg_log_cases():
+    return {
+        "task_failure_early":
+        filler(5) + plain("Task completed - FAILURE."),
+        "task_failure_early_in_a_long_log":
+        filler(5) + plain("Task completed - FAILURE.") + filler(40),
+        "crash_in_a_short_log":
+        filler(10) + plain("Command failed: exit code 3221225477 (-1073741819)") + filler(2),
+        "task_failure":
+        filler(30) + plain("Task completed - FAILURE.") + filler(10, "cleanup"),
+        "access_violation_and_failure":
+        filler(25) + plain("Command failed: exit code 3221225477 (-1073741819)") +
+        filler(8) + plain("Task completed - FAILURE."),
+        "git_hub_down":
+        filler(40) + plain("fatal: Could not read from remote repository.") +
+        filler(2),
+        "crlf":
+        (filler(30) + plain("Task completed - FAILURE.") + filler(3)).replace("\n", "\r\n"),
+        "no_final_newline":
+        filler(22) + "Task completed - FAILURE.",
+        "empty":
+        "",
+        "unicode":
+        filler(21, "été ☃") + plain("Task completed - FAILURE.") +
+        filler(3, "ü"),
+        "no_faults":
+        filler(50),
+    }
+
+
+def timeout_log_cases():
+    return {
+        "incomplete_tests":
+        resmoke(
+            "Running a.js...",
+            "Writing output of JSTest jstests/core/a.js to https://logkeeper/build/1/test/2/.",
+            "Running b.js...",
+            "Writing output of JSTest jstests/core/b.js to https://logkeeper/build/1/test/3/.",
+            "2017-01-01T00:00:00.000+0000 a.js ran in 1.00 seconds.",
+            "Running dbtest...",
+            "Writing output of Program dbtest to https://logkeeper/build/1/test/4/.",
+            "Starting Hook ValidateCollections:job0 under executor job0...",
+            "Writing output of Hook ValidateCollections:job0 to "
+            "https://logkeeper/build/1/test/5/.") + filler(12) +
+        plain("Command failed: Shell command interrupted") + filler(2),
+        "completed_hook":
+        resmoke("Starting Hook CheckReplDBHash:job1 under executor job1...",
+                "Hook CheckReplDBHash:job1 finished.", "Running c.js..."),
+        "crlf":
+        (resmoke("Running d.js...",
+                 "Writing output of JSTest jstests/core/d.js to https://logkeeper/1/.") +
+         filler(3) + plain("Command failed: Shell command interrupted")).replace("\n", "\r\n"),
+        "no_final_newline":
+        filler(3) + plain("Running e.js...") +
+        "Command failed: Shell command interrupted",
+        "empty":
+        "",
+        "no_tests":
+        filler(20),
+    }
+
+
+def load_expected():
+    with open(EXPECTED_FILE, "rb") as efh:
+        return json.loads(efh.read().decode('utf-8'))
+
+
+class AnalyzerRegressionTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.expected = load_expected()
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def write_log(self, log):
+        file = os.path.join(self.dir, "log.txt")
+        with open(file, "wb") as lfh:
+            lfh.write(log.encode('utf-8'))
+        return file
+
+    def check(self, kind, name, analyzer, incomplete_tests=None):
+        expected = self.expected[kind][name]
+        self.assertEqual(json.loads(analyzer.to_json()), expected["json"])
+        if incomplete_tests is not None:
+            self.assertEqual(
+                sorted(incomplete_tests, key=lambda t: t["name"]), expected["incomplete_tests"])
+
+    def test_cases_are_recorded(self):
+        self.assertEqual(sorted(self.expected[TEST_LOG]), sorted(logkeeper_log_cases()))
+        self.assertEqual(sorted(self.expected[EVG_LOG]), sorted(evg_log_cases()))
+        self.assertEqual(sorted(self.expected[TIMEOUT_LOG]), sorted(timeout_log_cases()))
+
+    def test_log_file_analyzer(self):
+        for name, log in sorted(logkeeper_log_cases().items()):
+            with self.subTest(name=name):
+                file = self.write_log(log)
+                with log_reader.open_log(file) as lfh:
+                    sources = [log, io.BytesIO(log.encode('utf-8')), lfh]
+
+                    for source in sources:
+                        splits = log_file_analyzer.LogFileSplitter(source).getsplits()
+                        analyzer = log_file_analyzer.LogFileAnalyzer(splits)
+                        analyzer.analyze()
+                        self.check(TEST_LOG, name, analyzer)
+
+    def test_evg_log_file_analyzer(self):
+        for name, log in sorted(evg_log_cases().items()):
+            with self.subTest(name=name):
+                with log_reader.map_log(self.write_log(log)) as buf:
+                    for source in (log, log.encode('utf-8'), buf):
+                        analyzer = evg_log_file_analyzer.EvgLogFileAnalyzer(source)
+                        analyzer.analyze()
+                        self.check(EVG_LOG, name, analyzer)
+
+    def test_timeout_file_analyzer(self):
+        for name, log in sorted(timeout_log_cases().items()):
+            with self.subTest(name=name):
+                with log_reader.map_log(self.write_log(log)) as buf:
+                    for source in (log, log.encode('utf-8'), buf):
+                        analyzer = timeout_file_analyzer.TimeOutAnalyzer(source)
+                        analyzer.analyze()
+                        self.check(TIMEOUT_LOG, name, analyzer, analyzer.get_incomplete_tests())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+"""
+Tests for analyzer/atomic_file.py
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import analyzer.atomic_file as atomic_file
+
+
+class AtomicWriteTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.file = os.path.join(self.dir, "file.json")
+
+        with open(self.file, "wb") as fh:
+            fh.write(b"old")
+
+    def read(self):
+        with open(self.file, "rb") as fh:
+            return fh.read()
+
+    def test_file_is_replaced(self):
+        with atomic_file.atomic_write(self.file) as fh:
+            fh.write(b"new")
+            self.assertEqual(self.read(), b"old")
+
+        self.assertEqual(self.read(), b"new")
+        self.assertEqual(os.listdir(self.dir), ["file.json"])
+
+    def test_failure_keeps_the_file(self):
+        with self.assertRaises(ValueError):
+            with atomic_file.atomic_write(self.file) as fh:
+                fh.write(b"new")
+                raise ValueError("interrupted")
+
+        self.assertEqual(self.read(), b"old")
+        self.assertEqual(os.listdir(self.dir), ["file.json"])
+
+
+if __name__ == '__main__':
+    unittest.main()
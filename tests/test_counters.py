@@ -0,0 +1,45 @@
+"""
+Tests for analyzer/counters.py
+"""
+import threading
+import unittest
+
+import analyzer.counters as counters
+
+
+class ExampleCounters(counters.Counters):
+    FIELDS = (("requests", 0), ("time", 0.0))
+    FORMAT = "requests: %(requests)d, time: %(time).1fs"
+
+
+class CountersTest(unittest.TestCase):
+    def test_initial_values(self):
+        stats = ExampleCounters()
+
+        self.assertEqual(stats.to_dict(), {"requests": 0, "time": 0.0})
+        self.assertEqual(str(stats), "requests: 0, time: 0.0s")
+
+    def test_concurrent_adds(self):
+        stats = ExampleCounters()
+
+        def add():
+            for _ in range(1000):
+                stats.add("requests", 1)
+                stats.add("time", 0.5)
+
+        threads = [threading.Thread(target=add) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(stats.requests, 4000)
+        self.assertEqual(str(stats), "requests: 4000, time: 2000.0s")
+
+    def test_unknown_counter(self):
+        with self.assertRaises(AttributeError):
+            ExampleCounters().add("unknown", 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+"""
+Tests for the OOM killer report scan of analyzer/evg_log_file_analyzer.py
+"""
+import unittest
+
+import analyzer.evg_log_file_analyzer as evg_log_file_analyzer
+
+MAX_LINES = evg_log_file_analyzer.MAX_OOM_BLOCK_LINES
+
+OOM_MESSAGE = "[2017/01/01 00:00:00.000] OOM (Out of memory) killed processes detected"
+
+
+def kill_lines(pid, name, rss_kb):
+    return [
+        "mongod invoked oom-killer: gfp_mask=0x24201ca, order=0, oom_score_adj=0",
+        "Out of memory: Kill process %d (%s) score 912 or sacrifice child" % (pid, name),
+        "Killed process %d (%s) total-vm:8123456kB, anon-rss:%dkB, file-rss:0kB, shmem-rss:4kB" %
+        (pid, name, rss_kb),
+    ]
+
+
+def analyze_oom(lines):
+    analyzer = evg_log_file_analyzer.EvgLogFileAnalyzer("\n".join(lines) + "\n")
+    analyzer.analyze_oom()
+    return analyzer.get_faults()
+
+
+class CheckOomTest(unittest.TestCase):
+    def test_report_under_the_limit(self):
+        report = kill_lines(1234, "mongod", 7000) + kill_lines(1300, "mongos", 100)
+        faults = analyze_oom(["setup"] * 3 + [OOM_MESSAGE] + report + ["Task completed"])
+
+        self.assertEqual(len(faults), 1)
+        fault = faults[0]
+
+        self.assertEqual(fault.category, "oom-killer")
+        self.assertEqual(fault.line_number, 3)
+        self.assertEqual(fault.context.split("\n"), [OOM_MESSAGE] + report)
+        self.assertEqual(fault.details, {
+            "killed_processes": [
+                {"pid": 1234, "name": "mongod", "rss_kb": 7004},
+                {"pid": 1300, "name": "mongos", "rss_kb": 104},
+            ]
+        })
+
+    def test_oversized_report_is_truncated(self):
+        # Each process takes 3 lines, the ones after the limit are not reported
+        processes = MAX_LINES // 3 + 10
+        report = []
+        for pid in range(processes):
+            report += kill_lines(pid, "mongod", 1)
+
+        faults = analyze_oom([OOM_MESSAGE] + report + ["Task completed"] + report)
+
+        self.assertEqual(len(faults), 1)
+        fault = faults[0]
+
+        context = fault.context.split("\n")
+        self.assertEqual(len(context), MAX_LINES)
+        self.assertEqual(context, [OOM_MESSAGE] + report[:MAX_LINES - 1])
+
+        # Only the processes named within the limit are reported, with their RSS if their
+        # "Killed process" line is within it too
+        included = report[:MAX_LINES - 1]
+        expected = []
+        for pid in range(processes):
+            kill, killed = kill_lines(pid, "mongod", 1)[1:]
+            if kill in included:
+                expected.append({"pid": pid, "name": "mongod",
+                                 "rss_kb": 5 if killed in included else None})
+
+        self.assertLess(len(expected), processes)
+        self.assertEqual(fault.details["killed_processes"], expected)
+
+    def test_no_oom_message_is_ignored(self):
+        faults = analyze_oom(["No OOM (Out of memory) killed processes detected"] +
+                             kill_lines(1, "mongod", 1))
+
+        self.assertEqual(faults, [])
+
+    def test_each_report_is_a_fault(self):
+        faults = analyze_oom([OOM_MESSAGE] + kill_lines(1, "mongod", 1) + ["between"] +
+                             [OOM_MESSAGE] + kill_lines(2, "mongos", 2))
+
+        self.assertEqual([f.line_number for f in faults], [0, 5])
+        self.assertEqual([f.details["killed_processes"][0]["name"] for f in faults],
+                         ["mongod", "mongos"])
+
+    def test_analyze_reports_oom_with_other_faults(self):
+        log = "\n".join(["setup"] * 30 + [OOM_MESSAGE] + kill_lines(1, "mongod", 1) +
+                        ["Task completed - FAILURE."]) + "\n"
+        analyzer = evg_log_file_analyzer.EvgLogFileAnalyzer(log)
+        analyzer.analyze()
+
+        self.assertEqual([f.category for f in analyzer.get_faults()],
+                         ["oom-killer", "task failure"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+"""
+Tests for www/www/failed_bfs_store.py, against a results store in a temporary directory
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import analyzer.results_store
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The web server's package is www/www, not the www directory at the repository root
+sys.path.insert(0, os.path.join(ROOT_DIR, "www"))
+
+from www import failed_bfs_store
+
+
+def make_bf(issue, suite="core", variant="linux", task_url=None):
+    return {
+        "issue": issue,
+        "summary": "Failures on " + issue,
+        "type": "test",
+        "project": "mongodb-mongo-master",
+        "task_url": task_url or "https://evergreen/task/" + issue,
+        "suite": suite,
+        "build_variant": variant,
+        "tests": []
+    }
+
+
+def make_result(bf, name, categories=(), test_type="test", summary=None):
+    test = {
+        "issue": bf["issue"],
+        "name": name,
+        "summary": bf["summary"],
+        "type": test_type,
+        "suite": bf["suite"],
+        "build_variant": bf["build_variant"],
+        "task_url": bf["task_url"],
+    }
+    if summary is None:
+        summary = {
+            "faults": [{"category": c, "source": "shell", "line_number": 1} for c in categories],
+            "contexts": []
+        }
+    return {"test": test, "summary": summary}
+
+
+BF_1 = make_bf("BF-1")
+BF_2 = make_bf("BF-2", suite="sharding", variant="windows", task_url="https://evergreen/task/x")
+BF_3 = make_bf("BF-3", variant="windows", task_url="https://evergreen/task/x")
+
+RESULTS = {
+    "BF-1": [make_result(BF_1, "a.js", ["js assert"]), make_result(BF_1, "b.js", ["segfault"])],
+    "BF-2": [make_result(BF_2, "c.js", ["js assert", "js assert", "segfault"])],
+    "BF-3": [make_result(BF_3, "Task", test_type="system", summary="Skipped large file")],
+}
+
+
+def names(failed_bfs):
+    return [failed_bf["test"]["name"] for failed_bf in failed_bfs]
+
+
+class FailedBFStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.file = os.path.join(self.dir, "bfg.db")
+
+        # bfg_analyzer writes through its own connection, as a separate process would
+        self.writer = self.open_store()
+        self.writer.set_tickets("project = BFG", "2017-01-01", [BF_1, BF_2, BF_3])
+        for issue, results in sorted(RESULTS.items()):
+            self.writer.save_results(issue, results)
+
+        self.cache = failed_bfs_store.FailedBFStore(self.open_store())
+
+    def open_store(self):
+        store = analyzer.results_store.ResultsStore(self.file)
+        self.addCleanup(store.close)
+        return store
+
+    def test_get_loads_the_run(self):
+        store = self.cache.get()
+
+        self.assertEqual(store.query, "project = BFG")
+        self.assertEqual(store.date, "2017-01-01")
+        self.assertEqual(names(store.bfs), ["a.js", "b.js", "c.js", "Task"])
+
+    def test_get_reloads_only_after_a_write(self):
+        store = self.cache.get()
+        self.assertIs(self.cache.get(), store)
+
+        self.writer.save_results("BF-1", [make_result(BF_1, "d.js")])
+
+        reloaded = self.cache.get()
+        self.assertIsNot(reloaded, store)
+        self.assertNotEqual(reloaded.version, store.version)
+        self.assertEqual(names(reloaded.bfs), ["d.js", "c.js", "Task"])
+
+    def test_find(self):
+        store = self.cache.get()
+
+        self.assertEqual(store.find("BF-2", "c.js")["test"]["suite"], "sharding")
+        self.assertIsNone(store.find("BF-2", "a.js"))
+
+    def test_indexes(self):
+        store = self.cache.get()
+
+        self.assertEqual(store.by_suite, {"core": [0, 1, 3], "sharding": [2]})
+        self.assertEqual(store.by_variant, {"linux": [0, 1], "windows": [2, 3]})
+        self.assertEqual(store.by_type, {"test": [0, 1, 2], "system": [3]})
+
+    def test_filter(self):
+        store = self.cache.get()
+
+        self.assertEqual(names(self.cache.filter(store)), ["a.js", "b.js", "c.js", "Task"])
+        self.assertEqual(names(self.cache.filter(store, suite="core")), ["a.js", "b.js", "Task"])
+        self.assertEqual(names(self.cache.filter(store, suite="core", variant="windows")),
+                         ["Task"])
+        self.assertEqual(names(self.cache.filter(store, type="system")), ["Task"])
+        self.assertEqual(names(self.cache.filter(store, suite="none")), [])
+
+    def test_filter_search(self):
+        store = self.cache.get()
+
+        self.assertEqual(names(self.cache.filter(store, search="C.JS")), ["c.js"])
+        self.assertEqual(names(self.cache.filter(store, search="bf-1")), ["a.js", "b.js"])
+        self.assertEqual(names(self.cache.filter(store, search="failures on bf-3")), ["Task"])
+
+    def test_filter_category_and_task_url(self):
+        store = self.cache.get()
+
+        self.assertEqual(names(self.cache.filter(store, category="js assert")), ["a.js", "c.js"])
+        self.assertEqual(names(self.cache.filter(store, task_url="https://evergreen/task/x")),
+                         ["c.js", "Task"])
+        self.assertEqual(
+            names(
+                self.cache.filter(
+                    store, category="segfault", task_url="https://evergreen/task/x",
+                    variant="windows")), ["c.js"])
+        self.assertEqual(names(self.cache.filter(store, category="segfault", suite="core")),
+                         ["b.js"])
+        self.assertEqual(names(self.cache.filter(store, category="none")), [])
+
+    def test_categories(self):
+        self.assertEqual(self.cache.categories(), ["js assert", "segfault"])
+
+    def test_sort(self):
+        store = self.cache.get()
+
+        self.assertEqual(names(failed_bfs_store.sort(store.bfs, "suite")),
+                         ["a.js", "b.js", "Task", "c.js"])
+        self.assertEqual(names(failed_bfs_store.sort(store.bfs, "name", descending=True)),
+                         ["c.js", "b.js", "a.js", "Task"])
+
+    def test_to_row(self):
+        store = self.cache.get()
+
+        row = failed_bfs_store.to_row(store.find("BF-2", "c.js"))
+        self.assertEqual(row["categories"], ["js assert", "segfault"])
+        self.assertEqual(row["fault_count"], 3)
+        self.assertEqual(row["context_count"], 0)
+
+        row = failed_bfs_store.to_row(store.find("BF-3", "Task"))
+        self.assertEqual(row["categories"], [])
+        self.assertEqual(row["message"], "Skipped large file")
+
+
+if __name__ == '__main__':
+    unittest.main()
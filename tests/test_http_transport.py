@@ -0,0 +1,122 @@
+"""
+Tests for analyzer/http_transport.py, against a local HTTP server
+"""
+import http.server
+import os
+import shutil
+import socketserver
+import tempfile
+import threading
+import unittest
+
+import requests
+
+import analyzer.download
+import analyzer.http_transport
+
+BODY = b"log line\n" * 1000
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    """Serves BODY, /missing is a 404, and the first n requests of /reset/<n> stop halfway
+    through the body
+    """
+
+    protocol_version = "HTTP/1.1"
+    requests_by_path = {}
+
+    def do_GET(self):
+        count = Handler.requests_by_path.get(self.path, 0) + 1
+        Handler.requests_by_path[self.path] = count
+
+        if self.path == "/missing":
+            body = b"Not Found"
+            self.send_response(404)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+
+        if self.path.startswith("/reset/") and count <= int(self.path.split("/")[2]):
+            self.wfile.write(BODY[:len(BODY) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+
+        self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+class TransportTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = Server(("127.0.0.1", 0), Handler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.base = "http://127.0.0.1:%d" % cls.server.server_address[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.file = os.path.join(self.dir, "log")
+
+        Handler.requests_by_path = {}
+        self.transport = analyzer.http_transport.Transport(retries=2, backoff_factor=0.01)
+
+    def read(self):
+        with open(self.file, "rb") as lfh:
+            return lfh.read()
+
+    def test_download(self):
+        record = self.transport.download(self.base + "/log", self.file)
+
+        self.assertEqual(record.size, len(BODY))
+        self.assertEqual(self.read(), BODY)
+        self.assertEqual(self.transport.stats.requests, 1)
+        self.assertEqual(self.transport.stats.bytes, len(BODY))
+
+    def test_error_status_is_not_saved(self):
+        with self.assertRaises(requests.HTTPError):
+            self.transport.download(self.base + "/missing", self.file)
+
+        self.assertFalse(os.path.exists(self.file))
+
+    def test_reset_during_the_body_is_retried(self):
+        self.transport.download(self.base + "/reset/2", self.file)
+
+        self.assertEqual(self.read(), BODY)
+        self.assertEqual(Handler.requests_by_path["/reset/2"], 3)
+        self.assertEqual(self.transport.stats.retries, 2)
+
+    def test_reset_gives_up_after_the_retries(self):
+        with self.assertRaises(analyzer.http_transport.BODY_RETRY_ERRORS):
+            self.transport.download(self.base + "/reset/10", self.file)
+
+        self.assertEqual(Handler.requests_by_path["/reset/10"], 3)
+        self.assertFalse(os.path.exists(self.file))
+        self.assertEqual(os.listdir(self.dir), [])
+
+    def test_too_large(self):
+        with self.assertRaises(analyzer.download.FileTooLargeError):
+            self.transport.download(self.base + "/log", self.file, max_bytes=100)
+
+        self.assertEqual(os.listdir(self.dir), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+"""
+Tests for analyzer/instrumentation.py
+"""
+import threading
+import unittest
+
+import analyzer.instrumentation as instrumentation
+
+
+class RecorderTest(unittest.TestCase):
+    def setUp(self):
+        self.recorder = instrumentation.Recorder()
+
+    def test_stage_stats(self):
+        for duration in (1.0, 2.0, 3.0, 4.0):
+            self.recorder.add_span("download", 0, duration)
+
+        self.assertEqual(self.recorder.report()["stages"]["download"], {
+            "count": 4,
+            "total": 10.0,
+            "p50": 2.0,
+            "p95": 4.0,
+            "max": 4.0
+        })
+
+    def test_bf_stages_have_the_same_stats(self):
+        for duration in (1.0, 2.0, 3.0):
+            self.recorder.add_span("download", 0, duration, bf="BF-1")
+        self.recorder.add_span("download", 0, 10.0)
+        self.recorder.count("cache_hits", 2, bf="BF-2")
+
+        bfs = self.recorder.report()["bfs"]
+
+        self.assertEqual(bfs["BF-1"]["stages"]["download"], {
+            "count": 3,
+            "total": 6.0,
+            "p50": 2.0,
+            "p95": 3.0,
+            "max": 3.0
+        })
+        self.assertEqual(bfs["BF-2"], {"stages": {}, "counters": {"cache_hits": 2}})
+
+    def test_merge_attributes_to_the_current_bf(self):
+        worker = instrumentation.Recorder()
+        worker.add_span("split", 0, 1.0)
+        worker.count("rule_budget_exceeded")
+
+        instrumentation.set_recorder(self.recorder)
+        self.addCleanup(instrumentation.set_recorder, None)
+        with instrumentation.bf_context("BF-1"):
+            self.recorder.merge(worker.export())
+
+        report = self.recorder.report()
+        self.assertEqual(report["bfs"]["BF-1"]["stages"]["split"]["count"], 1)
+        self.assertEqual(report["bfs"]["BF-1"]["counters"], {"rule_budget_exceeded": 1})
+
+    def test_wrap_carries_the_bf_to_another_thread(self):
+        instrumentation.set_recorder(self.recorder)
+        self.addCleanup(instrumentation.set_recorder, None)
+
+        def download():
+            with instrumentation.span("download"):
+                pass
+
+        with instrumentation.bf_context("BF-1"):
+            thread = threading.Thread(target=instrumentation.wrap(download))
+        thread.start()
+        thread.join()
+
+        self.assertEqual(self.recorder.report()["bfs"]["BF-1"]["stages"]["download"]["count"], 1)
+
+    def test_off_without_recorder(self):
+        self.assertIs(instrumentation.span("download"), instrumentation._NULL_SPAN)
+        instrumentation.count("cache_hits")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+"""
+Tests for the paging of analyzer/jira_client.py, against a fake JIRA client
+"""
+import queue
+import threading
+import unittest
+
+import analyzer.jira_client
+
+
+class Page(list):
+    """A page of search results, like jira.client.ResultList"""
+
+    def __init__(self, issues, total):
+        super().__init__(issues)
+        self.total = total
+
+
+class FakeJira(object):
+    """Searches over the issues 0..total-1, the pages starting at short_starts only return
+    half of what was asked for
+    """
+
+    def __init__(self, total, max_page=None, short_starts=()):
+        self.total = total
+        self.max_page = max_page
+        self.short_starts = set(short_starts)
+        self.calls = []
+        self.threads = set()
+
+    def search_issues(self, query, startAt, maxResults, fields):
+        self.calls.append((startAt, maxResults))
+        self.threads.add(threading.get_ident())
+
+        count = maxResults
+        if self.max_page is not None:
+            count = min(count, self.max_page)
+        if startAt in self.short_starts:
+            count = max(count // 2, 1)
+
+        return Page(range(startAt, min(startAt + count, self.total)), self.total)
+
+
+class FakeClient(analyzer.jira_client.jira_client):
+    def __init__(self, jira, page_workers=1):
+        self.jira = jira
+        self.page_workers = page_workers
+        self.sessions = []
+        self._lock = threading.Lock()
+        self._page_sessions = queue.Queue()
+
+    def _new_page_session(self):
+        session = FakeJira(self.jira.total, self.jira.max_page, self.jira.short_starts)
+        self.sessions.append(session)
+        return session
+
+
+class IterIssuesTest(unittest.TestCase):
+    def test_sequential(self):
+        client = FakeClient(FakeJira(250))
+        self.assertEqual(list(client.iter_issues("q", page_size=100)), list(range(250)))
+
+    def test_max_results(self):
+        client = FakeClient(FakeJira(250))
+        self.assertEqual(list(client.iter_issues("q", max_results=30)), list(range(30)))
+
+    def test_concurrent_pages_are_in_order(self):
+        client = FakeClient(FakeJira(1000), page_workers=4)
+        self.assertEqual(list(client.iter_issues("q", page_size=100)), list(range(1000)))
+
+    def test_concurrent_pages_use_their_own_sessions(self):
+        jira = FakeJira(1000)
+        client = FakeClient(jira, page_workers=4)
+        list(client.iter_issues("q", page_size=100))
+
+        # Only the first page is fetched on the shared client
+        self.assertEqual(jira.calls, [(0, 100)])
+        self.assertTrue(client.sessions)
+        self.assertEqual(sum(len(s.calls) for s in client.sessions), 9)
+
+    def test_short_first_page_sets_page_size(self):
+        client = FakeClient(FakeJira(250, max_page=50), page_workers=3)
+        self.assertEqual(list(client.iter_issues("q", page_size=100)), list(range(250)))
+
+    def test_short_concurrent_page_is_completed(self):
+        jira = FakeJira(1000, short_starts=[300, 700])
+        client = FakeClient(jira, page_workers=4)
+        self.assertEqual(list(client.iter_issues("q", page_size=100)), list(range(1000)))
+
+        # The gaps are fetched in order on the shared client
+        self.assertEqual(jira.calls, [(0, 100), (350, 50), (750, 50)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+"""
+Tests for analyzer/jira_sync.py, against a fake jira_client
+"""
+import os
+import re
+import shutil
+import tempfile
+import types
+import unittest
+
+import analyzer.jira_sync
+
+QUERY = "project = BFG ORDER BY created"
+
+
+class FakeJiraClient(object):
+    """Answers the three kinds of queries IssueStore.sync makes: the query itself, the query
+    restricted to recently updated issues, and "key in (...)"
+    """
+
+    def __init__(self):
+        # Key -> updated timestamp, in query order
+        self.members = {}
+        self.recent = set()
+        self.queries = []
+
+    def issue(self, key):
+        return types.SimpleNamespace(
+            key=key,
+            fields=types.SimpleNamespace(updated=self.members[key], summary="summary " + key))
+
+    def search_issues(self, query, max_results, fields):
+        self.queries.append(query)
+
+        m = re.match(r"key in \((.*)\)$", query)
+        if m:
+            keys = m.group(1).split(", ")
+        elif "updated >=" in query:
+            keys = [key for key in self.members if key in self.recent]
+        else:
+            keys = list(self.members)
+
+        if fields == ["key"]:
+            return [types.SimpleNamespace(key=key) for key in keys]
+        return [self.issue(key) for key in keys if key in self.members]
+
+
+class IssueStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.file = os.path.join(self.dir, "bf_store.json")
+
+        self.jira = FakeJiraClient()
+        self.parsed = []
+
+    def parse(self, issue):
+        self.parsed.append(issue.key)
+        return {"issue": issue.key, "summary": issue.fields.summary}
+
+    def sync(self, full=False):
+        store = analyzer.jira_sync.IssueStore(self.file)
+        return [bf["issue"] for bf in store.sync(self.jira, QUERY, self.parse, full)], store
+
+    def test_first_sync_parses_everything_in_order(self):
+        self.jira.members = {"BF-2": "t1", "BF-1": "t1", "BF-3": "t1"}
+
+        keys, store = self.sync()
+
+        self.assertEqual(keys, ["BF-2", "BF-1", "BF-3"])
+        self.assertEqual(self.parsed, ["BF-2", "BF-1", "BF-3"])
+
+    def test_unchanged_issues_are_not_parsed_again(self):
+        self.jira.members = {"BF-1": "t1", "BF-2": "t1"}
+        self.sync()
+        self.parsed = []
+
+        keys, store = self.sync()
+
+        self.assertEqual(keys, ["BF-1", "BF-2"])
+        self.assertEqual(self.parsed, [])
+        self.assertEqual(store.stats.fetched, 0)
+
+    def test_updated_issues_are_parsed_again(self):
+        self.jira.members = {"BF-1": "t1", "BF-2": "t1"}
+        self.sync()
+        self.parsed = []
+
+        self.jira.members["BF-2"] = "t2"
+        self.jira.recent = {"BF-2"}
+        keys, store = self.sync()
+
+        self.assertEqual(self.parsed, ["BF-2"])
+        self.assertTrue(any('updated >= "-' in q and q.endswith(" ORDER BY created")
+                            for q in self.jira.queries))
+
+    def test_issues_leaving_the_query_are_pruned(self):
+        self.jira.members = {"BF-1": "t1", "BF-2": "t1"}
+        self.sync()
+
+        del self.jira.members["BF-1"]
+        keys, store = self.sync()
+
+        self.assertEqual(keys, ["BF-2"])
+        self.assertNotIn("BF-1", store.issues)
+        self.assertEqual(store.stats.pruned, 1)
+
+    def test_issues_joining_without_update_are_fetched(self):
+        self.jira.members = {"BF-1": "t1"}
+        self.sync()
+        self.parsed = []
+
+        self.jira.members["BF-2"] = "t0"
+        keys, store = self.sync()
+
+        self.assertEqual(keys, ["BF-1", "BF-2"])
+        self.assertEqual(self.parsed, ["BF-2"])
+        self.assertIn("key in (BF-2)", self.jira.queries)
+
+    def test_issues_that_cannot_be_parsed_are_skipped(self):
+        self.jira.members = {"BF-1": "t1", "BF-2": "t1", "BF-3": "t1"}
+
+        parse = self.parse
+
+        def parse_or_fail(issue):
+            if issue.key == "BF-2":
+                raise ValueError("no description header")
+            return parse(issue)
+
+        self.parse = parse_or_fail
+        keys, store = self.sync()
+
+        self.assertEqual(keys, ["BF-1", "BF-3"])
+        self.assertEqual(store.stats.failed, 1)
+
+        # Fetched and parsed again on the next sync
+        self.parse = parse
+        self.parsed = []
+        keys, store = self.sync()
+
+        self.assertEqual(keys, ["BF-1", "BF-2", "BF-3"])
+        self.assertEqual(self.parsed, ["BF-2"])
+
+    def test_full_sync_parses_everything(self):
+        self.jira.members = {"BF-1": "t1", "BF-2": "t1"}
+        self.sync()
+        self.parsed = []
+
+        self.sync(full=True)
+
+        self.assertEqual(self.parsed, ["BF-1", "BF-2"])
+
+
+class AddUpdatedClauseTest(unittest.TestCase):
+    def test_keeps_order_by(self):
+        self.assertEqual(
+            analyzer.jira_sync.add_updated_clause("a = b order by created DESC", 15),
+            '(a = b) AND updated >= "-15m" order by created DESC')
+
+    def test_without_order_by(self):
+        self.assertEqual(
+            analyzer.jira_sync.add_updated_clause("a = b", 5), '(a = b) AND updated >= "-5m"')
+
+
+if __name__ == '__main__':
+    unittest.main()
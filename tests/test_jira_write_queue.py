@@ -0,0 +1,163 @@
+"""
+Tests for analyzer/jira_write_queue.py, against a fake jira_client
+"""
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import analyzer.jira_write_queue as jira_write_queue
+
+
+class FakeJiraClient(object):
+    """Records the issues closed, the first failures calls raise"""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.closed = []
+        self._lock = threading.Lock()
+
+    def _close(self, *args):
+        with self._lock:
+            if self.failures:
+                self.failures -= 1
+                raise IOError("jira is down")
+            self.closed.append(args)
+
+    def close_as_duplicate(self, issue, duplicate_issue):
+        self._close("duplicate", issue, duplicate_issue)
+
+    def close_as_goneaway(self, issue):
+        self._close("goneaway", issue)
+
+
+class JiraWriteQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.file = os.path.join(self.dir, "jira_queue.json")
+
+        self.jira = FakeJiraClient()
+        self.done = []
+
+    def queue(self, **kwargs):
+        kwargs.setdefault("retry_delay", 0.01)
+        return jira_write_queue.JiraWriteQueue(
+            lambda: self.jira, self.file, on_done=self.done.append, **kwargs)
+
+    def wait(self, queue, ids, timeout=10):
+        """Wait until the jobs with the given ids are finished, and get them"""
+        deadline = time.time() + timeout
+        while True:
+            jobs = queue.jobs(ids)
+            if all(job["state"] in (jira_write_queue.DONE, jira_write_queue.FAILED)
+                   for job in jobs):
+                return jobs
+
+            self.assertLess(time.time(), deadline, "Jobs did not finish: %s" % jobs)
+            time.sleep(0.01)
+
+    def test_jobs_are_applied_in_order(self):
+        queue = self.queue()
+        jobs = queue.close_as_duplicate(["BF-1", "BF-2"], "BF-0")
+        jobs += queue.close_as_goneaway(["BF-3"])
+
+        finished = self.wait(queue, [job["id"] for job in jobs])
+
+        self.assertEqual([job["state"] for job in finished], [jira_write_queue.DONE] * 3)
+        self.assertEqual(self.jira.closed, [("duplicate", "BF-1", "BF-0"),
+                                            ("duplicate", "BF-2", "BF-0"), ("goneaway", "BF-3")])
+
+        # on_done is called after the job is marked as done
+        deadline = time.time() + 10
+        while len(self.done) < 3 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual([job["issue"] for job in self.done], ["BF-1", "BF-2", "BF-3"])
+
+    def test_failures_are_retried_with_backoff(self):
+        self.jira.failures = 2
+        queue = self.queue(retry_delay=0.05)
+
+        start = time.time()
+        job, = self.wait(queue, [queue.close_as_goneaway(["BF-1"])[0]["id"]])
+
+        self.assertEqual(job["state"], jira_write_queue.DONE)
+        self.assertEqual(job["attempts"], 3)
+        self.assertIsNone(job["error"])
+
+        # 0.05s before the second attempt, 0.1s before the third
+        self.assertGreaterEqual(time.time() - start, 0.15)
+
+    def test_job_fails_after_max_attempts(self):
+        self.jira.failures = 10
+        queue = self.queue(max_attempts=3)
+
+        job, = self.wait(queue, [queue.close_as_goneaway(["BF-1"])[0]["id"]])
+
+        self.assertEqual(job["state"], jira_write_queue.FAILED)
+        self.assertEqual(job["attempts"], 3)
+        self.assertEqual(job["error"], "jira is down")
+        self.assertEqual(self.done, [])
+        self.assertEqual(queue.to_dict()[jira_write_queue.FAILED], 1)
+
+    def test_callback_failure_does_not_stop_the_worker(self):
+        queue = self.queue()
+
+        def on_done(job):
+            raise ValueError("cache is gone")
+
+        queue.on_done = on_done
+
+        jobs = queue.close_as_goneaway(["BF-1", "BF-2"])
+        finished = self.wait(queue, [job["id"] for job in jobs])
+
+        self.assertEqual([job["state"] for job in finished], [jira_write_queue.DONE] * 2)
+
+    def test_queue_is_saved(self):
+        queue = self.queue()
+        job, = self.wait(queue, [queue.close_as_goneaway(["BF-1"])[0]["id"]])
+
+        with open(self.file, "rb") as qfh:
+            root = json.loads(qfh.read().decode('utf-8'))
+
+        self.assertEqual(root["next_id"], 2)
+        self.assertEqual(root["jobs"], [job])
+
+    def test_restart_requeues_running_jobs(self):
+        now = time.time()
+        job = {
+            "id": 7,
+            "action": jira_write_queue.CLOSE_DUPLICATE,
+            "issue": "BF-1",
+            "duplicate_issue": "BF-0",
+            "state": jira_write_queue.RUNNING,
+            "attempts": 1,
+            "error": None,
+            "created": now,
+            "updated": now,
+            "not_before": now
+        }
+        with open(self.file, "wb") as qfh:
+            qfh.write(json.dumps({"next_id": 8, "jobs": [job]}).encode())
+
+        queue = self.queue()
+        self.assertEqual(queue.jobs()[0]["state"], jira_write_queue.QUEUED)
+
+        queue.start()
+        finished, = self.wait(queue, [7])
+
+        self.assertEqual(finished["state"], jira_write_queue.DONE)
+        self.assertEqual(finished["attempts"], 2)
+        self.assertEqual(self.jira.closed, [("duplicate", "BF-1", "BF-0")])
+
+        # New jobs continue the numbering
+        job, = queue.close_as_goneaway(["BF-2"])
+        self.assertEqual(job["id"], 8)
+        self.wait(queue, [8])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,194 @@
+"""
+Tests for analyzer/log_cache.py, run from the repository root with python -m pytest tests
+"""
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import analyzer.download
+import analyzer.log_cache
+import analyzer.log_reader
+
+
+def write_retrieve(contents):
+    """Get a retrieve function that writes contents, and the list of urls it was called for"""
+    calls = []
+
+    def retrieve(url, file):
+        calls.append(url)
+        with open(file, "wb") as lfh:
+            lfh.write(contents[url])
+
+    return retrieve, calls
+
+
+def too_large_retrieve(size):
+    """Get a retrieve function that finds every log too large, and the list of urls it was
+    called for
+    """
+    calls = []
+
+    def retrieve(url, file, max_bytes=None):
+        calls.append(url)
+        if size > max_bytes:
+            raise analyzer.download.FileTooLargeError(url, size)
+        with open(file, "wb") as lfh:
+            lfh.write(b"x" * size)
+
+    return retrieve, calls
+
+
+def read_log(path):
+    with analyzer.log_reader.open_log(path) as lfh:
+        return lfh.read()
+
+
+class LogCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+
+    def cache(self, budget=analyzer.log_cache.DEFAULT_BUDGET, offline=False):
+        return analyzer.log_cache.LogCache(self.root, budget, offline)
+
+    def test_get_downloads_once(self):
+        retrieve, calls = write_retrieve({"a": b"log a\n"})
+        cache = self.cache()
+
+        path = cache.get("a", retrieve)
+        self.assertEqual(cache.get("a", retrieve), path)
+
+        self.assertEqual(calls, ["a"])
+        self.assertEqual(read_log(path), b"log a\n")
+        self.assertEqual(cache.stats.hits, 0)
+        self.assertEqual(cache.stats.misses, 1)
+
+    def test_same_content_is_stored_once(self):
+        retrieve, calls = write_retrieve({"a": b"same\n", "b": b"same\n"})
+        cache = self.cache()
+
+        self.assertEqual(cache.get("a", retrieve), cache.get("b", retrieve))
+        self.assertEqual(cache.content_hash("a"), cache.content_hash("b"))
+
+    def test_offline_raises_for_missing_logs(self):
+        retrieve, calls = write_retrieve({})
+        with self.assertRaises(analyzer.log_cache.NotCachedError):
+            self.cache(offline=True).get("a", retrieve)
+        self.assertEqual(calls, [])
+
+    def test_evicts_least_recently_used(self):
+        contents = dict((url, os.urandom(4096)) for url in ["a", "b", "c"])
+        retrieve, calls = write_retrieve(contents)
+        cache = self.cache(budget=2 * 4096 + 1024)
+
+        cache.get("a", retrieve)
+        time.sleep(0.01)
+        cache.get("b", retrieve)
+        time.sleep(0.01)
+        cache.get("a", retrieve)
+        time.sleep(0.01)
+        cache.get("c", retrieve)
+
+        self.assertTrue(cache.contains("a"))
+        self.assertFalse(cache.contains("b"))
+        self.assertTrue(cache.contains("c"))
+        self.assertEqual(cache.stats.evictions, 1)
+
+    def test_pinned_blobs_are_not_evicted(self):
+        contents = dict((url, os.urandom(4096)) for url in ["a", "b", "c"])
+        retrieve, calls = write_retrieve(contents)
+        cache = self.cache(budget=4096 + 1024)
+
+        pinned = cache.get("a", retrieve, pin=True)
+        cache.get("b", retrieve)
+
+        # Over the budget until the pin is released
+        self.assertTrue(os.path.exists(pinned))
+        self.assertTrue(cache.contains("b"))
+        self.assertEqual(cache.stats.evictions, 0)
+
+        cache.release(pinned)
+        cache.get("c", retrieve)
+        self.assertFalse(os.path.exists(pinned))
+
+    def test_lookup_pin(self):
+        contents = dict((url, os.urandom(4096)) for url in ["a", "b"])
+        retrieve, calls = write_retrieve(contents)
+        cache = self.cache(budget=4096 + 1024)
+
+        cache.get("a", retrieve)
+        pinned = cache.lookup("a", touch=False, pin=True)
+        cache.get("b", retrieve)
+        self.assertTrue(cache.contains("a"))
+
+        cache.release(pinned)
+
+    def test_access_times_are_flushed(self):
+        retrieve, calls = write_retrieve({"a": b"log a\n"})
+        cache = self.cache()
+        cache.get("a", retrieve)
+
+        index_file = os.path.join(self.root, "index.json")
+        with open(index_file, "rb") as ifh:
+            stored = json.loads(ifh.read().decode('utf-8'))["a"]["last_access"]
+
+        time.sleep(0.01)
+        cache.lookup("a")
+        with open(index_file, "rb") as ifh:
+            self.assertEqual(json.loads(ifh.read().decode('utf-8'))["a"]["last_access"], stored)
+
+        cache.flush()
+        with open(index_file, "rb") as ifh:
+            self.assertGreater(json.loads(ifh.read().decode('utf-8'))["a"]["last_access"], stored)
+
+    def test_index_is_reloaded(self):
+        retrieve, calls = write_retrieve({"a": b"log a\n"})
+        path = self.cache().get("a", retrieve)
+
+        self.assertEqual(self.cache().get("a", retrieve), path)
+        self.assertEqual(calls, ["a"])
+
+    def test_missing_blob_is_downloaded_again(self):
+        retrieve, calls = write_retrieve({"a": b"log a\n"})
+        cache = self.cache()
+        os.remove(cache.get("a", retrieve))
+
+        self.assertEqual(read_log(cache.get("a", retrieve)), b"log a\n")
+        self.assertEqual(calls, ["a", "a"])
+
+    def test_too_large_is_remembered(self):
+        retrieve, calls = too_large_retrieve(100)
+
+        # A new cache reads the verdict from the index of the first one
+        for _ in range(2):
+            cache = self.cache()
+            with self.assertRaises(analyzer.download.FileTooLargeError) as raised:
+                cache.get("a", retrieve, max_bytes=10)
+            self.assertEqual(raised.exception.size, 100)
+            cache.flush()
+
+        self.assertEqual(calls, ["a"])
+        self.assertEqual(cache.stats.too_large, 1)
+        self.assertFalse(cache.contains("a"))
+        self.assertIsNone(cache.lookup("a"))
+
+    def test_too_large_is_downloaded_with_a_larger_cap(self):
+        retrieve, calls = too_large_retrieve(100)
+        cache = self.cache()
+
+        with self.assertRaises(analyzer.download.FileTooLargeError):
+            cache.get("a", retrieve, max_bytes=10)
+        path = cache.get("a", retrieve, max_bytes=1000)
+
+        self.assertEqual(calls, ["a", "a"])
+        self.assertEqual(read_log(path), b"x" * 100)
+
+        # The verdict is gone with the cached log
+        self.assertEqual(cache.get("a", retrieve, max_bytes=10), path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+"""
+Tests for analyzer/results_store.py
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import analyzer.results_store
+
+
+def make_bf(issue, tests=()):
+    return {
+        "issue": issue,
+        "summary": "Failures on " + issue,
+        "type": "test",
+        "project": "mongodb-mongo-master",
+        "task_url": "https://evergreen/task/" + issue,
+        "suite": "core",
+        "build_variant": "linux",
+        "tests": [{"name": name, "log_file": "https://logs/" + name} for name in tests]
+    }
+
+
+def make_result(issue, name, category=None):
+    faults = []
+    if category is not None:
+        faults.append({"category": category, "source": "shell", "line_number": 1})
+    return {"test": {"issue": issue, "name": name}, "summary": {"faults": faults, "contexts": []}}
+
+
+class ResultsStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.file = os.path.join(self.dir, "bfg.db")
+        self.store = self.open_store()
+
+    def open_store(self):
+        store = analyzer.results_store.ResultsStore(self.file)
+        self.addCleanup(store.close)
+        return store
+
+    def test_tickets_round_trip_in_query_order(self):
+        bfs = [make_bf("BF-2", ["b.js", "a.js"]), make_bf("BF-1")]
+        self.store.set_tickets("q", "today", bfs)
+
+        self.assertEqual(self.store.tickets(), bfs)
+        self.assertEqual(self.store.run(), {"query": "q", "date": "today"})
+
+    def test_empty_store(self):
+        self.assertIsNone(self.store.run())
+        self.assertEqual(self.store.tickets(), [])
+        self.assertEqual(self.store.results(), [])
+
+    def test_results_are_in_query_order(self):
+        self.store.set_tickets("q", "today", [make_bf("BF-2"), make_bf("BF-1")])
+        self.store.save_results("BF-1", [make_result("BF-1", "a.js")])
+        self.store.save_results("BF-2", [make_result("BF-2", "c.js"), make_result("BF-2", "b.js")])
+
+        self.assertEqual([r["test"]["name"] for r in self.store.results()],
+                         ["c.js", "b.js", "a.js"])
+
+    def test_save_results_replaces(self):
+        self.store.set_tickets("q", "today", [make_bf("BF-1")])
+        self.store.save_results("BF-1", [make_result("BF-1", "a.js"), make_result("BF-1", "b.js")])
+        self.store.save_results("BF-1", [make_result("BF-1", "c.js", "js assert")])
+
+        self.assertEqual(self.store.results(), [make_result("BF-1", "c.js", "js assert")])
+
+    def test_failed_replace_keeps_previous_results(self):
+        self.store.set_tickets("q", "today", [make_bf("BF-1")])
+        self.store.save_results("BF-1", [make_result("BF-1", "a.js")])
+
+        # The second result fails to serialize after the old results were deleted
+        with self.assertRaises(TypeError):
+            self.store.save_results("BF-1", [
+                make_result("BF-1", "b.js"), {"test": {"name": "c.js"}, "summary": object()}
+            ])
+
+        self.assertEqual(self.store.results(), [make_result("BF-1", "a.js")])
+
+    def test_set_tickets_keeps_results_of_issues_still_in_the_query(self):
+        self.store.set_tickets("q", "today", [make_bf("BF-1"), make_bf("BF-2")])
+        self.store.save_results("BF-1", [make_result("BF-1", "a.js")])
+        self.store.save_results("BF-2", [make_result("BF-2", "b.js")])
+
+        self.store.set_tickets("q", "tomorrow", [make_bf("BF-2"), make_bf("BF-3")])
+
+        self.assertEqual(self.store.results(), [make_result("BF-2", "b.js")])
+        self.assertEqual([bf["issue"] for bf in self.store.tickets()], ["BF-2", "BF-3"])
+
+    def test_results_are_visible_to_other_connections(self):
+        self.store.set_tickets("q", "today", [make_bf("BF-1")])
+        self.store.save_results("BF-1", [make_result("BF-1", "a.js")])
+
+        self.assertEqual(self.open_store().results(), [make_result("BF-1", "a.js")])
+
+    def test_data_version_changes_on_commits_of_other_connections(self):
+        reader = self.open_store()
+        version = reader.data_version()
+        self.assertEqual(reader.data_version(), version)
+
+        self.store.set_tickets("q", "today", [make_bf("BF-1")])
+        self.assertNotEqual(reader.data_version(), version)
+
+    def test_results_filters(self):
+        self.store.set_tickets("q", "today", [make_bf("BF-1"), make_bf("BF-2")])
+        skipped = {"test": {"issue": "BF-1", "name": "c.js"}, "summary": "Skipping Large File : 1"}
+        self.store.save_results("BF-1", [
+            make_result("BF-1", "a.js", "js assert"),
+            make_result("BF-1", "b.js", "crash"), skipped
+        ])
+        self.store.save_results("BF-2", [make_result("BF-2", "d.js", "js assert")])
+
+        def names(**filters):
+            return [r["test"]["name"] for r in self.store.results(**filters)]
+
+        self.assertEqual(names(issue="BF-1"), ["a.js", "b.js", "c.js"])
+        self.assertEqual(names(task_url="https://evergreen/task/BF-2"), ["d.js"])
+        self.assertEqual(names(category="js assert"), ["a.js", "d.js"])
+        self.assertEqual(names(issue="BF-1", category="js assert"), ["a.js"])
+        self.assertEqual(names(category="unknown"), [])
+
+    def test_categories(self):
+        result = make_result("BF-1", "a.js", "js assert")
+        result["summary"]["faults"].append(result["summary"]["faults"][0])
+        result["summary"]["contexts"].append({"category": "context", "line_number": 2})
+
+        self.store.set_tickets("q", "today", [make_bf("BF-1")])
+        self.store.save_results("BF-1", [result, make_result("BF-1", "b.js", "crash")])
+
+        # Each result is counted once per category, contexts are not counted
+        self.assertEqual(self.store.categories(), {"js assert": 1, "crash": 1})
+
+    def test_faults_are_replaced_with_their_results(self):
+        self.store.set_tickets("q", "today", [make_bf("BF-1"), make_bf("BF-2")])
+        self.store.save_results("BF-1", [make_result("BF-1", "a.js", "js assert")])
+        self.store.save_results("BF-2", [make_result("BF-2", "b.js", "crash")])
+
+        self.store.save_results("BF-1", [make_result("BF-1", "a.js", "crash")])
+        self.assertEqual(self.store.categories(), {"crash": 2})
+
+        self.store.set_tickets("q", "tomorrow", [make_bf("BF-1")])
+        self.assertEqual(self.store.categories(), {"crash": 1})
+
+if __name__ == '__main__':
+    unittest.main()
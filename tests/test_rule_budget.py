@@ -0,0 +1,112 @@
+"""
+Tests for the rule budget of analyzer/log_file_analyzer.py
+
+The budget is enforced with a SIGALRM timer when the regex module is not installed, which only
+works on the main thread of Unix processes, like the tests here.
+"""
+import contextlib
+import io
+import json
+import threading
+import unittest
+
+import analyzer.fingerprint as fingerprint
+import analyzer.instrumentation as instrumentation
+import analyzer.log_file_analyzer as log_file_analyzer
+
+PREFIX = b"[js_test:x] 2017-01-01T00:00:00.000+0000 "
+
+# STOPERROR backtracks through every "failed" line looking for a "js" after it
+SLOW_LOG = (PREFIX + b"assert: count failed in jstests/core/count.js\n" + PREFIX +
+            b"StopError: failed js\n" + b"".join(PREFIX + b"failed %d\n" % i for i in range(20000)))
+
+FAST_LOG = PREFIX + b"assert: count failed in jstests/core/count.js\n"
+
+
+def analyze(log, rule_budget):
+    splits = log_file_analyzer.LogFileSplitter(io.BytesIO(log)).getsplits()
+    analyzer = log_file_analyzer.LogFileAnalyzer(splits, profile=True, rule_budget=rule_budget)
+    analyzer.analyze()
+    return analyzer
+
+
+def categories(faults):
+    return [f.category for f in faults]
+
+
+class RuleBudgetTest(unittest.TestCase):
+    def test_within_budget(self):
+        analyzer = analyze(FAST_LOG, 10.0)
+
+        self.assertFalse(analyzer.budget_exceeded)
+        self.assertEqual(categories(analyzer.get_faults()), ["js assert"])
+        self.assertNotIn(log_file_analyzer.BUDGET_EXCEEDED, categories(analyzer.get_contexts()))
+
+    def test_overrun_is_reported(self):
+        analyzer = analyze(SLOW_LOG, 0.1)
+
+        self.assertTrue(analyzer.budget_exceeded)
+        contexts = [c for c in analyzer.get_contexts()
+                    if c.category == log_file_analyzer.BUDGET_EXCEEDED]
+        self.assertEqual(len(contexts), 1)
+        self.assertIn(log_file_analyzer.STOPERROR.pattern, contexts[0].context)
+
+        overruns = [r for r in analyzer.profile.ranked() if r["overruns"]]
+        self.assertEqual([r["pattern"] for r in overruns], [log_file_analyzer.STOPERROR.pattern])
+
+    def test_overrun_stops_the_classification(self):
+        # The js assert would be the fault if StopError had been checked and did not match
+        analyzer = analyze(SLOW_LOG, 0.1)
+
+        self.assertEqual(analyzer.get_faults(), [])
+
+    @unittest.skipIf(log_file_analyzer.regex is not None, "the regex module works on any thread")
+    def test_unlimited_searches_are_reported(self):
+        recorder = instrumentation.Recorder()
+        instrumentation.set_recorder(recorder)
+        self.addCleanup(instrumentation.set_recorder, None)
+
+        log_file_analyzer._unlimited_reported = False
+        output = io.StringIO()
+
+        def analyze_twice():
+            analyze(FAST_LOG, 10.0)
+            analyze(FAST_LOG, 10.0)
+
+        with contextlib.redirect_stdout(output):
+            thread = threading.Thread(target=analyze_twice)
+            thread.start()
+            thread.join()
+
+        self.assertEqual(output.getvalue().count("rule budget is only enforced"), 1)
+        self.assertGreater(recorder.report()["counters"]["rule_budget_unenforced"], 1)
+
+
+class FingerprintTest(unittest.TestCase):
+    def summary(self, log, rule_budget):
+        summary = json.loads(analyze(log, rule_budget).to_json())
+        summary["fingerprint"] = fingerprint.summary_fingerprint("url", "hash", summary,
+                                                                 rule_budget)
+        return summary
+
+    def is_current(self, summary, rule_budget):
+        return fingerprint.is_current(summary, lambda url: "hash", rule_budget)
+
+    def test_summary_within_budget_is_current_for_any_budget(self):
+        summary = self.summary(FAST_LOG, 10.0)
+
+        self.assertNotIn("rule_budget", summary["fingerprint"])
+        self.assertTrue(self.is_current(summary, 10.0))
+        self.assertTrue(self.is_current(summary, None))
+
+    def test_summary_over_budget_is_current_for_the_same_budget(self):
+        summary = self.summary(SLOW_LOG, 0.1)
+
+        self.assertTrue(fingerprint.over_budget(summary))
+        self.assertTrue(self.is_current(summary, 0.1))
+        self.assertFalse(self.is_current(summary, 60.0))
+        self.assertFalse(self.is_current(summary, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
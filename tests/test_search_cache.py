@@ -0,0 +1,170 @@
+"""
+Tests for analyzer/search_cache.py, against a fake jira_client
+"""
+import collections
+import threading
+import unittest
+
+import analyzer.search_cache as search_cache
+
+Issue = collections.namedtuple("Issue", ["key"])
+
+
+class FakeJiraClient(object):
+    """Answers each search with the issues in results, numbered by the search they came from
+
+    While block is cleared, searches wait for it to be set.
+    """
+
+    def __init__(self, results):
+        self.results = results
+        self.searches = 0
+        self.fail = False
+        self.block = threading.Event()
+        self.block.set()
+        self.searched = threading.Event()
+        self._lock = threading.Lock()
+
+    def search_issues(self, query, fields):
+        with self._lock:
+            self.searches += 1
+            count = self.searches
+        self.searched.set()
+
+        self.block.wait()
+        if self.fail:
+            raise IOError("jira is down")
+        return [Issue(key) for key in self.results[query]] + [Issue("search-%d" % count)]
+
+
+class SearchCache(search_cache.SearchCache):
+    """Signals the end of each background refresh"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.refreshed = threading.Semaphore(0)
+
+    def _refresh(self, *args):
+        try:
+            super()._refresh(*args)
+        finally:
+            self.refreshed.release()
+
+
+def keys(issues):
+    return [issue.key for issue in issues]
+
+
+class SearchCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.jira = FakeJiraClient({"q1": ["BF-1", "BF-2"], "q2": ["BF-2"], "q3": ["BF-3"]})
+
+    def wait_for_refresh(self, cache):
+        self.assertTrue(cache.refreshed.acquire(timeout=5))
+
+    def test_fresh_results_are_reused(self):
+        cache = SearchCache(self.jira)
+
+        first = cache.search_issues("q1", ["summary"])
+        second = cache.search_issues("q1", ["summary"])
+
+        self.assertEqual(keys(first), ["BF-1", "BF-2", "search-1"])
+        self.assertIs(second, first)
+        self.assertEqual(self.jira.searches, 1)
+        self.assertEqual(cache.stats.hits, 1)
+        self.assertEqual(cache.stats.misses, 1)
+
+    def test_fields_are_part_of_the_key(self):
+        cache = SearchCache(self.jira)
+
+        cache.search_issues("q1", ["summary"])
+        cache.search_issues("q1", ["summary", "status"])
+
+        self.assertEqual(self.jira.searches, 2)
+
+    def test_stale_results_are_returned_while_refreshed(self):
+        cache = SearchCache(self.jira, ttl=0, stale_ttl=3600)
+        cache.search_issues("q1", ["summary"])
+
+        self.jira.block.clear()
+        self.jira.searched.clear()
+
+        # Both callers get the stale results without waiting, and share one refresh
+        for _ in range(2):
+            self.assertEqual(keys(cache.search_issues("q1", ["summary"]))[-1], "search-1")
+        self.assertTrue(self.jira.searched.wait(5))
+
+        self.jira.block.set()
+        self.wait_for_refresh(cache)
+
+        self.assertEqual(keys(cache.search_issues("q1", ["summary"]))[-1], "search-2")
+        self.wait_for_refresh(cache)
+        self.assertEqual(self.jira.searches, 3)
+        self.assertEqual(cache.stats.stale_hits, 3)
+        self.assertEqual(cache.stats.refreshes, 2)
+
+    def test_failed_refresh_keeps_the_stale_results(self):
+        cache = SearchCache(self.jira, ttl=0, stale_ttl=3600)
+        cache.search_issues("q1", ["summary"])
+
+        self.jira.fail = True
+        cache.search_issues("q1", ["summary"])
+        self.wait_for_refresh(cache)
+
+        self.assertEqual(self.jira.searches, 2)
+        self.assertEqual(keys(cache.search_issues("q1", ["summary"]))[-1], "search-1")
+        self.wait_for_refresh(cache)
+
+    def test_expired_results_are_searched_again(self):
+        cache = SearchCache(self.jira, ttl=0, stale_ttl=0)
+
+        cache.search_issues("q1", ["summary"])
+        results = cache.search_issues("q1", ["summary"])
+
+        self.assertEqual(keys(results)[-1], "search-2")
+        self.assertEqual(cache.stats.misses, 2)
+        self.assertEqual(cache.stats.refreshes, 0)
+
+    def test_invalidate_after_a_close(self):
+        cache = SearchCache(self.jira)
+        for query in ("q1", "q2", "q3"):
+            cache.search_issues(query, ["summary"])
+
+        cache.invalidate_issue("BF-2")
+
+        self.assertEqual(cache.stats.invalidations, 2)
+        self.assertEqual(cache.to_dict()["entries"], 1)
+
+        # The searches that included the closed BF wait for Jira again, the others do not
+        self.assertEqual(keys(cache.search_issues("q1", ["summary"]))[-1], "search-4")
+        self.assertEqual(keys(cache.search_issues("q3", ["summary"]))[-1], "search-3")
+        self.assertEqual(self.jira.searches, 4)
+
+    def test_least_recently_used_are_dropped(self):
+        cache = SearchCache(self.jira, max_entries=2)
+
+        cache.search_issues("q1", ["summary"])
+        cache.search_issues("q2", ["summary"])
+        cache.search_issues("q1", ["summary"])
+        cache.search_issues("q3", ["summary"])
+
+        self.assertEqual(self.jira.searches, 3)
+        cache.search_issues("q1", ["summary"])
+        self.assertEqual(self.jira.searches, 3)
+        cache.search_issues("q2", ["summary"])
+        self.assertEqual(self.jira.searches, 4)
+
+    def test_to_dict(self):
+        cache = SearchCache(self.jira, ttl=1, stale_ttl=2, max_entries=3)
+        cache.search_issues("q1", ["summary"])
+        cache.search_issues("q1", ["summary"])
+
+        d = cache.to_dict()
+
+        self.assertEqual(d["hit_rate"], 0.5)
+        self.assertEqual(d["jira_searches"], 1)
+        self.assertEqual((d["entries"], d["ttl"], d["stale_ttl"], d["max_entries"]), (1, 1, 2, 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
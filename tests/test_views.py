@@ -0,0 +1,183 @@
+"""
+Tests for the json api of www/www/views.py, with the Flask test client
+"""
+import gzip
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import analyzer.results_store
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The web server's package is www/www, not the www directory at the repository root
+sys.path.insert(0, os.path.join(ROOT_DIR, "www"))
+
+from www import app
+from www import failed_bfs_store
+from www import views
+
+ISSUES = 30
+
+
+def make_bf(number):
+    issue = "BF-%d" % number
+    return {
+        "issue": issue,
+        "summary": "Failures on " + issue,
+        "type": "test",
+        "project": "mongodb-mongo-master",
+        "task_url": "https://evergreen/task/%d" % (number % 3),
+        "suite": "core" if number % 2 else "sharding",
+        "build_variant": "linux",
+        "tests": []
+    }
+
+
+def make_results(bf, number):
+    test = dict((k, bf[k]) for k in ("issue", "summary", "type", "suite", "build_variant",
+                                      "task_url"))
+    test["name"] = "test_%02d.js" % number
+    category = "js assert" if number % 5 == 0 else "segfault"
+    summary = {"faults": [{"category": category, "source": "shell", "line_number": 1}],
+               "contexts": []}
+    return [{"test": test, "summary": summary}]
+
+
+class ViewsTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        file = os.path.join(self.dir, "bfg.db")
+
+        # bfg_analyzer writes through its own connection, as a separate process would
+        self.writer = analyzer.results_store.ResultsStore(file)
+        self.addCleanup(self.writer.close)
+
+        # Issues in reverse order, so the query order is not the sort order
+        bfs = [make_bf(number) for number in range(ISSUES, 0, -1)]
+        self.writer.set_tickets("project = BFG", "2017-01-01", bfs)
+        for number, bf in zip(range(ISSUES, 0, -1), bfs):
+            self.writer.save_results(bf["issue"], make_results(bf, number))
+
+        reader = analyzer.results_store.ResultsStore(file)
+        self.addCleanup(reader.close)
+
+        self.addCleanup(setattr, views, "failed_bfs_cache", views.failed_bfs_cache)
+        views.failed_bfs_cache = failed_bfs_store.FailedBFStore(reader)
+
+        self.client = app.test_client()
+
+    def failures(self, query=""):
+        response = self.client.get("/api/failures" + query)
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()
+
+    def issues(self, query=""):
+        return [row["issue"] for row in self.failures(query)["rows"]]
+
+    def test_default_page(self):
+        result = self.failures()
+
+        self.assertEqual(result["total"], ISSUES)
+        self.assertEqual(len(result["rows"]), ISSUES)
+        self.assertEqual(result["rows"][0], {
+            "issue": "BF-30",
+            "name": "test_30.js",
+            "summary": "Failures on BF-30",
+            "type": "test",
+            "suite": "sharding",
+            "build_variant": "linux",
+            "categories": ["js assert"],
+            "fault_count": 1,
+            "context_count": 0,
+        })
+
+    def test_pagination(self):
+        result = self.failures("?offset=5&limit=3")
+
+        self.assertEqual(result["total"], ISSUES)
+        self.assertEqual([row["issue"] for row in result["rows"]], ["BF-25", "BF-24", "BF-23"])
+
+        self.assertEqual(self.issues("?offset=28&limit=10"), ["BF-2", "BF-1"])
+        self.assertEqual(self.issues("?offset=40"), [])
+        self.assertEqual(self.issues("?offset=-5&limit=1"), ["BF-30"])
+        self.assertEqual(self.issues("?limit=0"), [])
+        self.assertEqual(len(self.issues("?limit=%d" % (views.MAX_PAGE_LIMIT + 1))), ISSUES)
+
+    def test_sort(self):
+        self.assertEqual(self.issues("?sort=name&limit=3"), ["BF-1", "BF-2", "BF-3"])
+        self.assertEqual(self.issues("?sort=name&order=desc&limit=3"), ["BF-30", "BF-29", "BF-28"])
+
+        # Unknown fields keep the query order
+        self.assertEqual(self.issues("?sort=log_file&limit=2"), ["BF-30", "BF-29"])
+
+    def test_search_and_filters(self):
+        self.assertEqual(self.issues("?search=TEST_1"),
+                         ["BF-19", "BF-18", "BF-17", "BF-16", "BF-15", "BF-14", "BF-13", "BF-12",
+                          "BF-11", "BF-10"])
+
+        result = self.failures("?search=TEST_1&suite=core&limit=2")
+        self.assertEqual(result["total"], 5)
+        self.assertEqual([row["issue"] for row in result["rows"]], ["BF-19", "BF-17"])
+
+        self.assertEqual(self.issues("?category=js+assert"),
+                         ["BF-30", "BF-25", "BF-20", "BF-15", "BF-10", "BF-5"])
+        self.assertEqual(self.issues("?category=js+assert&task_url=https://evergreen/task/0"),
+                         ["BF-30", "BF-15"])
+
+    def test_etag(self):
+        response = self.client.get("/api/failures?limit=5")
+        etag = response.headers["ETag"]
+
+        self.assertEqual(response.headers["Cache-Control"], "no-cache")
+
+        response = self.client.get("/api/failures?limit=5", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b"")
+
+        # Another request of the same results has its own ETag
+        response = self.client.get("/api/failures?limit=6", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+
+        # So do the results of the next write
+        self.writer.save_results("BF-30", [])
+        response = self.client.get("/api/failures?limit=5", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+        self.assertEqual(response.get_json()["total"], ISSUES - 1)
+
+    def test_gzip(self):
+        plain = self.client.get("/api/failures")
+        response = self.client.get("/api/failures", headers={"Accept-Encoding": "gzip"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(response.headers["Vary"], "Accept-Encoding")
+        self.assertNotIn("Content-Encoding", plain.headers)
+        self.assertNotEqual(response.headers["ETag"], plain.headers["ETag"])
+
+        self.assertEqual(json.loads(gzip.decompress(response.data).decode()), plain.get_json())
+
+        response = self.client.get(
+            "/api/failures",
+            headers={"Accept-Encoding": "gzip", "If-None-Match": response.headers["ETag"]})
+        self.assertEqual(response.status_code, 304)
+
+    def test_failure_details(self):
+        response = self.client.get("/api/failure_details?issue=BF-7&test_name=test_07.js")
+
+        self.assertEqual(response.status_code, 200)
+        details = response.get_json()
+        self.assertEqual(details["task_url"], "https://evergreen/task/1")
+        self.assertEqual(details["faults"][0]["category"], "segfault")
+
+        response = self.client.get("/api/failure_details?issue=BF-7&test_name=test_08.js")
+        self.assertEqual(response.status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+"""
+Indexed in-memory copy of the analysis results in bfg.db for the web server
+"""
+import threading
+import time
+
+# Fields of a failed BF's test that rows can be sorted by
+SORT_FIELDS = ["issue", "name", "summary", "type", "suite", "build_variant"]
+
+
+class FailedBFs(object):
+    """The query, date and results of the last run, indexed for lookups
+
+    Each index maps a value to the positions in bfs of the failed BFs with it, in query order.
+    Fault categories and task urls are indexed by the results store, see FailedBFStore.filter.
+    """
+
+    def __init__(self, root, version):
+        self.query = root['query']
+        self.date = root['date']
+        self.bfs = root['bfs']
+        self.version = version
+
+        self.by_issue_test = {}
+        self.by_suite = {}
+        self.by_variant = {}
+        self.by_type = {}
+
+        for position, failed_bf in enumerate(self.bfs):
+            test = failed_bf["test"]
+
+            # The last one wins, like the linear search this replaces
+            self.by_issue_test[(test["issue"], test.get("name"))] = failed_bf
+
+            self.by_suite.setdefault(test.get("suite"), []).append(position)
+            self.by_variant.setdefault(test.get("build_variant"), []).append(position)
+            self.by_type.setdefault(test.get("type"), []).append(position)
+
+    def find(self, issue, test_name):
+        """Get the failed BF for a test of an issue, or None"""
+        return self.by_issue_test.get((issue, test_name))
+
+    def filter(self, suite=None, variant=None, type=None, search=None):
+        """Get the failed BFs matching all the given filters, in query order
+
+        search is a case insensitive substring of the issue, test name or summary.
+        """
+        positions = None
+        for index, value in ((self.by_suite, suite), (self.by_variant, variant),
+                             (self.by_type, type)):
+            if not value:
+                continue
+
+            matches = index.get(value, [])
+            if positions is None:
+                positions = matches
+            else:
+                match_set = set(matches)
+                positions = [p for p in positions if p in match_set]
+
+        if positions is None:
+            failed_bfs = self.bfs
+        else:
+            failed_bfs = [self.bfs[p] for p in positions]
+
+        if search:
+            search = search.lower()
+            failed_bfs = [
+                failed_bf for failed_bf in failed_bfs
+                if any(search in str(failed_bf["test"].get(field, "")).lower()
+                       for field in ("issue", "name", "summary"))
+            ]
+
+        return failed_bfs
+
+
+def categories(failed_bf):
+    """Get the distinct fault categories of a failed BF"""
+    summary = failed_bf["summary"]
+    if not isinstance(summary, dict):
+        return []
+
+    found = []
+    for fault in summary.get("faults", []):
+        if fault["category"] not in found:
+            found.append(fault["category"])
+    return found
+
+
+def sort(failed_bfs, field, descending=False):
+    """Sort failed BFs by one of the SORT_FIELDS of their test"""
+    return sorted(
+        failed_bfs, key=lambda failed_bf: str(failed_bf["test"].get(field, "")), reverse=descending)
+
+
+def to_row(failed_bf):
+    """Get the summary row of a failed BF, without the fault contexts"""
+    test = failed_bf["test"]
+    summary = failed_bf["summary"]
+
+    row = {
+        "issue": test["issue"],
+        "name": test.get("name"),
+        "summary": test.get("summary"),
+        "type": test.get("type"),
+        "suite": test.get("suite"),
+        "build_variant": test.get("build_variant"),
+        "categories": categories(failed_bf),
+    }
+
+    if isinstance(summary, dict):
+        row["fault_count"] = len(summary.get("faults", []))
+        row["context_count"] = len(summary.get("contexts", []))
+    else:
+        # An error message, such as a skipped large file
+        row["message"] = summary
+
+    return row
+
+
+def to_details(failed_bf):
+    """Get the links, faults and contexts of a failed BF"""
+    test = failed_bf["test"]
+    summary = failed_bf["summary"]
+
+    details = {}
+    for field in ("task_url", "log_file_url", "task_log_file_url", "system_log_url",
+                  "log_cache_file"):
+        details[field] = test.get(field)
+
+    if isinstance(summary, dict):
+        details["faults"] = summary.get("faults", [])
+        details["contexts"] = summary.get("contexts", [])
+    else:
+        details["faults"] = []
+        details["contexts"] = []
+        details["message"] = summary
+
+    return details
+
+
+class FailedBFStore(object):
+    """Loads the results of an analyzer.results_store.ResultsStore once, and again only when
+    bfg_analyzer has written to it since
+    """
+
+    def __init__(self, results_store):
+        self.results_store = results_store
+
+        self._lock = threading.Lock()
+        self._data_version = None
+        self._failed_bfs = None
+
+    def get(self):
+        """Get the current FailedBFs, reloading the results if they changed"""
+        with self._lock:
+            data_version = self.results_store.data_version()
+            if data_version != self._data_version:
+                run = self.results_store.run() or {"query": "", "date": ""}
+                run["bfs"] = self.results_store.results()
+
+                # data_version restarts with the connection, the load time does not repeat
+                # across restarts of the web server so it is safe to use in ETags
+                self._failed_bfs = FailedBFs(run, "%d" % (time.time() * 1000000))
+                self._data_version = data_version
+
+            return self._failed_bfs
+
+    def filter(self, failed_bfs, category=None, task_url=None, **filters):
+        """Get the failed BFs of a FailedBFs matching all the given filters, in query order
+
+        category and task_url are looked up with the indexed queries of the results store, the
+        other filters are passed to failed_bfs.filter.
+        """
+        matches = failed_bfs.filter(**filters)
+        if not category and not task_url:
+            return matches
+
+        keys = set((result["test"]["issue"], result["test"].get("name"))
+                   for result in self.results_store.results(
+                       task_url=task_url or None, category=category or None))
+        return [
+            failed_bf for failed_bf in matches
+            if (failed_bf["test"]["issue"], failed_bf["test"].get("name")) in keys
+        ]
+
+    def categories(self):
+        """Get the fault categories of the results, sorted"""
+        return sorted(c for c in self.results_store.categories() if c is not None)
@@ -1,12 +1,18 @@
 """
 Routes and views for the flask application.
 """
+import gzip
+import hashlib
 import json
 
 from datetime import datetime
+from flask import abort
+from flask import jsonify
 from flask import request
+from flask import Response
 from flask import render_template, g
 from www import app
+from www import failed_bfs_store
 import os
 import sys
 import threading
@@ -20,30 +26,129 @@ lib_path = os.path.dirname(
 print(lib_path)
 
 import analyzer.jira_client
+import analyzer.jira_write_queue
 import analyzer.analyzer_config
+import analyzer.search_cache
+import analyzer.results_store
+
+failed_bfs_cache = None
+failed_bfs_cache_lock = threading.Lock()
+
+# Rows returned by /api/failures when no limit is given, and at most
+DEFAULT_PAGE_LIMIT = 50
+MAX_PAGE_LIMIT = 500
+
+
+def get_failed_bfs_cache():
+    """Open bfg.db on first use, so importing the views does not create it"""
+    global failed_bfs_cache
+
+    with failed_bfs_cache_lock:
+        if failed_bfs_cache is None:
+            failed_bfs_cache = failed_bfs_store.FailedBFStore(
+                analyzer.results_store.ResultsStore(
+                    os.path.join(lib_path, analyzer.results_store.DEFAULT_FILE)))
+        return failed_bfs_cache
 
 
 @app.route('/')
 @app.route('/home')
 def home():
     """Renders the home page."""
+    cache = get_failed_bfs_cache()
+    store = cache.get()
 
-    with open(os.path.join(lib_path, "failed_bfs.json"), "rb") as sjh:
-        contents = sjh.read().decode('utf-8')
-        failed_bfs_root = json.loads(contents)
-
-    query = failed_bfs_root['query']
-    date = failed_bfs_root['date']
-    failed_bfs = failed_bfs_root['bfs']
+    query = store.query
+    date = store.date
+    failed_bfs = store.bfs
 
     return render_template(
         'index.html',
         title='Home Page',
         year=datetime.now().year,
-        failed_bfs=failed_bfs,
         query=query,
         date=date,
-        bf_count=len(failed_bfs))
+        bf_count=len(failed_bfs),
+        categories=cache.categories(),
+        suites=sorted(s for s in store.by_suite if s is not None),
+        variants=sorted(v for v in store.by_variant if v is not None),
+        types=sorted(t for t in store.by_type if t is not None))
+
+
+def json_response(store, build):
+    """Return the json of build() for the current request, gzip compressed if the client accepts
+    it, with an ETag of the version of the results and the request, so unchanged results are
+    answered with 304 without calling build
+    """
+    use_gzip = "gzip" in request.accept_encodings
+
+    m = hashlib.sha1()
+    m.update(store.version.encode())
+    m.update(request.full_path.encode())
+    etag = m.hexdigest() + ("-gzip" if use_gzip else "")
+
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        body = json.dumps(build()).encode()
+        if use_gzip:
+            body = gzip.compress(body)
+
+        response = Response(body, mimetype="application/json")
+        if use_gzip:
+            response.headers["Content-Encoding"] = "gzip"
+
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+
+@app.route('/api/failures')
+def api_failures():
+    """Returns a page of failed BF summary rows as json, in the format of bootstrap-table's
+    server side pagination
+    """
+    cache = get_failed_bfs_cache()
+    store = cache.get()
+
+    def build():
+        failed_bfs = cache.filter(
+            store,
+            category=request.args.get('category'),
+            task_url=request.args.get('task_url'),
+            suite=request.args.get('suite'),
+            variant=request.args.get('variant'),
+            type=request.args.get('type'),
+            search=request.args.get('search'))
+
+        sort_field = request.args.get('sort')
+        if sort_field in failed_bfs_store.SORT_FIELDS:
+            failed_bfs = failed_bfs_store.sort(failed_bfs, sort_field,
+                                               request.args.get('order') == 'desc')
+
+        offset = max(request.args.get('offset', 0, type=int), 0)
+        limit = request.args.get('limit', DEFAULT_PAGE_LIMIT, type=int)
+        limit = min(max(limit, 0), MAX_PAGE_LIMIT)
+
+        return {
+            "total": len(failed_bfs),
+            "rows": [failed_bfs_store.to_row(f) for f in failed_bfs[offset:offset + limit]]
+        }
+
+    return json_response(store, build)
+
+
+@app.route('/api/failure_details')
+def api_failure_details():
+    """Returns the links, faults and contexts of a failed BF as json"""
+    store = get_failed_bfs_cache().get()
+
+    failed_bf = store.find(request.args.get('issue'), request.args.get('test_name'))
+    if failed_bf is None:
+        abort(404)
+
+    return json_response(store, lambda: failed_bfs_store.to_details(failed_bf))
 
 
 statusKeys = {
@@ -80,6 +185,11 @@ def issue_sort(issue):
 jira_client_cached = None
 jira_client_lock = threading.Lock()
 
+search_cache = None
+
+jira_write_queue = None
+jira_write_queue_lock = threading.Lock()
+
 
 def get_jira_client():
     global jira_client_cached
@@ -93,40 +203,44 @@ def get_jira_client():
         return jira_client_cached
 
 
+def get_search_cache():
+    global search_cache
+
+    jc = get_jira_client()
+
+    with jira_client_lock:
+        if search_cache is None:
+            search_cache = analyzer.search_cache.SearchCache(jc)
+        return search_cache
+
+
 @app.route('/failure')
 def failure():
     """Renders the failure page."""
-    with open(os.path.join(lib_path, "failed_bfs.json"), "rb") as sjh:
-        contents = sjh.read().decode('utf-8')
-        failed_bfs_root = json.loads(contents)
-
-    query = failed_bfs_root['query']
-    date = failed_bfs_root['date']
-    failed_bfs = failed_bfs_root['bfs']
+    store = get_failed_bfs_cache().get()
 
     issue = request.args.get('issue')
     test_name = request.args.get('test_name')
 
-    failed_bf = None
-
-    for ft in failed_bfs:
-        if ft["test"]["issue"] == issue and test_name == ft["test"]["name"]:
-            failed_bf = ft
+    failed_bf = store.find(issue, test_name)
+    if failed_bf is None:
+        abort(404)
 
     # Predicates
     jc = get_jira_client()
+    sc = get_search_cache()
     jira_query = jc.query_duplicates_text([os.path.basename(test_name), failed_bf['test']['suite']])
-    issues = jc.search_issues(jira_query)
+    issues = sc.search_issues(jira_query, fields=analyzer.jira_client.LIST_FIELDS)
 
-    issues.sort(key=issue_sort)
+    issues = sorted(issues, key=issue_sort)
 
     is_system_failure = "System Failure" in failed_bf['test']['summary']
 
     # Query for the last few issues the user has looked at
     recent_issues_query = "issuekey in issueHistory() and project in (bf, server, evg, build) ORDER BY lastViewed DESC"
-    recent_issues = jc.search_issues(recent_issues_query)
+    recent_issues = sc.search_issues(recent_issues_query, fields=analyzer.jira_client.LIST_FIELDS)
 
-    recent_issues.sort(key=issue_sort)
+    recent_issues = sorted(recent_issues, key=issue_sort)
 
     return render_template(
         'failure.html',
@@ -140,36 +254,99 @@ def failure():
         is_system_failure=is_system_failure)
 
 
-@app.route('/close_duplicate')
-def close_duplicate():
-    """Renders the duplicate page."""
+def invalidate_searches(job):
+    """Drop the cached searches that include the issues a Jira job changed"""
+    if search_cache is None:
+        return
 
-    issue = request.args.get('issue')
-    duplicate_issue = request.args.get('duplicate_issue')
+    search_cache.invalidate_issue(job["issue"])
+    if job["duplicate_issue"] is not None:
+        search_cache.invalidate_issue(job["duplicate_issue"])
 
-    jc = get_jira_client()
 
-    jc.close_as_duplicate(issue, duplicate_issue)
+def get_jira_write_queue():
+    global jira_write_queue
+
+    with jira_write_queue_lock:
+        if jira_write_queue is None:
+            jira_write_queue = analyzer.jira_write_queue.JiraWriteQueue(
+                get_jira_client,
+                os.path.join(lib_path, analyzer.jira_write_queue.DEFAULT_FILE),
+                on_done=invalidate_searches)
+
+            # Resume the jobs left queued by the last run
+            jira_write_queue.start()
+        return jira_write_queue
+
+
+def request_issues():
+    """Get the issues of a request, from repeated or comma separated issue arguments"""
+    issues = []
+    for value in request.values.getlist('issue'):
+        issues.extend(i.strip() for i in value.split(",") if i.strip())
+
+    if not issues:
+        abort(400)
+
+    return issues
+
+
+@app.route('/close_duplicate', methods=['GET', 'POST'])
+def close_duplicate():
+    """Queues closing one or more issues as duplicates of an issue, and renders the duplicate
+    page to follow the progress."""
+
+    issues = request_issues()
+    duplicate_issue = request.values.get('duplicate_issue')
+    if not duplicate_issue:
+        abort(400)
+
+    jobs = get_jira_write_queue().close_as_duplicate(issues, duplicate_issue)
 
     return render_template(
         'duplicate.html',
-        title='Ticket Closed',
+        title='Closing Ticket' if len(issues) == 1 else 'Closing Tickets',
         year=datetime.now().year,
-        issue=issue,
-        duplicate_issue=duplicate_issue)
+        issues=issues,
+        duplicate_issue=duplicate_issue,
+        jobs=jobs)
 
 
-@app.route('/close_goneaway')
+@app.route('/close_goneaway', methods=['GET', 'POST'])
 def close_goneaway():
-    """Renders the gone away page."""
+    """Queues resolving one or more issues as gone away, and renders the gone away page to
+    follow the progress."""
 
-    issue = request.args.get('issue')
+    issues = request_issues()
 
-    jc = get_jira_client()
-    jc.close_as_goneaway(issue)
+    jobs = get_jira_write_queue().close_as_goneaway(issues)
 
     return render_template(
-        'gone_away.html', title='Ticket Resolved', year=datetime.now().year, issue=issue)
+        'gone_away.html',
+        title='Resolving Ticket' if len(issues) == 1 else 'Resolving Tickets',
+        year=datetime.now().year,
+        issues=issues,
+        jobs=jobs)
+
+
+@app.route('/api/jira_jobs')
+def api_jira_jobs():
+    """Returns the state of the queued Jira changes as json, only the jobs in the id arguments if
+    there are any"""
+    ids = request.args.getlist('id', type=int)
+
+    queue = get_jira_write_queue()
+
+    return jsonify({"counts": queue.to_dict(), "jobs": queue.jobs(ids or None)})
+
+
+@app.route('/stats')
+def stats():
+    """Returns the Jira search cache statistics as json."""
+    if search_cache is None:
+        return jsonify({})
+
+    return jsonify(search_cache.to_dict())
 
 
 @app.route('/about')